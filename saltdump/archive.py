@@ -0,0 +1,272 @@
+# coding: utf-8
+
+import time
+import sqlite3
+import logging
+import threading
+
+from .event import NA, Event, Publish, Return, StateReturn, Auth
+from .serial import dumps
+
+log = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id        INTEGER PRIMARY KEY,
+    time      REAL,
+    tag       TEXT,
+    sd_class  TEXT,
+    jid       TEXT,
+    minion_id TEXT,
+    raw       TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time   ON events (time);
+CREATE INDEX IF NOT EXISTS events_tag    ON events (tag);
+CREATE INDEX IF NOT EXISTS events_jid    ON events (jid);
+CREATE INDEX IF NOT EXISTS events_minion ON events (minion_id);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    jid      TEXT PRIMARY KEY,
+    event_id INTEGER,
+    time     REAL,
+    fun      TEXT,
+    arg      TEXT,
+    tgt      TEXT,
+    tgt_type TEXT,
+    user     TEXT,
+    minions  TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_time ON jobs (time);
+CREATE INDEX IF NOT EXISTS jobs_fun  ON jobs (fun);
+
+CREATE TABLE IF NOT EXISTS returns (
+    event_id      INTEGER PRIMARY KEY,
+    time          REAL,
+    jid           TEXT,
+    minion_id     TEXT,
+    fun           TEXT,
+    retcode       INTEGER,
+    success       INTEGER,
+    rc_ok         INTEGER,
+    changes_count INTEGER,
+    results_ok    INTEGER,
+    results_total INTEGER
+);
+CREATE INDEX IF NOT EXISTS returns_jid    ON returns (jid);
+CREATE INDEX IF NOT EXISTS returns_minion ON returns (minion_id, time);
+CREATE INDEX IF NOT EXISTS returns_fun    ON returns (fun, time);
+CREATE INDEX IF NOT EXISTS returns_time   ON returns (time);
+CREATE INDEX IF NOT EXISTS returns_rc     ON returns (rc_ok, fun);
+
+CREATE TABLE IF NOT EXISTS auth (
+    event_id  INTEGER PRIMARY KEY,
+    time      REAL,
+    minion_id TEXT,
+    act       TEXT,
+    result    INTEGER
+);
+CREATE INDEX IF NOT EXISTS auth_minion ON auth (minion_id, time);
+CREATE INDEX IF NOT EXISTS auth_time   ON auth (time);
+'''
+
+def _na(x):
+    if x is NA or x == NA:
+        return None
+    return x
+
+def _int(x):
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return None
+
+def archive_record(cev):
+    ''' the rows (one per table) that archive a classified event
+
+        The result is plain tuples, so it can be worked out in a worker
+        process (see RenderPool) and handed back to the SQLiteSink.  Things
+        that aren't bus events (-j's Job snapshots, --stats reports) have no
+        rows: None.
+    '''
+    if not isinstance(cev, Event):
+        return None
+    jid = _na(getattr(cev, 'jid', None))
+    mid = _na(getattr(cev, 'id', None))
+    rec = dict(event=(cev.itime, cev.tag, cev.__class__.__name__, jid, mid, cev.json(indent=0)))
+
+    if isinstance(cev, Publish):
+        rec['job'] = (jid, cev.itime, _na(cev.fun), dumps(cev.args), dumps(_na(cev.tgt)),
+            _na(cev.tgt_type), _na(cev.user), dumps(cev.minions))
+    elif isinstance(cev, Return):
+        changes_count = results_ok = results_total = None
+        if isinstance(cev, StateReturn):
+            changes_count = cev.changes_count
+            results_ok, results_total = cev.result_counts
+        success = _na(cev.success)
+        rec['return'] = (cev.itime, jid, mid, _na(cev.fun), _int(cev.retcode),
+            None if success is None else bool(success), cev.rc_ok, changes_count, results_ok, results_total)
+    elif isinstance(cev, Auth):
+        rec['auth'] = (cev.itime, mid, _na(cev.act), bool(cev.result))
+
+    return rec
+
+# errors that are down to the record being inserted (rather than the
+# database being busy, locked, full, ...)
+RECORD_ERRORS = (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError, sqlite3.DataError)
+
+class SQLiteSink(object):
+    ''' archive classified events in a sqlite database
+
+        Takes archive_record()s through write() and inserts them in one
+        transaction per flush -- once batch_rows are waiting, when
+        maybe_flush() finds the oldest waiting row older than flush_ms, or
+        when a background thread notices the same on a quiet bus.  The
+        database is in WAL mode so queries (e.g., saltdump query) can run
+        while it's being written, and event ids are handed out inside each
+        (immediate) transaction, so several writers can share a database.
+
+        A writer waits up to timeout seconds for another to finish.  When
+        the database stays busy (or locked, full, ...) the batch goes back
+        to the front of pending and isn't tried again for retry_secs.  When
+        it's the records themselves that can't be inserted (RECORD_ERRORS,
+        e.g., a constraint), they're tried one at a time; the ones that
+        still fail are logged, counted in rejected and dropped rather than
+        retried forever.
+    '''
+
+    def __init__(self, fname, batch_rows=1000, flush_ms=1000, timeout=10, retry_secs=1):
+        self.fname      = fname
+        self.batch_rows = batch_rows
+        self.flush_ms   = flush_ms
+        self.retry_secs = retry_secs
+        self.pending    = list()
+        self.rejected   = 0
+        self.first      = None
+        self.hold       = 0 # no flushing before this (after the database failed us)
+        self.lock       = threading.Lock()
+        self.done       = threading.Event()
+        self.thread     = None
+
+        # isolation_level=None: the transactions are ours (see _insert)
+        self.db = sqlite3.connect(fname, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+        if flush_ms:
+            self.thread = threading.Thread(target=self._flush_loop, name='SQLiteSink')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def write(self, rec):
+        if rec is None:
+            return # not an event (see archive_record)
+        with self.lock:
+            self.pending.append(rec)
+            if self.first is None:
+                self.first = time.time()
+
+    def maybe_flush(self):
+        first = self.first
+        if time.time() < self.hold:
+            return
+        if len(self.pending) >= self.batch_rows or (self.flush_ms and first is not None
+            and (time.time() - first) * 1000 >= self.flush_ms):
+            self.flush()
+
+    def _insert(self, recs):
+        db = self.db
+        db.execute('BEGIN IMMEDIATE') # nobody else can take ids until we're done
+        try:
+            eid = (db.execute('SELECT MAX(id) FROM events').fetchone()[0] or 0) + 1
+            rows = dict(events=list(), jobs=list(), returns=list(), auth=list())
+            for rec in recs:
+                rows['events'].append( (eid,) + rec['event'] )
+                if 'job' in rec:
+                    rows['jobs'].append( rec['job'][:1] + (eid,) + rec['job'][1:] )
+                if 'return' in rec:
+                    rows['returns'].append( (eid,) + rec['return'] )
+                if 'auth' in rec:
+                    rows['auth'].append( (eid,) + rec['auth'] )
+                eid += 1
+            db.executemany('INSERT INTO events VALUES (?,?,?,?,?,?,?)', rows['events'])
+            db.executemany('INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?,?,?,?,?)', rows['jobs'])
+            db.executemany('INSERT INTO returns VALUES (?,?,?,?,?,?,?,?,?,?,?)', rows['returns'])
+            db.executemany('INSERT INTO auth VALUES (?,?,?,?,?)', rows['auth'])
+        except:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _retry(self, recs, first, e):
+        # not the records' fault: keep them (ahead of anything newer) for later
+        self.pending[:0] = recs
+        self.first = first
+        self.hold = time.time() + self.retry_secs
+        log.warning('archiving %d events in %s failed (%s); trying again in %ds', len(recs), self.fname, e,
+            self.retry_secs)
+
+    def _flush(self):
+        if not self.pending:
+            return
+        first = self.first
+        pending, self.pending, self.first = self.pending, list(), None
+        try:
+            self._insert(pending)
+            log.debug('archived %d events in %s', len(pending), self.fname)
+            return
+        except RECORD_ERRORS as e:
+            log.warning('archiving %d events in %s failed (%s), trying them one at a time',
+                len(pending), self.fname, e)
+        except sqlite3.Error as e:
+            self._retry(pending, first, e)
+            return
+        failed = list()
+        for i,rec in enumerate(pending):
+            try:
+                self._insert([rec])
+            except RECORD_ERRORS as e:
+                failed.append( (rec, e) )
+            except sqlite3.Error as e:
+                self._retry(pending[i:], first, e)
+                break
+        self.rejected += len(failed)
+        if failed and len(failed) == len(pending):
+            log.error('unable to archive any of %d events in %s (%s); dropping them', len(failed), self.fname,
+                failed[0][1])
+            return
+        for rec, e in failed:
+            log.error('unable to archive %s (%s) in %s (%s); dropping it', rec['event'][1], rec['event'][2],
+                self.fname, e)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush_loop(self):
+        interval = self.flush_ms / 1000.0
+        while not self.done.is_set():
+            first = self.first
+            age = time.time() - first if first is not None else 0
+            if first is None or age < interval:
+                self.done.wait(interval - age)
+                continue
+            if time.time() < self.hold:
+                self.done.wait(self.hold - time.time())
+                continue
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log.error('SQLiteSink stopped flushing: %s', e)
+                return
+
+    def close(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        if self.pending:
+            log.error('giving up on archiving %d events in %s', len(self.pending), self.fname)
+        self.db.execute('PRAGMA optimize') # keep the planner's statistics up to date for queries
+        self.db.close()
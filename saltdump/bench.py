@@ -0,0 +1,221 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import gc
+import sys
+import json
+import time
+import click
+import logging
+import platform
+import warnings
+
+import salt.version
+
+from .filter import build_filter
+from .event import classify_many
+from .misc import DateParser
+from .synth import corpus, CORPORA
+
+log = logging.getLogger(__name__)
+
+FILTERS = (
+    'salt/job/*',
+    'salt/* and not salt/auth',
+    '(salt/job/*/ret/* or salt/job/*/new) and not salt/job/*/ret/web*',
+    'salt/job/[0-9]*/ret/minion0001?.dom[12] or minion/refresh/* or salt/auth',
+)
+
+def _classify(evs, cevs):
+    return list(classify_many(evs))
+
+def _dateparser(evs, cevs):
+    return [ DateParser(ev['data']['_stamp']) for ev in evs ]
+
+def _filter(evs, cevs):
+    f = build_filter(FILTERS[2])
+    return [ f(ev['tag']) for ev in evs ]
+
+def _txt(evs, cevs):
+    return [ cev.short for cev in cevs ]
+
+def _stru(evs, cevs):
+    return [ cev.jsonstru for cev in cevs ]
+
+def _jsonl(evs, cevs):
+    return [ cev.json(indent=0) for cev in cevs ]
+
+def _salt(evs, cevs):
+    return [ cev.outputter(default_outputter='nested') for cev in cevs ]
+
+# per event stages, run over each corpus
+STAGES = (
+    ('classify',   _classify),
+    ('dateparser', _dateparser),
+    ('filter',     _filter),
+    ('txt',        _txt),
+    ('stru',       _stru),
+    ('jsonl',      _jsonl),
+    ('salt',       _salt),
+)
+
+def _build_filters(n):
+    for i in range(n):
+        for expr in FILTERS:
+            build_filter(expr)
+    return n * len(FILTERS)
+
+def measure(func, *args):
+    ''' (seconds, gc objects left over) for one call of func(*args)
+
+        The gc is off while func runs, so the second number is how many
+        more gc-tracked objects (dicts, lists, events, ...) there are than
+        before: what func allocated and kept (including its result).
+    '''
+    gc.collect()
+    gc.disable()
+    try:
+        objs = gc.get_count()[0]
+        t = time.time()
+        res = func(*args)
+        secs = time.time() - t
+        objs = gc.get_count()[0] - objs
+    finally:
+        gc.enable()
+    del res
+    return secs, objs
+
+def run_benchmarks(corpora=None, stages=None, scale=1.0, repeat=3, seed=0, progress=None):
+    ''' time each stage over each corpus (best of repeat)
+
+        Returns {'CORPUS/STAGE': {events, secs, rate, objects_per_event}};
+        build_filter (compiling the FILTERS) is reported as -/build_filter.
+    '''
+    corpora = corpora or sorted(CORPORA)
+    stages = stages or [ name for name,func in STAGES ] + ['build_filter']
+    results = dict()
+
+    def record(key, n, times):
+        secs = min( t for t,o in times )
+        results[key] = dict(events=n, secs=round(secs, 6), rate=round(n / secs, 1) if secs else None,
+            objects_per_event=round(min( o for t,o in times ) / float(n), 2))
+        if progress:
+            progress(key, results[key])
+
+    if 'build_filter' in stages:
+        n = max(1, int(250 * scale))
+        record('-/build_filter', n * len(FILTERS), [ measure(_build_filters, n) for i in range(repeat) ])
+
+    for cname in corpora:
+        evs = corpus(cname, scale=scale, seed=seed)
+        for sname,func in STAGES:
+            if sname not in stages:
+                continue
+            times = list()
+            for i in range(repeat):
+                cevs = list(classify_many(evs)) # fresh ones, so nothing is cached from the last go
+                times.append( measure(func, evs, cevs) )
+            record('{0}/{1}'.format(cname, sname), len(evs), times)
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    ''' (key, rate, baseline rate, ratio, regressed) for each result that's also in baseline '''
+    ret = list()
+    for key in sorted(results):
+        b = baseline.get(key)
+        if not b or not b.get('rate') or not results[key]['rate']:
+            continue
+        ratio = results[key]['rate'] / b['rate']
+        ret.append( (key, results[key]['rate'], b['rate'], ratio, ratio < 1 - tolerance) )
+    return ret
+
+def environment():
+    return dict(python=platform.python_version(), salt=salt.version.__version__,
+        machine=platform.machine(), node=platform.node(), time=time.time())
+
+
+@click.command()
+@click.option('-c', '--corpus', 'corpora', type=click.Choice(sorted(CORPORA)), multiple=True,
+    help='only this corpus (repeatable; default: all of them)')
+@click.option('-s', '--stage', 'stages', type=click.Choice([ x for x,f in STAGES ] + ['build_filter']),
+    multiple=True, help='only this stage (repeatable; default: all of them)')
+@click.option('--scale', type=float, default=1.0,
+    help='scale the corpora (and build_filter) by this much (default: 1.0)')
+@click.option('-r', '--repeat', type=int, default=3,
+    help='run each stage this many times and keep the best (default: 3)')
+@click.option('--seed', type=int, default=0, help='random seed for the corpora (default: 0)')
+@click.option('--save', type=click.Path(dir_okay=False), metavar='FILE',
+    help='save the results (as json) to FILE, e.g., to use as a --baseline later')
+@click.option('-b', '--baseline', type=click.Path(exists=True, dir_okay=False), metavar='FILE',
+    help='compare against results saved earlier with --save and exit non-zero on a regression')
+@click.option('-t', '--tolerance', type=float, default=0.2,
+    help='with --baseline, how much slower (as a fraction) counts as a regression (default: 0.2)')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+def bench(corpora, stages, scale, repeat, seed, save, baseline, tolerance, level):
+    ''' time saltdump's classification, filtering and formatting on
+        synthetic corpora and report events/s for each stage.
+
+        \b
+        corpora (at --scale 1):
+          auth_storm: 5,000 minions re-authenticating at once (salt/auth)
+          ping:       a test.ping published to 5,000 minions and their returns
+          highstate:  a state.highstate on 10 minions, 10,000 states each
+
+        \b
+        stages:
+          classify:     classify_event() (from the dicts get_event() returns)
+          dateparser:   DateParser() of each _stamp
+          filter:       a compiled build_filter() expression on each tag
+          txt, stru, jsonl, salt: formatting a classified event (salt is
+                        the Salt outputters, e.g., Return.outputter)
+          build_filter: compiling filter expressions (not per event)
+
+        Each stage is run --repeat times and the fastest is reported, with
+        the number of gc-tracked objects it allocated (and kept) per event.
+        --save and --baseline keep and compare results between versions;
+        only compare results from the same machine and --scale.
+
+        \b
+        examples:
+          saltdump bench --save bench-before.json
+          saltdump bench -b bench-before.json -c highstate
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    base = None
+    if baseline:
+        with open(baseline) as fh:
+            base = json.load(fh)
+        if base.get('scale') != scale:
+            log.warning('%s was made with --scale %s, not %s', baseline, base.get('scale'), scale)
+
+    def progress(key, r):
+        print('{0:<24} {1:>8} events {2:>12} ev/s {3:>10} objs/ev'.format(
+            key, r['events'], r['rate'], r['objects_per_event']))
+        sys.stdout.flush()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = run_benchmarks(corpora, stages, scale=scale, repeat=repeat, seed=seed, progress=progress)
+
+    if save:
+        with open(save, 'w') as fh:
+            json.dump(dict(scale=scale, repeat=repeat, seed=seed, env=environment(), results=results),
+                fh, indent=2, sort_keys=True)
+
+    if base is not None:
+        print()
+        regressed = list()
+        for key, rate, brate, ratio, bad in compare(results, base['results'], tolerance):
+            print('{0:<24} {1:>12} ev/s vs {2:>12} {3:>7.1%}{4}'.format(key, rate, brate, ratio - 1,
+                '  REGRESSED' if bad else ''))
+            if bad:
+                regressed.append(key)
+        if regressed:
+            raise click.ClickException('{0} stage(s) more than {1:.0%} slower than {2}'.format(
+                len(regressed), tolerance, baseline))
@@ -3,15 +3,39 @@
 from __future__ import print_function
 
 import os
+import re
 import sys
 import click
 import logging
+import signal
+import tempfile
 import warnings
+import threading
 
-from .filter import build_filter
+from .filter import build_filter, AlwaysTrue
 from .version import version as saltdump_version
 from .master_minion import MasterMinion, SocketReadPermissionError, JobCachePermissionError
-from .event import classify_event, JidCollector
+from .event import classify_event, classify_many, event_classes, JidCollector
+from .output import Output, OutputWriter, parse_output_spec, output_index, render_outputs, OUTPUT_FORMATS
+from .pool import RenderPool
+from .sink import Sink
+from .hec import HECSink
+from .spool import Spool
+from .netsink import SocketSink
+from .filesink import RotatingFileWriter, COMPRESSORS
+from .archive import SQLiteSink
+from .serial import dumps, set_serializer, SERIALIZER_NAMES
+from .query import query
+from .serve import serve
+from .fanin import FanIn, open_source, parse_master_spec, FanInError
+from .remote import Aggregator, RemoteError, agent
+from .bench import bench
+from .synth import synth
+from .soak import soak
+from .stats import Stats
+from .throttle import Throttle, parse_throttle_spec
+from .metrics import Metrics, MetricsExporter, clock
+from .profiling import Profiler, Sampler
 from .misc import Attr
 
 log = logging.getLogger(__name__)
@@ -19,59 +43,296 @@ log = logging.getLogger(__name__)
 oargs = list(sys.argv)
 
 class CmdRunner(Attr):
-    flush_me = False
     printed = 0
     jc = None
+    pool = None
+    statistics = None
+    throttler = None
+    metrics = None
+    exporter = None
+    aggregator = None
+    profiler = None
+    sampler = None
 
     def __init__(self, **opt):
         super(CmdRunner, self).__init__(**opt)
         self.filter = build_filter(*self.filter)
-        self.mm = MasterMinion(replay_only=self.replay_only,
-            replay_job_cache=self.replay_job_cache)
-
-        if opt['show_job_info']:
-            self.jc = JidCollector()
-            self.jc.on_change(self.print_job_info)
-
-    def _print_event(self, cev):
-        if self.output_format == 'json':
-            out = cev.json()
-        elif self.output_format == 'jsonl':
-            out = cev.json(indent=0)
-        elif self.output_format == 'salt':
-            out = cev.outputter(default_outputter=self.salt_outputter)
-        elif self.output_format == 'stru':
-            out = cev.jsonstru
-        elif self.output_format == 'txt':
-            out = cev.short
+        self.mm = self.open_source()
+
+        self.writers = dict() # dest (FORMAT:DEST for sockets) -> writer, see open_output()
+        self.outputs = [ self.open_output(spec) for spec in self.output_format ]
+        self.index   = output_index(self.outputs)
+
+        if self.show_job_info or self.latency:
+            self.jc = JidCollector(latency=bool(self.latency))
+            if self.show_job_info:
+                self.jc.on_change(self.print_job_info)
+
+        # the stats thread writes to the outputs too
+        self.lock = threading.RLock()
+        self.done = threading.Event()
+        if self.stats:
+            self.statistics = Stats(interval=self.stats, window=self.stats_window, top=self.stats_top)
+            self.start_reporting('Stats', self.stats, self.print_stats)
+        if self.throttle:
+            self.throttler = Throttle(self.throttle)
+            self.start_reporting('Throttle', self.throttle_interval, self.print_throttled)
+
+        if self.workers:
+            self.batch = True
+            self.pool = RenderPool(workers=self.workers, outputs=self.outputs,
+                keep_events=bool(self.jc or self.statistics))
+
+        if self.metrics_file or self.metrics_listen:
+            self.metrics = Metrics()
+            self.instrument()
+            self.exporter = MetricsExporter(self.metrics, textfile=self.metrics_file,
+                listen=self.metrics_listen, interval=self.metrics_interval)
+
+        if self.profile:
+            self.profiler = Profiler(self.profile, interval=self.profile_interval)
+            self.mm.next = self.profiler.wrap(self.mm.next) # dumps happen in the profiled thread
+
+        # after the pool has forked, the workers keep the default handlers
+        if self.latency:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump_latency())
+        if self.profile or self.sample_dir:
+            self.sampler = Sampler(outdir=self.sample_dir or tempfile.gettempdir(), secs=self.sample_secs)
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.sampler.toggle())
+
+    def open_source(self):
+        ''' where the events come from: anything with a MasterMinion style next() and listen loops '''
+        if self.master or self.aggregate:
+            sources = [ (name, open_source(source)) for name,source in map(parse_master_spec, self.master) ]
+            if self.aggregate:
+                self.aggregator = Aggregator(self.aggregate)
+                sources.append( ('aggregator', self.aggregator) )
+            return FanIn(sources, reorder_ms=self.reorder_ms)
+        return MasterMinion(replay_only=self.replay_only,
+            replay_job_cache=self.replay_job_cache, sock_dir=self.sock_dir)
+
+    def instrument(self):
+        ''' swap in timed versions of each stage (see Metrics) '''
+        m = self.metrics
+        self.mm.next = m.timed('get_event', self.mm.next)
+        self.render_events = self.render_events_timed
+        if self.throttler:
+            self.throttler.admit = m.timed('throttle', self.throttler.admit)
+        if self.pool:
+            self.pool.render = m.timed('render_pool', self.pool.render)
+        if self.jc:
+            self.jc.examine_event = m.timed('job_info', self.jc.examine_event)
+        for dest,w in self.writers.items():
+            w.write = m.timed('write', w.write)
+            w.maybe_flush = m.timed('flush', w.maybe_flush)
+            if hasattr(w, 'pos'):
+                m.gauge('saltdump_output_buffer_bytes', lambda w=w: w.pos, dest=dest or '-')
+            # batches waiting for the network (RotatingFileWriter has a
+            # queue too, of segments to compress, which is something else)
+            if isinstance(w, Sink) and w.spool is not None:
+                m.gauge('saltdump_queue_depth', lambda w=w: w.spool.records, queue='spool', dest=dest)
+            elif isinstance(w, Sink):
+                m.gauge('saltdump_queue_depth', w.queue.qsize, queue='sink', dest=dest)
+        if isinstance(self.mm, FanIn):
+            m.gauge('saltdump_queue_depth', lambda: len(self.mm.heap), queue='reorder')
+        if self.aggregator:
+            m.gauge('saltdump_queue_depth', self.aggregator.queue.qsize, queue='aggregator')
+
+    def open_output(self, spec):
+        fmt, dest, tfilter = parse_output_spec(spec)
+
+        if tfilter:
+            tfilter = build_filter(tfilter)
+        elif fmt == 'salt' and isinstance(self.filter, AlwaysTrue):
+            tfilter = build_filter('salt/job/*/ret*')
         else:
-            out = u"fmt={0}? {1}".format(self.output_format, cev.jsonl)
-        sys.stdout.write( unicode(out) + '\n' )
-        self.flush_me = True
+            tfilter = self.filter
+
+        format_opts = dict()
+        if fmt == 'hec':
+            format_opts.update(sourcetype=self.hec_sourcetype, index=self.hec_index)
+            dest = dest or self.hec_url
+        elif fmt == 'syslog':
+            format_opts.update(facility=self.syslog_facility)
+        dest = dest or self.send_to
+
+        # outputs to the same file share a writer; a socket frames its
+        # records for one format, so each format gets its own
+        key = dest
+        if dest and dest.startswith(('tcp://', 'udp://')):
+            key = '{0}:{1}'.format(fmt, dest)
+        if key not in self.writers:
+            self.writers[key] = self.open_writer(fmt, dest, key)
+        return Output(self.writers[key], fmt, tfilter, self.salt_outputter, format_opts)
+
+    def open_writer(self, fmt, dest, key=None):
+        if fmt == 'sqlite':
+            return SQLiteSink(dest, batch_rows=self.archive_batch)
+        if fmt == 'hec':
+            return HECSink(dest, self.hec_token, verify=not self.hec_insecure,
+                spool=self.open_spool(dest))
+        if dest and dest.startswith(('tcp://', 'udp://')):
+            return SocketSink(dest, octet_counting=self.octet_counting,
+                one_per_datagram=fmt == 'syslog', spool=self.open_spool(key or dest))
+        kw = dict()
+        if self.no_line_buffer:
+            kw.update(flush_bytes=self.flush_bytes, flush_ms=self.flush_ms)
+        if dest and (self.rotate_mb or self.rotate_secs):
+            return RotatingFileWriter(dest, max_bytes=(self.rotate_mb or 0) * 1024 * 1024,
+                max_secs=self.rotate_secs, compress=self.rotate_compress, keep=self.rotate_keep, **kw)
+        return OutputWriter(open(dest, 'ab') if dest else None, **kw)
+
+    def open_spool(self, dest):
+        if self.spool_dir:
+            # one spool per writer (FORMAT:DEST for sockets, see open_output)
+            return Spool(os.path.join(self.spool_dir, re.sub(r'[^\w.-]+', '_', dest)),
+                max_bytes=self.spool_max_mb * 1024 * 1024)
+
+    def _flush(self):
+        for w in self.writers.values():
+            w.maybe_flush()
 
     def print_job_info(self, jitem, actions):
         log.debug("print_job_info(%s, %s)", jitem, actions)
-        self._print_event(jitem)
+        for o in self.outputs:
+            o.write( o.format(jitem) )
+
+    def print_report(self, report):
+        with self.lock:
+            for o in self.outputs:
+                o.write( o.format(report) )
+            self._flush()
+
+    def print_stats(self):
+        self.print_report( self.statistics.report() )
+
+    def print_throttled(self):
+        report = self.throttler.report()
+        if report is not None:
+            self.print_report(report)
+
+    def dump_latency(self):
+        ''' write the JidCollector's latency histograms to --latency FILE '''
+        tmp = '{0}.tmp'.format(self.latency)
+        text = dumps(self.jc.latency.report(), indent=2)
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        try:
+            with open(tmp, 'wb') as fh:
+                fh.write(text)
+            os.rename(tmp, self.latency)
+        except (IOError, OSError) as e:
+            log.error('unable to write latency histograms to %s: %s', self.latency, e)
+
+    def start_reporting(self, name, secs, report):
+        ''' call report() every secs seconds (in a thread) until we're done '''
+        def _loop():
+            while not self.done.wait(secs):
+                try:
+                    report()
+                except (IOError, OSError) as e:
+                    log.debug('stopped reporting %s: %s', name, e)
+                    return
+        t = threading.Thread(target=_loop, name=name)
+        t.daemon = True
+        t.start()
+
+    def render_events(self, evs):
+        for cev in classify_many(evs):
+            yield cev, render_outputs(self.outputs, self.index, cev)
+
+    def render_events_timed(self, evs):
+        # render_events(), one stage at a time
+        add = self.metrics.add
+        classes = event_classes()
+        for ev in evs:
+            t0 = clock()
+            cev = classify_event(ev, classes)
+            t1 = clock()
+            wanted = self.index.match(cev.tag)
+            add('classify', t1 - t0)
+            add('filter', clock() - t1)
+            outs = list()
+            for i,o in enumerate(self.outputs):
+                if i in wanted:
+                    t = clock()
+                    outs.append( o.format(cev) )
+                    add('format_' + o.output_format, clock() - t)
+                else:
+                    outs.append(None)
+            yield cev, outs
+
+    def write_events(self, results):
+        # results are (cev, outs) in arrival order -- see RenderPool.render()
+        with self.lock:
+            for cev,outs in results:
+                printed = False
+                for o,out in zip(self.outputs, outs):
+                    if out is not None:
+                        o.write(out)
+                        printed = True
+                if printed:
+                    self.printed += 1
+                if self.statistics:
+                    self.statistics.observe(cev, outs)
+                if self.jc:
+                    self.jc.examine_event(cev)
+                if self.count is not None and self.printed >= self.count:
+                    self._flush()
+                    return False # meaning we're done
+            self._flush()
+            return True # meaning continue reading events
 
     def print_event(self, ev):
-        cev = classify_event(ev)
-        if self.filter(cev.tag):
-            self._print_event(cev)
-            self.printed += 1 # do not increment in _print_event, that also prints non-events sometimes
-        if self.jc:
-            self.jc.examine_event(cev)
-        if self.flush_me:
-            if not self.no_line_buffer:
-                sys.stdout.flush()
-                self.flush_me = False
-        if self.count is not None and self.printed >= self.count:
-            return False # meaning we're done
-        return True # meaning continue reading events
+        if self.throttler and not self.throttler.admit(ev):
+            return True
+        return self.write_events( self.render_events([ev]) )
+
+    def print_events(self, evs):
+        if self.throttler:
+            evs = [ ev for ev in evs if self.throttler.admit(ev) ]
+            if not evs:
+                return True
+        return self.write_events( self.pool.render(evs) if self.pool else self.render_events(evs) )
 
     def listen_loop(self):
         with warnings.catch_warnings():
             warnings.simplefilter('ignore')
-            self.mm.listen_loop(self.print_event)
+            try:
+                if self.profiler:
+                    self.profiler.enable()
+                if self.batch:
+                    self.mm.listen_batch_loop(self.print_events,
+                        max_events=self.batch_size, max_wait=self.batch_wait)
+                else:
+                    self.mm.listen_loop(self.print_event)
+            finally:
+                if self.profiler:
+                    self.profiler.close()
+                if self.sampler:
+                    self.sampler.close()
+                if isinstance(self.mm, FanIn):
+                    self.mm.close()
+                self.done.set()
+                try:
+                    # the last, partial interval
+                    if self.statistics:
+                        self.print_stats()
+                    if self.throttler:
+                        self.print_throttled()
+                except IOError:
+                    pass
+                if self.latency:
+                    self.dump_latency()
+                if self.pool:
+                    self.pool.close()
+                if self.exporter:
+                    self.exporter.close()
+                for w in self.writers.values():
+                    try:
+                        w.close()
+                    except IOError:
+                        pass
 
 
 @click.command()
@@ -82,25 +343,115 @@ class CmdRunner(Attr):
 @click.option('-R', '--replay-only', is_flag=True, default=False,
     help='once the salt job cache is replayed, exit without listening to the salt sockets')
 @click.option('-B', '--no-line-buffer', is_flag=True, default=False,
-    help='by default saltdump flushes output after emitting an event')
+    help='by default saltdump flushes output after emitting an event (or batch);'
+    ' with -B output is buffered and flushed by --flush-ms and --flush-bytes')
+@click.option('--flush-ms', type=int, default=250,
+    help='with -B, never hold output for longer than this many milliseconds (default: 250)')
+@click.option('--flush-bytes', type=int, default=65536,
+    help='with -B, flush output once this many bytes are buffered (default: 65536)')
 @click.option('-S', '--no-sudo-root', is_flag=True, default=False,
     help='by default, if saltdump cannot read the salt sockets or configs, it'
     ' will try to switch to root with sudo')
 @click.option('-V', '--version', is_flag=True, default=False, help='print version and exit')
 @click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
 @click.option('-c', '--count', type=int, help='after emitting this many events, exit normally')
-@click.option('-o', '--output-format', default='txt',
-    type=click.Choice(['json', 'txt', 'jsonl', 'salt', 'stru']))
+@click.option('-o', '--output-format', default=['txt'], multiple=True, metavar='FORMAT[:DEST[:FILTER]]',
+    help='output format ({0}); DEST is a file, a tcp://, udp:// or (for hec) https:// url, or empty for stdout'
+    ' (or --send-to), and FILTER replaces the FILTER arguments for this output; repeat to produce several'
+    ' outputs from one read of the bus (default: txt)'.format(', '.join(OUTPUT_FORMATS)))
 @click.option('-O', '--salt-outputter', type=str, default='nested',
     help='selected outputter will follow event type where possible and fallback to this (default: nested)')
+@click.option('-b', '--batch', is_flag=True, default=False,
+    help='drain all immediately available events and process them as a batch')
+@click.option('--batch-size', type=int, default=100,
+    help='with --batch or --workers, process at most this many events at once (default: 100)')
+@click.option('--batch-wait', type=float, default=0.1,
+    help='with --batch or --workers, stop draining a batch after this many seconds (default: 0.1)')
+@click.option('-w', '--workers', type=int, default=0,
+    help='classify and format events in this many worker processes (implies --batch, default: 0)')
+@click.option('--hec-url', type=str,
+    help='with -o hec, the Splunk http event collector url (e.g., https://splunk:8088/services/collector/event)')
+@click.option('--hec-token', type=str, envvar='SALTDUMP_HEC_TOKEN',
+    help='with -o hec, the http event collector token (or set SALTDUMP_HEC_TOKEN)')
+@click.option('--hec-sourcetype', type=str, default='salt:event',
+    help='with -o hec, the sourcetype for the posted events (default: salt:event)')
+@click.option('--hec-index', type=str,
+    help='with -o hec, the index for the posted events (default: whatever the token says)')
+@click.option('--hec-insecure', is_flag=True, default=False,
+    help='with -o hec, do not verify the collector\'s certificate')
+@click.option('--send-to', type=str,
+    help='send output to tcp://host:port or udp://host:port instead of stdout')
+@click.option('--octet-counting', is_flag=True, default=False,
+    help='with tcp:// outputs, frame each event as "LEN MSG" (RFC6587) instead of ending it with a newline')
+@click.option('--syslog-facility', type=click.IntRange(0, 23), default=16,
+    help='with -o syslog, the syslog facility number (default: 16, local0)')
+@click.option('--spool-dir', type=click.Path(file_okay=False),
+    help='with -o hec or --send-to, spool batches to this directory so an outage never stalls the listener')
+@click.option('--spool-max-mb', type=int, default=512,
+    help='with --spool-dir, throw away the oldest spooled events past this many MiB (default: 512)')
+@click.option('--rotate-mb', type=int,
+    help='rotate file outputs before they grow past this many MiB')
+@click.option('--rotate-secs', type=int,
+    help='rotate file outputs after this many seconds')
+@click.option('--rotate-compress', type=click.Choice(COMPRESSORS),
+    help='compress rotated file outputs (in the background)')
+@click.option('--rotate-keep', type=int,
+    help='keep only this many rotated segments of each file output')
+@click.option('--archive-batch', type=int, default=1000,
+    help='with -o sqlite, insert at most this many events per transaction (default: 1000)')
+@click.option('-M', '--master', multiple=True, metavar='NAME=SOURCE',
+    help='listen to this master (SOURCE is its sock_dir, or unix:PATH for a saltdump serve socket)'
+    ' instead of the local one, marking its events with NAME; repeat to merge several masters into one stream')
+@click.option('--sock-dir', type=click.Path(file_okay=False),
+    help='listen to the master bus in this directory instead of the one in the master config'
+    ' (e.g., a saltdump synth -o ipc:SOCK_DIR stand-in)')
+@click.option('--aggregate', type=str, metavar='tcp://HOST:PORT',
+    help='receive events from saltdump agents on this address (see saltdump agent --help); agents are not'
+    ' authenticated, so HOST defaults to 127.0.0.1')
+@click.option('--reorder-ms', type=int, default=250,
+    help='with several --master (or --aggregate), hold events this long to put them in timestamp order'
+    ' (default: 250)')
+@click.option('--stats', type=int, metavar='SECS',
+    help='every SECS seconds, emit a saltdump/stats summary of the event rate, bytes, classes,'
+    ' top tags and top minions')
+@click.option('--stats-window', type=int, default=300,
+    help='with --stats, the rolling window for the overall rate and the top tags and minions (default: 300)')
+@click.option('--stats-top', type=int, default=5,
+    help='with --stats, how many of the top tags and minions to report (default: 5)')
+@click.option('--throttle', multiple=True, metavar='PATTERN=RULE[,RULE]',
+    help='rate limit (RATE/s|m|h[:BURST]) and/or sample (PCT% or PCT%@minion) the events with tags'
+    ' matching PATTERN; repeatable, the first matching PATTERN applies')
+@click.option('--throttle-interval', type=int, default=10,
+    help='with --throttle, emit a saltdump/throttle summary of the suppressed events this often (default: 10)')
+@click.option('--latency', type=click.Path(dir_okay=False), metavar='FILE',
+    help='keep publish->return latency histograms (overall, per minion and per fun) and write them'
+    ' (as json) to FILE on SIGUSR1 and on exit')
+@click.option('--metrics-file', type=click.Path(dir_okay=False), metavar='FILE',
+    help='write per-stage timings and queue depths to FILE in the prometheus text format')
+@click.option('--metrics-listen', type=str, metavar='[HOST:]PORT',
+    help='serve per-stage timings and queue depths over http for prometheus (HOST defaults to 127.0.0.1)')
+@click.option('--metrics-interval', type=int, default=15,
+    help='with --metrics-file, rewrite it every this many seconds (default: 15)')
+@click.option('--profile', type=click.Path(dir_okay=False), metavar='FILE',
+    help='run under cProfile and dump the stats to FILE (pstats format) now and then and on exit')
+@click.option('--profile-interval', type=int, default=60,
+    help='with --profile, dump the stats every this many seconds (default: 60)')
+@click.option('--sample-secs', type=int, default=30,
+    help='with --sample-dir or --profile, on SIGUSR2 sample the stack for this many seconds (default: 30)')
+@click.option('--sample-dir', type=click.Path(file_okay=False),
+    help='sample the stack on SIGUSR2 and write the samples to this directory (with --profile, default: the temp directory)')
+@click.option('--json-encoder', default='auto', type=click.Choice(SERIALIZER_NAMES),
+    help='json encoder for the json, jsonl and stru formats (default: auto, the fastest one installed)')
 @click.argument('filter', nargs=-1)
-def saltdump(version, level, no_sudo_root, **opt):
+def saltdump(version, level, no_sudo_root, json_encoder, **opt):
     ''' FILTER (if given) is a glob or logical string of globs.
 
         \b
         examples:
           saltdump salt/job/*
           saltdump salt/* and not salt/auth
+          saltdump -o txt -o stru:/var/log/salt/events.json:salt/job/*
+          saltdump -o txt -o syslog:udp://loghost:514:'salt/* and not salt/auth'
 
         --show-job-info (-j) tells saltdump to reveal its internal job tracking
         counters.  The job info is formatted as if it were Salt event data, but
@@ -121,6 +472,15 @@ def saltdump(version, level, no_sudo_root, **opt):
             consistency and public 0mq keys found in auth events are replaced
             with a much shorter smattering of characters from the key.
 
+            hec: post the stru records to a Splunk http event collector
+
+            syslog: the stru records as RFC5424 syslog messages
+
+            sqlite: archive events in a sqlite database (see saltdump query)
+
+        The README says more about sending, spooling, rotating, merging
+        masters, stats, throttling and profiling.
+
 
 
     '''
@@ -131,8 +491,36 @@ def saltdump(version, level, no_sudo_root, **opt):
     if os.environ.get('SALTDUMP_NO_SUDO_ROOT'):
         opt['no_sudo_root'] = True
 
-    if opt['output_format'] == 'salt' and not opt['filter']:
-        opt['filter'] = ('salt/job/*/ret*',)
+    for spec in opt['output_format']:
+        try:
+            fmt, dest, tfilter = parse_output_spec(spec)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='-o')
+        if fmt == 'hec':
+            if not (dest or opt['hec_url']) or not opt['hec_token']:
+                raise click.UsageError('-o hec requires a url (-o hec:URL or --hec-url) and --hec-token')
+        elif fmt == 'sqlite':
+            if not dest or '://' in dest:
+                raise click.UsageError('-o sqlite requires a database file name (-o sqlite:FILE)')
+        elif dest and dest.startswith(('http://', 'https://')):
+            raise click.UsageError('only -o hec can be sent to {0}'.format(dest))
+
+    for spec in opt['master']:
+        try:
+            parse_master_spec(spec)
+        except FanInError as e:
+            raise click.BadParameter(str(e), param_hint='--master')
+    if (opt['master'] or opt['aggregate']) and (opt['replay_job_cache'] or opt['replay_only'] or opt['sock_dir']):
+        raise click.UsageError('--master and --aggregate do not combine with -r, -R or --sock-dir')
+
+    for spec in opt['throttle']:
+        try:
+            parse_throttle_spec(spec)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--throttle')
+
+    if opt['metrics_listen'] and not re.match(r'^(?:[^:]*:)?\d+$', opt['metrics_listen']):
+        raise click.BadParameter('expected [HOST:]PORT', param_hint='--metrics-listen')
 
     level = logging.getLevelName(level.upper())
     if not isinstance(level, int):
@@ -141,6 +529,8 @@ def saltdump(version, level, no_sudo_root, **opt):
     logging.basicConfig(level=level)
     log.debug('logging (re)configured')
 
+    set_serializer(json_encoder)
+
     try:
         runner = CmdRunner(**opt)
         runner.listen_loop()
@@ -153,3 +543,11 @@ def saltdump(version, level, no_sudo_root, **opt):
                 os.execvp('sudo', ['sudo'] + oargs)
         sys.stderr.write("FATAL: {0}\n".format(e))
         sys.exit(1)
+
+def main():
+    ''' the saltdump console script: saltdump [OPTIONS] [FILTER] or saltdump query|serve|agent|bench|synth|soak ... '''
+    subcommands = dict(query=query, serve=serve, agent=agent, bench=bench, synth=synth,
+        soak=soak)
+    if sys.argv[1:2] and sys.argv[1] in subcommands:
+        return subcommands[sys.argv[1]](args=sys.argv[2:], prog_name='saltdump ' + sys.argv[1])
+    return saltdump()
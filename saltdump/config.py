@@ -14,6 +14,7 @@ class SaltConfigMixin(object):
     _minion_opts = None
     _master_opts = None
     _my_opts     = None
+    _salt_id     = None
 
     def _normalize_and_copy(self, attr):
         c = copy.deepcopy( getattr(self,attr) )
@@ -55,6 +56,13 @@ class SaltConfigMixin(object):
         o.pop('conf_file')
         return o
 
+    @property
+    def salt_id(self):
+        ''' salt_opts['id'], looked up once (salt_opts deep copies the whole config) '''
+        if SaltConfigMixin._salt_id is None:
+            SaltConfigMixin._salt_id = self.salt_opts.get('id') or ''
+        return SaltConfigMixin._salt_id or None
+
 def get_config():
     class GenericConfigObject(SaltConfigMixin):
         pass
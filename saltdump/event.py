@@ -8,8 +8,10 @@ from collections import OrderedDict
 import salt.output
 
 from .structured import StructuredMixin
+from .serial import dumps
 from .config import SaltConfigMixin
 from .misc import DateParser
+from .histogram import LatencyTracker
 
 SHOW_JIDS = False
 
@@ -32,6 +34,8 @@ def reformat_minion_ids(matchers):
     REFORMAT_IDS = _m
 
 class Job(SaltConfigMixin, StructuredMixin):
+    cache_encodings = False # job info changes as events arrive
+
     def __init__(self, jid):
         self.jid       = jid
         self.events    = []
@@ -40,6 +44,12 @@ class Job(SaltConfigMixin, StructuredMixin):
         self.listeners = []
         self.find_jobs = {}
 
+        self.published   = None  # dtime of the Publish
+        self.fun         = None
+        self.first_ret   = None  # dtimes of the first and last Return
+        self.last_ret    = None
+        self.spread_done = False # see JidCollector(latency=True)
+
         self.ptime = DateParser('now')
         self.stamp = self.ptime.orig
         self.dtime = self.ptime.parsed
@@ -63,6 +73,15 @@ class Job(SaltConfigMixin, StructuredMixin):
 
         if event.dtime and (not self.dtime or self.dtime < event.dtime):
             self.dtime = event.dtime
+        if isinstance(event, Publish):
+            if self.published is None:
+                self.published = event.dtime
+                self.fun = event.fun
+        elif isinstance(event, Return) and event.dtime:
+            if self.first_ret is None or event.dtime < self.first_ret:
+                self.first_ret = event.dtime
+            if self.last_ret is None or event.dtime > self.last_ret:
+                self.last_ret = event.dtime
         self.events.append(event)
 
     def subsume(self, jitem):
@@ -198,20 +217,32 @@ class Job(SaltConfigMixin, StructuredMixin):
         return u' '.join(tuple( x for x in self.columns if x ))
 
     def json(self, indent=2):
-        kw = dict()
-        if indent:
-            kw['indent'] = indent
-        return json.dumps(self.raw, **kw)
+        return dumps(self.raw, indent=indent)
 
     @property
     def waiting(self):
         return self.expected - self.returned
 
+    @property
+    def spread(self):
+        ''' seconds between the first and last return '''
+        if self.first_ret is not None:
+            return (self.last_ret - self.first_ret).total_seconds()
+
 class JidCollector(object):
-    def __init__(self, max_jobs=50):
+    ''' correlates publishes, expected returns and returns by jid
+
+        With latency=True, it also keeps publish->return latency histograms
+        (overall, per minion and per fun) and a histogram of the time
+        between each job's first and last return (recorded once every
+        expected minion has returned, or when the job is expired) in
+        self.latency, a LatencyTracker.
+    '''
+    def __init__(self, max_jobs=50, latency=False):
         self.jids = {}
         self.listeners = []
         self.max_jobs  = max_jobs
+        self.latency   = LatencyTracker() if latency else None
 
         # XXX: if we ever get to the point of cleaning up jids from self.jids,
         # we'll have to remember to clean them from this too
@@ -254,7 +285,7 @@ class JidCollector(object):
                 if event.jid in self.jids:
                     log.debug(" subsuming jitem=%s", self.jids[event.jid])
                     jitem.subsume( self.jids.pop( event.jid ) )
-                    actions.add('subsume-jitem-%s', event.jid)
+                    actions.add('subsume-jitem-{0}'.format(event.jid))
                 else:
                     log.debug(" not subsuming jid=%s", event.jid)
 
@@ -269,10 +300,14 @@ class JidCollector(object):
                     if event.id not in jitem.returned:
                         actions.add('add-returned')
                         jitem.returned.add(event.id)
+                if self.latency is not None:
+                    self.time_return(jitem, event)
 
             if len(self.jids) > self.max_jobs:
                 to_kill = sorted( self.jids.keys() )[0:( len(self.jids) - self.max_jobs )]
                 for i in to_kill:
+                    if self.latency is not None:
+                        self.time_spread(self.jids[i])
                     del self.jids[i]
                     actions.add('expire-jitem-{0}'.format(i))
                 m_to_kill = [ k for k in self.map_jids if self.map_jids[k] in to_kill ]
@@ -288,6 +323,18 @@ class JidCollector(object):
         else:
             log.debug("examine-event finds no jid here: %s", event)
 
+    def time_return(self, jitem, event):
+        if jitem.published is not None and event.dtime:
+            self.latency.returned(event.id, jitem.fun or event.fun,
+                (event.dtime - jitem.published).total_seconds())
+        if jitem.expected and not jitem.waiting:
+            self.time_spread(jitem)
+
+    def time_spread(self, jitem):
+        if not jitem.spread_done and jitem.spread is not None:
+            jitem.spread_done = True
+            self.latency.finished(jitem.spread)
+
     @property
     def waiting(self):
         ret = {}
@@ -342,17 +389,25 @@ def event_classes():
     classes.reverse()
     return [ x[1] for x in classes ]
 
-def classify_event(json_data):
+def classify_event(json_data, classes=None):
     if isinstance(json_data, Event):
         return json_data
     raw = grok_json_event(json_data)
-    for cls in event_classes():
+    if classes is None:
+        classes = event_classes()
+    for cls in classes:
         if cls.match(raw):
             # noisy
             # log.debug('classifying %s as %s', raw, cls)
             return cls(raw)
     return Event(raw)
 
+def classify_many(events):
+    # event_classes() walks globals() and re-sorts every time, so work out
+    # the class ordering once for the whole batch
+    classes = event_classes()
+    return [ classify_event(ev, classes) for ev in events ]
+
 def my_args_format(x):
     if not x or x is NA or x == NA:
         return ''
@@ -396,6 +451,7 @@ class Event(SaltConfigMixin, StructuredMixin):
         self.raw = raw
         self.tag = self.raw.get('tag', NA)
         self.dat = self.raw.get('data', {})
+        self.master = self.raw.get('_master') # the master it came from, when listening to several (see FanIn)
 
         # This is meant to descend into minion returns to syndic returns to
         # master.  It's not totally obvious when to go into data={'data': {}},
@@ -412,10 +468,7 @@ class Event(SaltConfigMixin, StructuredMixin):
         return (self.__class__, (self.raw,))
 
     def json(self, indent=2):
-        kw = dict()
-        if indent:
-            kw['indent'] = indent
-        return json.dumps(self.raw, **kw)
+        return self.encoded('raw', lambda: self.raw, indent=indent)
 
     def outputter(self, **kw):
         return self.short
@@ -548,7 +601,7 @@ class Event(SaltConfigMixin, StructuredMixin):
 
     @property
     def tcolumns(self):
-        return (getattr(self, 'tag', ''),) + self.columns
+        return (self.master, getattr(self, 'tag', '')) + self.columns
 
     @property
     def short(self):
@@ -0,0 +1,155 @@
+# coding: utf-8
+
+import json
+import time
+import heapq
+import socket
+import logging
+import datetime
+import itertools
+import threading
+
+from .master_minion import MasterMinion, ListenLoopMixin
+from .serve import subscribe, ServeError
+
+log = logging.getLogger(__name__)
+
+class FanInError(Exception):
+    pass
+
+class FeedSource(object):
+    ''' the events from a saltdump serve socket, as a MasterMinion-ish next()
+
+        When the connection breaks or the server hangs up (e.g., it's being
+        restarted), next() reconnects, backing off up to max_backoff
+        seconds.  It only returns 'FIN' after close(), or if the server
+        refuses the subscription; the end of the feed itself is its
+        salt/event/exit.
+    '''
+    backoff     = 0.5
+    max_backoff = 30
+
+    def __init__(self, path):
+        self.path    = path
+        self.lines   = None
+        self.closing = threading.Event()
+
+    def next(self, no_block=False):
+        delay = self.backoff
+        while not self.closing.is_set():
+            try:
+                if self.lines is None:
+                    self.lines = subscribe(self.path, 'jsonl')
+                return json.loads(next(self.lines))
+            except ServeError as e:
+                log.error('%s refused the subscription: %s', self.path, e)
+                return 'FIN'
+            except ValueError as e:
+                log.warning('%s sent something that is not json: %s', self.path, e)
+            except (StopIteration, socket.error) as e:
+                log.warning('reading %s failed (%s), reconnecting in %0.1fs', self.path, str(e) or 'hung up', delay)
+                self.lines = None
+                if self.closing.wait(delay):
+                    break
+                delay = min(delay * 2, self.max_backoff)
+        return 'FIN'
+
+    def close(self):
+        self.closing.set()
+
+def open_source(source):
+    ''' a MasterMinion for a master's sock_dir, or a FeedSource for unix:PATH (a saltdump serve socket) '''
+    if source.startswith('unix:'):
+        return FeedSource(source[5:])
+    return MasterMinion(sock_dir=source)
+
+def parse_master_spec(spec):
+    ''' NAME=SOURCE as (name, source) '''
+    name, eq, source = spec.partition('=')
+    if not eq or not name or not source:
+        raise FanInError('expected NAME=SOURCE, not "{0}"'.format(spec))
+    return name, source
+
+def _stamp(ev):
+    # salt's _stamps are iso8601 utc, so they sort correctly as strings
+    dat = ev.get('data')
+    stamp = dat.get('_stamp') if isinstance(dat, dict) else None
+    return stamp or datetime.datetime.utcnow().isoformat()
+
+class FanIn(ListenLoopMixin):
+    ''' merge the events from several masters (or feeds) into one stream
+
+        sources are (name, source) pairs, where source is anything with a
+        MasterMinion style next() (see open_source()).  Each is read by its
+        own thread; every event gets the source's name as '_master' (see
+        Event.master) and goes into a reorder buffer.  next() hands back the
+        event with the earliest _stamp once it has waited reorder_ms, so
+        events from different masters that arrive a little out of order come
+        out in order.  The buffer never holds more than max_buffer events.
+
+        A source that says salt/event/exit (or runs out) is done; once they
+        all are and the buffer is empty, next() returns 'FIN'.  close()
+        closes the sources that can be closed (e.g., a reconnecting
+        FeedSource).
+    '''
+
+    def __init__(self, sources, reorder_ms=250, max_buffer=10000):
+        self.window     = reorder_ms / 1000.0
+        self.max_buffer = max_buffer
+        self.heap       = list() # (stamp, seq, arrived, event)
+        self.seq        = itertools.count()
+        self.cond       = threading.Condition()
+        self.running    = len(sources)
+        self.sources    = [ source for name,source in sources ]
+        self.threads    = list()
+
+        for name,source in sources:
+            t = threading.Thread(target=self._read, args=(name, source), name='FanIn-{0}'.format(name))
+            t.daemon = True
+            self.threads.append(t)
+        for t in self.threads:
+            t.start()
+
+    def _read(self, name, source):
+        try:
+            while True:
+                ev = source.next()
+                if ev is None:
+                    continue
+                if ev == 'FIN':
+                    log.info('%s has no more events', name)
+                    return
+                if ev.get('tag') == 'salt/event/exit':
+                    log.info('%s is exiting', name)
+                    return
+                ev.setdefault('_master', name) # an Aggregator already knows which agent it came from
+                with self.cond:
+                    heapq.heappush(self.heap, (_stamp(ev), next(self.seq), time.time(), ev))
+                    self.cond.notify()
+        except Exception as e:
+            log.exception('reading events from %s failed: %s', name, e)
+        finally:
+            with self.cond:
+                self.running -= 1
+                self.cond.notify()
+
+    def next(self, no_block=False):
+        with self.cond:
+            while True:
+                wait = 1.0
+                if self.heap:
+                    wait = self.heap[0][2] + self.window - time.time()
+                    if wait <= 0 or len(self.heap) > self.max_buffer or not self.running:
+                        return heapq.heappop(self.heap)[-1]
+                elif not self.running:
+                    return 'FIN'
+                if no_block:
+                    return None
+                self.cond.wait(wait)
+                if not self.heap and self.running:
+                    return None # like get_event() timing out
+
+    def close(self):
+        for source in self.sources:
+            if hasattr(source, 'close'):
+                source.close()
@@ -0,0 +1,181 @@
+# coding: utf-8
+
+import os
+import re
+import gzip
+import time
+import Queue
+import shutil
+import logging
+import threading
+
+from .output import OutputWriter
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+log = logging.getLogger(__name__)
+
+COMPRESSORS = ('gz', 'xz')
+
+class FileSinkError(Exception):
+    pass
+
+class RotatingFileWriter(OutputWriter):
+    ''' OutputWriter for a file that rotates itself
+
+        The file is rotated before a write that would take it past max_bytes
+        or once it has been open for max_secs.  Rotation renames the file to
+        FILE.YYYYmmddTHHMMSS.micros (an atomic rename, so no event is lost or
+        written twice) and opens a fresh FILE.  With max_secs, a background
+        thread rotates a file that's due even if nothing more is written to
+        it.  Closed segments are compressed (gz or xz) by another background
+        thread, written to a .tmp file and renamed into place when complete.
+        With keep, only the newest keep segments are kept around; only files
+        named like segments are ever removed, and never one that's waiting
+        to be compressed.
+    '''
+
+    def __init__(self, fname, max_bytes=None, max_secs=None, compress=None, keep=None, **kw):
+        if compress not in (None,) + COMPRESSORS:
+            raise FileSinkError('compress must be one of {0}, not {1}'.format(COMPRESSORS, compress))
+        if compress == 'xz' and lzma is None:
+            raise FileSinkError('xz compression needs lzma (try: pip install backports.lzma)')
+        self.fname     = fname
+        self.max_bytes = max_bytes
+        self.max_secs  = max_secs
+        self.compress  = compress
+        self.keep      = keep
+        self.rotated   = 0
+        self.queue     = Queue.Queue()
+        self.pending   = set() # segments queued for compression
+        self.plock     = threading.Lock()
+        self.zthread   = None
+        self.rthread   = None
+        self.seg_re    = re.compile(r'^{0}\.\d{{8}}T\d{{6}}\.\d{{6}}(?:\.(?:{1}))?$'.format(
+            re.escape(os.path.basename(fname)), '|'.join(COMPRESSORS)))
+
+        if compress:
+            self.zthread = threading.Thread(target=self._compress_loop, name='RotatingFileWriter')
+            self.zthread.daemon = True
+            self.zthread.start()
+
+        super(RotatingFileWriter, self).__init__(self._open(), **kw)
+
+        if max_secs:
+            self.rthread = threading.Thread(target=self._rotate_loop, name='RotatingFileWriter')
+            self.rthread.daemon = True
+            self.rthread.start()
+
+    def _open(self):
+        fh = open(self.fname, 'ab')
+        fh.seek(0, os.SEEK_END)
+        self.size = fh.tell()
+        self.opened = time.time()
+        return fh
+
+    def _due(self, n):
+        if not self.size:
+            return False
+        if self.max_bytes and self.size + n > self.max_bytes:
+            return True
+        if self.max_secs and time.time() - self.opened >= self.max_secs:
+            return True
+        return False
+
+    def _send(self, data):
+        if self._due(len(data)):
+            self.rotate()
+        super(RotatingFileWriter, self)._send(data)
+        self.size += len(data)
+
+    def _rotate_loop(self):
+        # rotate on time even when the bus is quiet and nothing calls _send()
+        while not self.done.wait(max(0.1, self.opened + self.max_secs - time.time())):
+            try:
+                with self.lock:
+                    self._flush()
+                    if self._due(0):
+                        self.rotate()
+            except (IOError, OSError) as e:
+                log.error('failed to rotate %s: %s', self.fname, e)
+
+    def _segment_name(self):
+        now = time.time()
+        return '{0}.{1}.{2:06d}'.format(self.fname, time.strftime('%Y%m%dT%H%M%S', time.localtime(now)),
+            int(now % 1 * 1000000))
+
+    def rotate(self):
+        self.fh.close()
+        rname = self._segment_name()
+        os.rename(self.fname, rname)
+        log.debug('rotated %s to %s', self.fname, rname)
+        self.fh = self._open()
+        self.rotated += 1
+        if self.compress:
+            with self.plock:
+                self.pending.add(rname)
+            self.queue.put(rname)
+        else:
+            self.expire()
+
+    def _compress(self, rname):
+        zname = '{0}.{1}'.format(rname, self.compress)
+        opener = gzip.open if self.compress == 'gz' else lzma.open
+        with open(rname, 'rb') as ifh:
+            zfh = opener(zname + '.tmp', 'wb')
+            try:
+                shutil.copyfileobj(ifh, zfh, 1024*1024)
+            finally:
+                zfh.close()
+        os.rename(zname + '.tmp', zname)
+        os.unlink(rname)
+
+    def _compress_loop(self):
+        while True:
+            rname = self.queue.get()
+            try:
+                if rname is None:
+                    return
+                self._compress(rname)
+            except (IOError, OSError) as e:
+                log.error('failed to compress %s: %s', rname, e)
+            finally:
+                with self.plock:
+                    self.pending.discard(rname)
+                try:
+                    self.expire()
+                except (IOError, OSError) as e:
+                    log.error('failed to expire segments of %s: %s', self.fname, e)
+                self.queue.task_done()
+
+    def segments(self):
+        ''' rotated segments (FILE.YYYYmmddTHHMMSS.micros, maybe .gz or .xz), oldest first '''
+        dname = os.path.dirname(self.fname)
+        return sorted( os.path.join(dname, x) for x in os.listdir(dname or '.') if self.seg_re.match(x) )
+
+    def expire(self):
+        if self.keep:
+            with self.plock:
+                pending = set(self.pending)
+            for fname in self.segments()[:-self.keep]:
+                if fname in pending:
+                    continue # the compress thread gets to it (and expires it) later
+                log.debug('expiring %s', fname)
+                os.unlink(fname)
+
+    def close(self):
+        super(RotatingFileWriter, self).close()
+        if self.rthread is not None:
+            self.rthread.join()
+            self.rthread = None
+        self.fh.close()
+        if self.zthread is not None:
+            self.queue.put(None)
+            self.zthread.join()
+            self.zthread = None
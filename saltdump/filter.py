@@ -83,15 +83,150 @@ expr: MATCH | URN_OP expr | expr BIN_OP expr  | "(" expr ")"
 Parser = lark.Lark(GRAMMAR, parser='lalr', transformer=FilterTransformer())
 
 class AlwaysTrue(object):
-    def __call__(self):
+    def __call__(self, *a):
         return True
 
+    def __repr__(self):
+        return '/*/'
+
+class _TrieNode(object):
+    __slots__ = ('children', 'wild', 'subs')
+
+    def __init__(self):
+        self.children = dict() # literal segment -> node
+        self.wild     = dict() # literal prefix -> { glob segment -> (matcher or None for '*', node) }
+        self.subs     = set()
+
+    def __nonzero__(self):
+        return bool(self.children or self.wild or self.subs)
+
+class SubscriptionIndex(object):
+    ''' which of many filters want a tag, without evaluating them all
+
+        Filters that are a glob, or globs or'd together, are decomposed into
+        a trie over the /-separated segments of their globs: literal segments
+        are dict lookups and segments with wildcards are edges (filed under
+        the literal text before their first wildcard) that are tried against
+        one or more tag segments (a * in these globs can match a /, just like
+        it does in a Match).  match(tag) walks the trie, so it
+        costs about the depth of the tag rather than the number of filters.
+        Filters that can't be decomposed (and, not) are just called.
+
+        Keys are whatever the caller wants back from match() (e.g., outputs
+        or clients); each key has one filter.
+    '''
+
+    def __init__(self):
+        self.root     = _TrieNode()
+        self.everyone = set()  # keys with AlwaysTrue
+        self.residual = dict() # key -> filter that has to be called
+        self.globs    = dict() # key -> globs it's in the trie under
+
+    @classmethod
+    def decompose(cls, tfilter):
+        ''' the globs that make up tfilter, or None if it isn't just globs or'd together '''
+        if getattr(tfilter, 'notted', False):
+            return None
+        if isinstance(tfilter, Match):
+            if re.search(r'\[[^\]]*/', tfilter.match):
+                return None # a / in a [...] would straddle segments
+            return [ tfilter.match ]
+        if isinstance(tfilter, OrOp):
+            globs = list()
+            for a in tfilter.args:
+                g = cls.decompose(a)
+                if g is None:
+                    return None
+                globs.extend(g)
+            return globs
+
+    def add(self, key, tfilter):
+        if key in self.globs or key in self.residual or key in self.everyone:
+            self.remove(key)
+        if tfilter is None or isinstance(tfilter, AlwaysTrue):
+            self.everyone.add(key)
+            return
+        globs = self.decompose(tfilter)
+        if globs is None:
+            self.residual[key] = tfilter
+            return
+        self.globs[key] = globs
+        for glob in globs:
+            node = self.root
+            for seg in glob.split('/'):
+                m = re.search(r'[*?[]', seg)
+                if m:
+                    edges = node.wild.setdefault(seg[:m.start()], dict())
+                    if seg not in edges:
+                        matcher = None if seg == '*' else re.compile(fnmatch.translate(seg)).match
+                        edges[seg] = (matcher, _TrieNode())
+                    node = edges[seg][1]
+                else:
+                    node = node.children.setdefault(seg, _TrieNode())
+            node.subs.add(key)
+
+    def _remove(self, node, segs, key):
+        if not segs:
+            node.subs.discard(key)
+            return
+        seg, rest = segs[0], segs[1:]
+        m = re.search(r'[*?[]', seg)
+        if m:
+            prefix = seg[:m.start()]
+            edges = node.wild.get(prefix, {})
+            if seg in edges:
+                self._remove(edges[seg][1], rest, key)
+                if not edges[seg][1]:
+                    del edges[seg]
+                if not edges:
+                    del node.wild[prefix]
+        elif seg in node.children:
+            self._remove(node.children[seg], rest, key)
+            if not node.children[seg]:
+                del node.children[seg]
+
+    def remove(self, key):
+        self.everyone.discard(key)
+        self.residual.pop(key, None)
+        for glob in self.globs.pop(key, ()):
+            self._remove(self.root, glob.split('/'), key)
+
+    def _walk(self, node, segs, i, found):
+        if i == len(segs):
+            found.update(node.subs)
+            return
+        child = node.children.get(segs[i])
+        if child is not None:
+            self._walk(child, segs, i+1, found)
+        if node.wild:
+            # wildcard edges are filed under their literal prefix, which has
+            # to be a prefix of this tag segment
+            seg = segs[i]
+            for p in range(len(seg)+1):
+                for matcher, child in node.wild.get(seg[:p], {}).itervalues():
+                    # a wildcard segment can eat one or more tag segments
+                    for j in range(i+1, len(segs)+1):
+                        if matcher is None or matcher('/'.join(segs[i:j])):
+                            self._walk(child, segs, j, found)
+
+    def match(self, tag):
+        ''' the set of keys whose filters pass tag '''
+        found = set(self.everyone)
+        self._walk(self.root, tag.split('/'), 0, found)
+        for key,tfilter in self.residual.iteritems():
+            if tfilter(tag):
+                found.add(key)
+        return found
+
+    def __len__(self):
+        return len(self.everyone) + len(self.residual) + len(self.globs)
+
 def build_filter(*x):
     x = ' '.join(x)
     log.debug('parsing filter="%s"', x)
     if not x:
-        log.debug(' nothing to parse, returning lambda *a: True')
-        return lambda *a: True
+        log.debug(' nothing to parse, returning AlwaysTrue()')
+        return AlwaysTrue()
     if isinstance(x, (list,tuple)):
         x = ' '.join(x)
     x = Parser.parse(x)
@@ -0,0 +1,110 @@
+# coding: utf-8
+
+import ssl
+import time
+import zlib
+import socket
+import httplib
+import logging
+import urlparse
+
+from .sink import Sink
+
+log = logging.getLogger(__name__)
+
+class HECError(Exception):
+    pass
+
+def gzip_compress(data, level=6):
+    # wbits=31 gets zlib to write a gzip header and trailer
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return z.compress(data) + z.flush()
+
+class HECSink(Sink):
+    ''' post hec formatted events to a Splunk http event collector
+
+        Each batch becomes one (gzipped) POST.  Every sender thread holds its
+        own keep-alive connection.  Failed POSTs are retried with
+        exponential backoff (server errors, 429s and connection problems);
+        other 4xx responses won't get any better by retrying them, so those
+        batches are logged and dropped.  With a spool, the spool does the
+        long-term retrying and deliver() only retries once (e.g., for a
+        keep-alive connection the collector closed on us).
+    '''
+    senders = 2
+
+    def __init__(self, url, token, flush_bytes=256*1024, compress=True, retries=None,
+        timeout=30, verify=True, **kw):
+
+        u = urlparse.urlparse(url)
+        if u.scheme not in ('http', 'https'):
+            raise HECError('hec url must be http:// or https://, not {0}'.format(url))
+        self.url      = url
+        self.scheme   = u.scheme
+        self.host     = u.hostname
+        self.port     = u.port
+        self.path     = u.path if u.path not in ('', '/') else '/services/collector/event'
+        if u.query:
+            self.path += '?' + u.query
+        self.token    = token
+        self.compress = compress
+        self.timeout  = timeout
+        self.verify   = verify
+        self.retries  = retries
+        if self.retries is None:
+            self.retries = 1 if kw.get('spool') is not None else 5
+
+        super(HECSink, self).__init__(flush_bytes=flush_bytes, **kw)
+
+    def _connect(self):
+        if self.scheme == 'https':
+            ctx = None
+            if not self.verify:
+                ctx = ssl._create_unverified_context()
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=ctx)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _post(self, conn, body):
+        headers = {
+            'Authorization': 'Splunk {0}'.format(self.token),
+            'Content-Type': 'application/json',
+        }
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        conn.request('POST', self.path, body, headers)
+        res = conn.getresponse()
+        return res.status, res.read()
+
+    def deliver(self, data):
+        body = gzip_compress(data) if self.compress else data
+        conn = getattr(self.local, 'conn', None)
+        delay = self.backoff
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    status, text = self._post(conn, body)
+                except (socket.error, httplib.HTTPException) as e:
+                    log.info('hec post to %s failed (attempt %d): %s', self.url, attempt + 1, e)
+                    if conn is not None:
+                        conn.close()
+                    conn = None
+                    continue
+                if status < 300:
+                    return True
+                log.info('hec post to %s returned %d (attempt %d): %s', self.url, status, attempt + 1, text)
+                if status != 429 and status < 500:
+                    break
+            return False
+        finally:
+            self.local.conn = conn
+
+    def disconnect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
@@ -0,0 +1,128 @@
+# coding: utf-8
+
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+class LogHistogram(object):
+    ''' an HDR-style histogram of durations (in seconds)
+
+        Values are kept as integer microseconds in log-linear buckets: every
+        power of two is split into 2**bits sub-buckets, so a bucket is never
+        wider than 1/2**bits of its value (about 3% with the default bits=5)
+        from a microsecond up to days, in a few hundred buckets at most.
+        Only buckets that have been hit take any memory.
+    '''
+
+    def __init__(self, bits=5):
+        self.bits    = bits
+        self.sub     = 1 << bits
+        self.buckets = dict() # index -> count
+        self.count   = 0
+        self.total   = 0
+        self.min     = None
+        self.max     = None
+
+    def index(self, us):
+        m = max(0, us.bit_length() - self.bits - 1)
+        return m * self.sub + (us >> m)
+
+    def bounds(self, idx):
+        ''' the lowest and highest microsecond values that land in bucket idx '''
+        m = max(0, idx // self.sub - 1)
+        low = (idx - m * self.sub) << m
+        return low, low + (1 << m) - 1
+
+    def record(self, secs):
+        us = max(0, int(round(secs * 1e6)))
+        idx = self.index(us)
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += us
+        if self.min is None or us < self.min:
+            self.min = us
+        if self.max is None or us > self.max:
+            self.max = us
+
+    def merge(self, other):
+        for idx,n in other.buckets.iteritems():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p):
+        ''' the value (in seconds) at or below which p percent of the recorded values fall '''
+        if not self.count:
+            return None
+        want = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= want:
+                return min(self.bounds(idx)[1], self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self, percentiles=(50, 90, 99), buckets=False):
+        ret = dict(count=self.count)
+        if self.count:
+            ret.update(min=self.min / 1e6, max=self.max / 1e6, mean=round(self.total / 1e6 / self.count, 6))
+            for p in percentiles:
+                ret['p{0}'.format(p)] = self.percentile(p)
+        if buckets:
+            # [low, high, count] in seconds, enough to merge or re-plot elsewhere
+            ret['buckets'] = [ [ x / 1e6 for x in self.bounds(idx) ] + [ self.buckets[idx] ]
+                for idx in sorted(self.buckets) ]
+        return ret
+
+    def __repr__(self):
+        return 'LogHistogram({0})'.format(self.summary())
+
+class LatencyTracker(object):
+    ''' publish->return latency histograms (overall, per minion and per fun)
+        and a histogram of the spread between each job's first and last
+        return; see JidCollector(latency=True)
+    '''
+
+    def __init__(self, bits=5):
+        self.bits      = bits
+        self.returns   = LogHistogram(bits)
+        self.by_minion = dict()
+        self.by_fun    = dict()
+        self.spread    = LogHistogram(bits)
+
+    def _hist(self, hists, key):
+        h = hists.get(key)
+        if h is None:
+            h = hists[key] = LogHistogram(self.bits)
+        return h
+
+    def returned(self, minion, fun, secs):
+        secs = max(0, secs)
+        self.returns.record(secs)
+        self._hist(self.by_minion, minion).record(secs)
+        self._hist(self.by_fun, fun).record(secs)
+
+    def finished(self, secs):
+        self.spread.record(max(0, secs))
+
+    def report(self, buckets=True):
+        ''' everything, as a dict ready to be dumped as json '''
+        return dict(
+            time = time.time(),
+            publish_to_return = dict(
+                all       = self.returns.summary(buckets=buckets),
+                by_minion = dict( (k, h.summary(buckets=buckets)) for k,h in self.by_minion.iteritems() ),
+                by_fun    = dict( (k, h.summary(buckets=buckets)) for k,h in self.by_fun.iteritems() ),
+            ),
+            return_spread = self.spread.summary(buckets=buckets),
+        )
+
+    def slowest(self, n=10, p=99):
+        ''' the n minions with the highest pth percentile publish->return latency '''
+        ret = [ (h.percentile(p), k) for k,h in self.by_minion.iteritems() ]
+        return [ (k,v) for v,k in sorted(ret, reverse=True)[:n] ]
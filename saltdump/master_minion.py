@@ -98,13 +98,84 @@ class MasterMinionJidNexter(object):
             except StopIteration:
                 self.g = False
 
-class MasterMinion(SaltConfigMixin):
+class ListenLoopMixin(object):
+    ''' the listen loops, for anything with a MasterMinion style next(no_block=False) '''
+
+    def next_batch(self, max_events=100, max_wait=0.1):
+        ''' block for the next event, then drain whatever else is immediately
+            available (without blocking) until max_events have been collected
+            or max_wait seconds have passed
+
+            returns a list of events (possibly empty) or 'FIN' when there's
+            nothing left to read
+        '''
+        ev = self.next()
+        if ev is None:
+            return []
+        if ev == 'FIN':
+            return ev
+
+        batch = [ev]
+        deadline = time.time() + max_wait
+        while len(batch) < max_events and time.time() < deadline:
+            if ev.get('tag') == 'salt/event/exit':
+                break
+            ev = self.next(no_block=True)
+            if ev is None or ev == 'FIN':
+                break
+            batch.append(ev)
+        return batch
+
+    def listen_batch_loop(self, callback, max_events=100, max_wait=0.1):
+        ''' like listen_loop(), but callback receives lists of events from next_batch() '''
+        try:
+            while True:
+                evs = self.next_batch(max_events, max_wait)
+                if not evs:
+                    continue
+                if evs == 'FIN':
+                    log.debug('internal iterator finished; returning from listen_batch_loop')
+                    return
+                log.debug("calling callback from listen_batch_loop with %d events", len(evs))
+                if not callback(evs):
+                    break
+                if evs[-1].get('tag') == 'salt/event/exit':
+                    log.debug('tag is %s; returning from listen_batch_loop', evs[-1]['tag'])
+                    return
+        except IOError:
+            return # probably Broken Pipe from `saltdump | head` (or similar)
+        except KeyboardInterrupt:
+            pass
+
+    def listen_loop(self, callback):
+        try:
+            while True:
+                j = self.next()
+                if j is None:
+                    continue
+                if j == 'FIN':
+                    log.debug('internal iterator finished; returning from listen_loop')
+                    return
+                log.debug("calling callback from listen_loop")
+                if not callback(j):
+                    break
+                if j.get('tag') == 'salt/event/exit':
+                    log.debug('tag is %s; returning from listen_loop', j['tag'])
+                    return
+        except IOError:
+            return # probably Broken Pipe from `saltdump | head` (or similar)
+        except KeyboardInterrupt:
+            pass
+
+class MasterMinion(SaltConfigMixin, ListenLoopMixin):
     ppid = kpid = None
 
-    def __init__(self, args=None, preproc=None, replay_file=None, replay_only=False, replay_job_cache=None):
+    def __init__(self, args=None, preproc=None, replay_file=None, replay_only=False, replay_job_cache=None,
+        sock_dir=None):
         if replay_only:
             replay_job_cache = True
 
+        self.sock_dir         = sock_dir # default: the master config's sock_dir
         self.preproc          = preproc
         self.replay_file      = replay_file
         self.replay_only      = replay_only
@@ -148,13 +219,14 @@ class MasterMinion(SaltConfigMixin):
             #       is really salt.runners.state.event()
             # which is really salt.modules.state.event()
             # which is really salt.utils.event.get_event()
+            sock_dir = self.sock_dir or self.salt_opts['sock_dir']
             self.sevent = salt.utils.event.get_event(
                     'master', # node= master events or minion events
-                    self.salt_opts['sock_dir'],
+                    sock_dir,
                     self.salt_opts['transport'],
                     opts=self.salt_opts,
                     listen=True)
-            socket_fname = os.path.join(self.salt_opts['sock_dir'], 'master_event_pub.ipc')
+            socket_fname = os.path.join(sock_dir, 'master_event_pub.ipc')
             if not os.access(socket_fname, os.R_OK):
                 raise SocketReadPermissionError('no read permission on {0}'.format(socket_fname))
             # In [1]: os.path.exists('/var/run/salt/master/master_event_pub.ipc')
@@ -170,7 +242,7 @@ class MasterMinion(SaltConfigMixin):
             elif p is not None and p not in self.preproc:
                 self.preproc.append(p)
 
-    def next(self):
+    def next(self, no_block=False):
         ev = None
 
         if self.replay_fh:
@@ -195,7 +267,10 @@ class MasterMinion(SaltConfigMixin):
                 self.replay_job_cache = self.mmjn = False
 
         elif self.sevent:
-            ev = self.sevent.get_event( **self.get_event_args )
+            if no_block:
+                ev = self.sevent.get_event( no_block=True, **self.get_event_args )
+            else:
+                ev = self.sevent.get_event( **self.get_event_args )
 
         else:
             log.info("no remaining replay file handles, job caches, or event scanners. FIN")
@@ -207,23 +282,3 @@ class MasterMinion(SaltConfigMixin):
 
         if ev is not None:
             return ev
-
-    def listen_loop(self, callback):
-        try:
-            while True:
-                j = self.next()
-                if j is None:
-                    continue
-                if j == 'FIN':
-                    log.debug('internal iterator finished; returning from listen_loop')
-                    return
-                log.debug("calling callback from listen_loop")
-                if not callback(j):
-                    break
-                if j.get('tag') == 'salt/event/exit':
-                    log.debug('tag is %s; returning from listen_loop', j['tag'])
-                    return
-        except IOError:
-            return # probably Broken Pipe from `saltdump | head` (or similar)
-        except KeyboardInterrupt:
-            pass
@@ -0,0 +1,158 @@
+# coding: utf-8
+
+import os
+import time
+import logging
+import threading
+import BaseHTTPServer
+
+log = logging.getLogger(__name__)
+
+clock = time.time
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join( '{0}="{1}"'.format(k, unicode(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k,v in sorted(labels.items()) ) + '}'
+
+class Metrics(object):
+    ''' per-stage timing counters and queue depth gauges
+
+        add(stage, secs) counts one trip through a stage, its time and the
+        longest trip so far.  timed(stage, func) wraps func so every call is
+        add()ed -- nothing in saltdump calls add() itself unless metrics are
+        on, the instrumented code paths are swapped in instead (see
+        CmdRunner), so there's no cost at all when they're off.
+
+        gauge(name, func, **labels) registers a callable that reports a
+        current value (e.g., a queue's depth) whenever the metrics are
+        exported.  prometheus() renders everything in the prometheus text
+        exposition format.
+    '''
+
+    def __init__(self):
+        self.stages  = dict() # stage -> [count, seconds, max seconds]
+        self.gauges  = list() # (name, labels, func)
+        self.lock    = threading.Lock()
+        self.started = clock()
+
+    def add(self, stage, secs):
+        with self.lock:
+            s = self.stages.get(stage)
+            if s is None:
+                s = self.stages[stage] = [0, 0.0, 0.0]
+            s[0] += 1
+            s[1] += secs
+            if secs > s[2]:
+                s[2] = secs
+
+    def timed(self, stage, func):
+        def _timed(*a, **kw):
+            t = clock()
+            try:
+                return func(*a, **kw)
+            finally:
+                self.add(stage, clock() - t)
+        return _timed
+
+    def gauge(self, name, func, **labels):
+        self.gauges.append( (name, labels, func) )
+
+    def prometheus(self):
+        with self.lock:
+            stages = sorted( (k, list(v)) for k,v in self.stages.iteritems() )
+        lines = list()
+        for name, kind, i, desc in (
+            ('saltdump_stage_calls_total',   'counter', 0, 'trips through each stage'),
+            ('saltdump_stage_seconds_total', 'counter', 1, 'time spent in each stage'),
+            ('saltdump_stage_max_seconds',   'gauge',   2, 'the longest single trip through each stage'),
+            ):
+            lines.append('# HELP {0} {1}'.format(name, desc))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for stage,v in stages:
+                lines.append('{0}{1} {2!r}'.format(name, _labels(dict(stage=stage)), v[i]))
+
+        seen = set()
+        for name, labels, func in self.gauges:
+            try:
+                v = func()
+            except Exception as e:
+                log.debug('gauge %s%s failed: %s', name, labels, e)
+                continue
+            if name not in seen:
+                seen.add(name)
+                lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0}{1} {2!r}'.format(name, _labels(labels), v))
+
+        lines.append('# TYPE saltdump_uptime_seconds gauge')
+        lines.append('saltdump_uptime_seconds {0!r}'.format(clock() - self.started))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, fname):
+        ''' write prometheus() to fname (e.g., for node_exporter's textfile collector) '''
+        tmp = '{0}.tmp'.format(fname)
+        with open(tmp, 'wb') as fh:
+            fh.write( self.prometheus().encode('utf-8') )
+        os.rename(tmp, fname)
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.metrics.prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        log.debug('%s %s', self.address_string(), fmt % args)
+
+class MetricsExporter(object):
+    ''' export Metrics as a prometheus textfile every interval seconds
+        and/or over http on listen ([HOST:]PORT, HOST defaults to 127.0.0.1)
+    '''
+
+    def __init__(self, metrics, textfile=None, listen=None, interval=15):
+        self.metrics  = metrics
+        self.textfile = textfile
+        self.interval = interval
+        self.done     = threading.Event()
+        self.threads  = list()
+        self.httpd    = None
+
+        if listen:
+            host, _, port = listen.rpartition(':')
+            self.httpd = BaseHTTPServer.HTTPServer((host or '127.0.0.1', int(port)), _Handler)
+            self.httpd.metrics = metrics
+            self.threads.append( threading.Thread(target=self.httpd.serve_forever, name='MetricsHTTP') )
+        if textfile:
+            self.threads.append( threading.Thread(target=self._write_loop, name='MetricsTextfile') )
+        for t in self.threads:
+            t.daemon = True
+            t.start()
+
+    @property
+    def port(self):
+        if self.httpd is not None:
+            return self.httpd.server_address[1]
+
+    def write(self):
+        try:
+            self.metrics.write_textfile(self.textfile)
+        except (IOError, OSError) as e:
+            log.error('unable to write metrics to %s: %s', self.textfile, e)
+
+    def _write_loop(self):
+        while not self.done.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.done.set()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        for t in self.threads:
+            t.join()
+        if self.textfile:
+            self.write()
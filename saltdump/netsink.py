@@ -0,0 +1,180 @@
+# coding: utf-8
+
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+import urlparse
+
+from .sink import Sink
+
+log = logging.getLogger(__name__)
+
+# how udp records are kept apart in a batch: length, then the record
+RECORD = struct.Struct('>I')
+
+class SocketSinkError(Exception):
+    pass
+
+class SocketSink(Sink):
+    ''' stream output to tcp://host:port or udp://host:port
+
+        Each write() is one record (an event and its newline, as
+        Output.write() hands them over) and is framed as a whole, so
+        formats that take several lines (json, salt) arrive in one piece.
+
+        Over tcp, each batch goes out with as few sends as the socket will
+        take (non-blocking, waiting at most timeout seconds for the socket to
+        drain) on a connection that's re-established whenever it breaks.
+        With octet_counting, every record is framed as "LEN SP MSG" (RFC6587,
+        for syslog receivers that want it) instead of ending with a newline.
+
+        Over udp, records are packed into datagrams of up to max_datagram
+        bytes; with one_per_datagram (RFC5426 syslog) every record is its
+        own datagram.  Each datagram stands alone: a record longer than
+        max_datagram, one the kernel refuses (EMSGSIZE, ECONNREFUSED) or one
+        the socket can't take before the batch's timeout is up is dropped
+        and counted in lost_datagrams, and the rest of the batch still goes
+        out (retrying the batch would repeat what already went out).
+    '''
+
+    def __init__(self, url, octet_counting=False, one_per_datagram=False, max_datagram=8192,
+        timeout=10, **kw):
+
+        u = urlparse.urlparse(url)
+        if u.scheme not in ('tcp', 'udp') or not u.hostname or not u.port:
+            raise SocketSinkError('expected tcp://host:port or udp://host:port, not {0}'.format(url))
+        self.url              = url
+        self.proto            = u.scheme
+        self.addr             = (u.hostname, u.port)
+        self.octet_counting   = octet_counting
+        self.one_per_datagram = one_per_datagram
+        self.max_datagram     = max_datagram
+        self.timeout          = timeout
+        self.lost_datagrams   = 0
+
+        super(SocketSink, self).__init__(**kw)
+
+    def _connect(self):
+        if self.proto == 'tcp':
+            sock = socket.create_connection(self.addr, self.timeout)
+        else:
+            af, st, pr, cn, sa = socket.getaddrinfo(self.addr[0], self.addr[1], 0, socket.SOCK_DGRAM)[0]
+            sock = socket.socket(af, st, pr)
+            sock.connect(sa)
+        sock.setblocking(0)
+        return sock
+
+    def _sendall(self, sock, data):
+        view = memoryview(data)
+        deadline = time.time() + self.timeout
+        while len(view):
+            try:
+                view = view[ sock.send(view): ]
+                continue
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([], [sock], [], remaining)[1]:
+                raise socket.timeout('timed out sending to {0}'.format(self.url))
+
+    def write(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        super(SocketSink, self).write(self.frame(text))
+
+    def frame(self, rec):
+        ''' one record as it's kept in a batch '''
+        msg = rec[:-1] if rec.endswith('\n') else rec
+        if self.proto == 'udp':
+            if self.one_per_datagram:
+                rec = msg
+            return RECORD.pack(len(rec)) + rec
+        if self.octet_counting:
+            return '{0} {1}'.format(len(msg), msg)
+        return rec
+
+    def records(self, data):
+        ''' the records in a udp batch (see frame()) '''
+        pos = 0
+        while pos < len(data):
+            size, = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            yield data[pos:pos+size]
+            pos += size
+
+    def datagrams(self, data):
+        if self.one_per_datagram:
+            for rec in self.records(data):
+                yield rec
+            return
+        dgram = list()
+        size = 0
+        for rec in self.records(data):
+            if dgram and size + len(rec) > self.max_datagram:
+                yield ''.join(dgram)
+                dgram = list()
+                size = 0
+            dgram.append(rec)
+            size += len(rec)
+        if dgram:
+            yield ''.join(dgram)
+
+    def _send_datagram(self, sock, dgram, deadline):
+        ''' send one datagram; None if it went, else why not '''
+        if len(dgram) > self.max_datagram:
+            return 'longer than {0} bytes'.format(self.max_datagram)
+        while True:
+            try:
+                sock.send(dgram)
+                return None
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return e.strerror or str(e)
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([], [sock], [], remaining)[1]:
+                return 'timed out'
+
+    def _transmit(self, sock, data):
+        if self.proto == 'tcp':
+            self._sendall(sock, data)
+            return
+        deadline = time.time() + self.timeout
+        lost = 0
+        for dgram in self.datagrams(data):
+            why = self._send_datagram(sock, dgram, deadline)
+            if why is not None:
+                log.debug('dropped a %d byte datagram to %s: %s', len(dgram), self.url, why)
+                lost += 1
+        if lost:
+            self.lost_datagrams += lost
+            log.warning('dropped %d datagrams to %s (%d so far)', lost, self.url, self.lost_datagrams)
+
+    def deliver(self, data):
+        # try twice: the first send on a connection the far end already
+        # closed is a common way to find out it's gone
+        sock = getattr(self.local, 'sock', None)
+        try:
+            for attempt in range(2):
+                try:
+                    if sock is None:
+                        sock = self._connect()
+                    self._transmit(sock, data)
+                    return True
+                except (socket.error, IOError) as e:
+                    log.info('sending to %s failed (attempt %d): %s', self.url, attempt + 1, e)
+                    if sock is not None:
+                        sock.close()
+                    sock = None
+            return False
+        finally:
+            self.local.sock = sock
+
+    def disconnect(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
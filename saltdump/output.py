@@ -0,0 +1,202 @@
+# coding: utf-8
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+
+from .serial import dumps
+from .archive import archive_record
+from .filter import SubscriptionIndex
+
+log = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('json', 'txt', 'jsonl', 'salt', 'stru', 'hec', 'syslog', 'sqlite')
+RECORD_FORMATS = ('sqlite',) # formats that produce records for their writer rather than text
+
+def format_event(cev, output_format='txt', salt_outputter='nested', **kw):
+    ''' render a classified event (or Job) as text in the given output format
+        (or, for the RECORD_FORMATS, as whatever that format's writer takes)
+
+        any extra keyword arguments are format options (e.g., the hec
+        envelope fields or the syslog facility)
+    '''
+    if output_format == 'json':
+        return cev.json()
+    elif output_format == 'jsonl':
+        return cev.json(indent=0)
+    elif output_format == 'salt':
+        return cev.outputter(default_outputter=salt_outputter)
+    elif output_format == 'stru':
+        return cev.jsonstru
+    elif output_format == 'txt':
+        return cev.short
+    elif output_format == 'hec':
+        return dumps( cev.hec(**kw) )
+    elif output_format == 'syslog':
+        return cev.syslog(**kw)
+    elif output_format == 'sqlite':
+        return archive_record(cev)
+    return u"fmt={0}? {1}".format(output_format, cev.json(indent=0))
+
+output_spec_re = re.compile(r'''^(?P<fmt>[^:]+)
+    (?: : (?P<dest> \w+://[^/:]+(?::\d+)?[^:]* | [^:]* ) )?
+    (?: : (?P<filter>.*) )?$''', re.X)
+
+def parse_output_spec(spec):
+    ''' split FORMAT[:DEST[:FILTER]] into (format, dest, filter)
+
+        DEST is a file name, a url (tcp://host:port, https://splunk:8088/...)
+        or empty/'-' for stdout.  FILTER is a filter expression (see
+        build_filter).  Missing parts come back as None.
+    '''
+    m = output_spec_re.match(spec)
+    if not m or m.group('fmt') not in OUTPUT_FORMATS:
+        raise ValueError('"{0}" is not FORMAT[:DEST[:FILTER]] (FORMAT is one of {1})'.format(
+            spec, ', '.join(OUTPUT_FORMATS)))
+    fmt, dest, tfilter = m.group('fmt', 'dest', 'filter')
+    if dest in ('', '-'):
+        dest = None
+    return fmt, dest, tfilter or None
+
+class Output(object):
+    ''' one of (possibly) several outputs: a format, a filter and a writer '''
+
+    def __init__(self, writer, output_format='txt', tag_filter=None, salt_outputter='nested', format_opts=None):
+        self.writer         = writer
+        self.output_format  = output_format
+        self.tag_filter     = tag_filter
+        self.salt_outputter = salt_outputter
+        self.format_opts    = format_opts or dict()
+
+    def format(self, cev):
+        return format_event(cev, self.output_format, self.salt_outputter, **self.format_opts)
+
+    def render(self, cev):
+        ''' the formatted event, or None if it doesn't pass the filter '''
+        if self.tag_filter is None or self.tag_filter(cev.tag):
+            return self.format(cev)
+
+    def write(self, out):
+        if self.output_format in RECORD_FORMATS:
+            self.writer.write(out)
+        else:
+            self.writer.write( unicode(out) + u'\n' )
+
+    def detached(self):
+        ''' a copy without the writer (e.g., to hand to worker processes) '''
+        return Output(None, self.output_format, self.tag_filter, self.salt_outputter, self.format_opts)
+
+    def __repr__(self):
+        return 'Output({0}, {1}, {2})'.format(self.output_format, self.tag_filter, self.writer)
+
+def output_index(outputs):
+    ''' a SubscriptionIndex of outputs' filters, keyed by their position in outputs '''
+    index = SubscriptionIndex()
+    for i,o in enumerate(outputs):
+        index.add(i, o.tag_filter)
+    return index
+
+def render_outputs(outputs, index, cev):
+    ''' like [ o.render(cev) for o in outputs ], but only the outputs that want
+        cev (according to index, see output_index()) are asked '''
+    wanted = index.match(cev.tag)
+    return [ o.format(cev) if i in wanted else None for i,o in enumerate(outputs) ]
+
+class OutputWriter(object):
+    ''' buffered output with a flush policy
+
+        Text passed to write() is encoded into a preallocated buffer.
+        maybe_flush() writes the buffer out (with as few write syscalls as
+        possible) once flush_bytes have accumulated -- flush_bytes=0 means
+        every time it's called.  With flush_ms, a background thread also
+        makes sure nothing sits in the buffer for longer than that, so a
+        quiet bus doesn't leave output stranded.
+    '''
+
+    def __init__(self, fh=None, flush_bytes=0, flush_ms=None, bufsize=1024*1024):
+        self.fh          = fh if fh is not None else sys.stdout
+        self.flush_bytes = flush_bytes
+        self.flush_ms    = flush_ms
+        self.buf         = bytearray( max(bufsize, flush_bytes) )
+        self.pos         = 0
+        self.first       = None # when the oldest unflushed byte was buffered
+        self.lock        = threading.Lock()
+        self.done        = threading.Event()
+        self.thread      = None
+
+        if flush_ms:
+            self.thread = threading.Thread(target=self._flush_loop, name='OutputWriter')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _send(self, data):
+        # everything leaves through here; subclasses send it elsewhere
+
+        # anything written through the file object itself goes first
+        self.fh.flush()
+        fd = self.fh.fileno()
+        try:
+            while data:
+                n = os.write(fd, data)
+                data = data[n:]
+        except OSError as e:
+            # listen loops treat IOError as "stdout went away" (e.g., a
+            # broken pipe from `saltdump | head`); os.write raises OSError
+            raise IOError(e.errno, e.strerror)
+
+    def _flush(self):
+        if self.pos:
+            self._send( memoryview(self.buf)[:self.pos] )
+            self.pos = 0
+            self.first = None
+
+    def write(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        n = len(text)
+        with self.lock:
+            if self.pos + n > len(self.buf):
+                self._flush()
+                if n > len(self.buf):
+                    self._send(text)
+                    return
+            self.buf[self.pos:self.pos+n] = text
+            self.pos += n
+            if self.first is None:
+                self.first = time.time()
+
+    def maybe_flush(self):
+        if self.pos and self.pos >= self.flush_bytes:
+            with self.lock:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush_loop(self):
+        interval = self.flush_ms / 1000.0
+        while not self.done.is_set():
+            first = self.first
+            if first is None:
+                self.done.wait(interval)
+                continue
+            age = time.time() - first
+            if age < interval:
+                self.done.wait(interval - age)
+                continue
+            try:
+                self.flush()
+            except (IOError, OSError) as e:
+                log.debug('OutputWriter stopped flushing: %s', e)
+                return
+
+    def close(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
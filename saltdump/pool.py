@@ -0,0 +1,58 @@
+# coding: utf-8
+
+import signal
+import logging
+import multiprocessing
+
+from .event import classify_event, event_classes
+from .output import Output, output_index, render_outputs
+
+log = logging.getLogger(__name__)
+
+_worker_opts = {}
+
+def _init_worker(outputs, keep_events):
+    # the parent handles ^C and tears the pool down; workers just die with it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_opts.update(outputs=outputs, keep_events=keep_events, classes=event_classes(),
+        index=output_index(outputs))
+
+def _render(ev):
+    cev = classify_event(ev, _worker_opts['classes'])
+    outs = render_outputs(_worker_opts['outputs'], _worker_opts['index'], cev)
+    if not _worker_opts['keep_events']:
+        cev = None
+    return cev, outs
+
+class RenderPool(object):
+    ''' classify, filter and format batches of raw events in worker processes
+
+        render(events) returns a list of (cev, outs) tuples in the same order
+        as the given events.  outs holds one formatted event per Output (or
+        None where the event didn't pass that output's filter).  cev is only
+        sent back to the parent when keep_events is set (e.g., so a
+        JidCollector can examine it); otherwise it's None.
+    '''
+
+    def __init__(self, workers=None, outputs=None, keep_events=False):
+        if not outputs:
+            outputs = [ Output(None) ]
+        self.workers = workers or multiprocessing.cpu_count()
+        log.debug('starting RenderPool(workers=%d)', self.workers)
+        self.pool = multiprocessing.Pool(self.workers, _init_worker,
+            ([ o.detached() for o in outputs ], keep_events))
+
+    def chunksize(self, n):
+        # hand each worker at least one reasonably sized chunk of the batch
+        return max(1, n // self.workers)
+
+    def render(self, events):
+        if not events:
+            return []
+        return self.pool.map(_render, events, self.chunksize(len(events)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,132 @@
+# coding: utf-8
+
+import os
+import sys
+import time
+import cProfile
+import logging
+import datetime
+import threading
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+class Profiler(object):
+    ''' cProfile for the thread that calls enable(), dumped to fname
+
+        cProfile can only be snapshotted by the thread it's profiling, so
+        maybe_dump() (called from that thread, e.g., between events) dumps
+        the stats so far once every interval seconds; close() dumps them a
+        last time.  The file is in the pstats format (python -m pstats FILE,
+        snakeviz, gprof2dot, ...) and is replaced atomically.
+    '''
+
+    def __init__(self, fname, interval=60):
+        self.fname    = fname
+        self.interval = interval
+        self.prof     = cProfile.Profile()
+        self.last     = time.time()
+
+    def enable(self):
+        self.prof.enable()
+
+    def dump(self):
+        self.prof.disable()
+        try:
+            tmp = '{0}.tmp'.format(self.fname)
+            self.prof.dump_stats(tmp)
+            os.rename(tmp, self.fname)
+            log.debug('dumped profile to %s', self.fname)
+        except (IOError, OSError) as e:
+            log.error('unable to dump profile to %s: %s', self.fname, e)
+        finally:
+            self.last = time.time()
+
+    def maybe_dump(self):
+        if time.time() - self.last >= self.interval:
+            self.dump()
+            self.prof.enable()
+
+    def wrap(self, func):
+        ''' func, but calling maybe_dump() first '''
+        def _wrapped(*a, **kw):
+            self.maybe_dump()
+            return func(*a, **kw)
+        return _wrapped
+
+    def close(self):
+        self.dump()
+
+def _frame_name(frame):
+    co = frame.f_code
+    return '{0} ({1}:{2})'.format(co.co_name, os.path.basename(co.co_filename), co.co_firstlineno)
+
+class Sampler(object):
+    ''' a sampling profiler for one thread, switched on and off by toggle()
+        (e.g., from a signal handler)
+
+        While on, a background thread looks at the profiled thread's stack
+        every interval seconds and counts it; the profiled thread itself
+        isn't slowed down beyond sharing the GIL with a thread that wakes up
+        a few hundred times a second.  It switches itself off after secs
+        seconds, or at the next toggle(), and writes the counted stacks to a
+        new file in outdir in the "folded" format flamegraph.pl and speedscope
+        read: one "outer;...;inner COUNT" line per distinct stack.
+    '''
+
+    def __init__(self, ident=None, outdir='.', secs=30, interval=0.005):
+        self.ident    = ident if ident is not None else threading.current_thread().ident
+        self.outdir   = outdir
+        self.secs     = secs
+        self.interval = interval
+        self.stop     = threading.Event()
+        self.thread   = None
+        self.written  = list() # the files written so far
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def toggle(self):
+        if self.running:
+            log.info('sampling stopped early')
+            self.stop.set()
+        else:
+            self.stop.clear()
+            self.thread = threading.Thread(target=self._run, name='Sampler')
+            self.thread.daemon = True
+            self.thread.start()
+            log.info('sampling for %ds', self.secs)
+
+    def sample(self, counts):
+        frame = sys._current_frames().get(self.ident)
+        stack = list()
+        while frame is not None:
+            stack.append( _frame_name(frame) )
+            frame = frame.f_back
+        if stack:
+            counts[ ';'.join(reversed(stack)) ] += 1
+
+    def _run(self):
+        counts = Counter()
+        deadline = time.time() + self.secs
+        while not self.stop.wait(self.interval) and time.time() < deadline:
+            self.sample(counts)
+        self.write(counts)
+
+    def write(self, counts):
+        fname = os.path.join(self.outdir, 'saltdump-{0}-{1}.folded'.format(os.getpid(),
+            datetime.datetime.now().strftime('%Y%m%dT%H%M%S.%f')))
+        try:
+            with open(fname, 'wb') as fh:
+                for stack,n in counts.most_common():
+                    fh.write('{0} {1}\n'.format(stack, n))
+            self.written.append(fname)
+            log.warning('wrote %d samples to %s', sum(counts.values()), fname)
+        except (IOError, OSError) as e:
+            log.error('unable to write samples to %s: %s', fname, e)
+
+    def close(self):
+        if self.running:
+            self.stop.set()
+            self.thread.join()
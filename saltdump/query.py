@@ -0,0 +1,367 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import re
+import sys
+import gzip
+import json
+import time
+import click
+import fnmatch
+import datetime
+import logging
+import itertools
+import sqlite3
+
+from .filter import build_filter
+from .event import classify_event, event_classes, NA
+from .output import Output, OutputWriter, parse_output_spec, OUTPUT_FORMATS, RECORD_FORMATS
+from .misc import DateParser
+from .stats import SpaceSaving, event_keys
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+log = logging.getLogger(__name__)
+
+class QueryError(Exception):
+    pass
+
+ago_re = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+ago_units = dict(s=1, m=60, h=3600, d=86400, w=7*86400)
+
+def parse_when(when):
+    ''' a time (anything dateutil understands) or an age like 90s, 12h or 7d, as a timestamp '''
+    if when is None:
+        return None
+    m = ago_re.match(when.strip())
+    if m:
+        return time.time() - float(m.group(1)) * ago_units[m.group(2)]
+    try:
+        return DateParser(when).tstamp
+    except (ValueError, OverflowError) as e:
+        raise QueryError('unable to understand "{0}" as a time: {1}'.format(when, e))
+
+def glob_where(col, pattern):
+    ''' col GLOB pattern, plus a range on the pattern's literal prefix so an index on col gets used '''
+    prefix = re.split(r'[*?\[]', pattern, 1)[0]
+    if prefix == pattern:
+        return '{0} = ?'.format(col), [pattern]
+    if not prefix:
+        return '{0} GLOB ?'.format(col), [pattern]
+    upper = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+    return '{0} >= ? AND {0} < ? AND {0} GLOB ?'.format(col), [prefix, upper, pattern]
+
+def is_sqlite(fname):
+    with open(fname, 'rb') as fh:
+        return fh.read(16) == 'SQLite format 3\x00'
+
+def _records(fh, chunk=64*1024):
+    ''' each json value in fh, decoded, however they're laid out: one per
+        line, pretty printed, blank line separated or run together
+    '''
+    dec = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            buf, pos = fh.read(chunk), 0
+            eof = not buf
+            continue
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            # probably cut off at the end of what's been read so far; read
+            # (at least) as much again, so a huge record isn't re-parsed
+            # once per chunk
+            more = fh.read(max(chunk, len(buf) - pos))
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield obj
+        pos = end
+
+def _from_stru(rec):
+    # -o stru renamed tag to path, moved _stamp to time and dropped the
+    # other _ keys; put back what the event classes look at
+    dat = dict(rec.get('data') or dict())
+    if '_stamp' not in dat and isinstance(rec.get('time'), (int, long, float)):
+        dat['_stamp'] = datetime.datetime.utcfromtimestamp(rec['time']).isoformat()
+    ev = dict(tag=rec['path'], data=dat)
+    if rec.get('master'):
+        ev['_master'] = rec['master']
+    return ev
+
+def read_capture(fname):
+    ''' events from a capture file
+
+        Reads the json (-o json, pretty and multi-line), jsonl and stru
+        formats as well as the blank line separated pretty json the replay
+        files use; rotated segments compressed with gz or xz are decompressed
+        on the fly.  Events come back as dicts (already decoded, so
+        classify_event doesn't parse them again); stru records are turned
+        back into events, with the tag from path and a _stamp from time.
+        Anything else is a QueryError.
+    '''
+    if fname.endswith('.gz'):
+        fh = gzip.open(fname, 'rb')
+    elif fname.endswith('.xz'):
+        if lzma is None:
+            raise QueryError('reading {0} needs lzma (try: pip install backports.lzma)'.format(fname))
+        fh = lzma.open(fname, 'rb')
+    else:
+        fh = open(fname, 'rb')
+    with fh:
+        n = 0
+        try:
+            for rec in _records(fh):
+                n += 1
+                if isinstance(rec, dict) and 'tag' in rec:
+                    yield rec
+                elif isinstance(rec, dict) and isinstance(rec.get('path'), basestring) and 'sd_class' in rec:
+                    yield _from_stru(rec)
+                else:
+                    raise QueryError('record {0} of {1} is not a salt event (or a -o stru record)'.format(n, fname))
+        except ValueError as e:
+            raise QueryError('unable to read record {0} of {1} as json: {2}'.format(n + 1, fname, e))
+
+class ArchiveQuery(object):
+    ''' find events in an archive by jid, minion, fun, time and retcode
+
+        Against a sqlite archive (see saltdump.archive), the predicates
+        become a query on the indexed jobs/returns/events tables and only
+        the matching events are read and classified.  Capture files have no
+        indexes, so every event in them is classified and checked.  Either
+        way, the tag filter (if any) is applied to what comes back; scanned
+        counts the events that were classified and returned the ones that
+        passed everything.
+
+        minion and fun are globs; rc is 'ok' or 'fail'.
+    '''
+
+    def __init__(self, fname, jid=None, minion=None, fun=None, since=None, until=None, rc=None,
+        tag_filter=None):
+        if rc not in (None, 'ok', 'fail'):
+            raise QueryError('rc must be ok or fail, not {0}'.format(rc))
+        self.fname      = fname
+        self.jid        = jid
+        self.minion     = minion
+        self.fun        = fun
+        self.since      = parse_when(since)
+        self.until      = parse_when(until)
+        self.rc         = rc
+        self.tag_filter = tag_filter
+        self.scanned    = 0
+        self.returned   = 0
+
+    def sql(self):
+        ''' the query (and its parameters) that picks out the matching event ids and raw json '''
+        where = list()
+        args  = list()
+
+        if self.jid:
+            where.append('e.jid = ?')
+            args.append(self.jid)
+        if self.minion:
+            w,a = glob_where('e.minion_id', self.minion)
+            where.append(w)
+            args.extend(a)
+        if self.since is not None:
+            where.append('e.time >= ?')
+            args.append(self.since)
+        if self.until is not None:
+            where.append('e.time < ?')
+            args.append(self.until)
+
+        if self.rc:
+            rwhere, rargs = [ 'rc_ok = ?' ], [ self.rc == 'ok' ]
+            if self.fun:
+                w,a = glob_where('fun', self.fun)
+                rwhere.append(w)
+                rargs.extend(a)
+            where.append('e.id IN (SELECT event_id FROM returns WHERE {0})'.format(' AND '.join(rwhere)))
+            args.extend(rargs)
+        elif self.fun:
+            w,a = glob_where('fun', self.fun)
+            where.append('e.id IN (SELECT event_id FROM returns WHERE {0}'
+                ' UNION ALL SELECT event_id FROM jobs WHERE {0})'.format(w))
+            args.extend(a + a)
+
+        sql = 'SELECT e.raw FROM events e'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return sql + ' ORDER BY e.id', args
+
+    def explain(self):
+        ''' sqlite's plan for sql() -- which indexes it's going to use '''
+        db = sqlite3.connect(self.fname)
+        try:
+            sql, args = self.sql()
+            return [ row[-1] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, args) ]
+        finally:
+            db.close()
+
+    def _from_sqlite(self):
+        db = sqlite3.connect(self.fname)
+        try:
+            sql, args = self.sql()
+            log.debug('%s %s', sql, args)
+            for (raw,) in db.execute(sql, args):
+                yield raw
+        finally:
+            db.close()
+
+    def matches(self, cev):
+        ''' the jid/minion/fun/time/rc predicates, for events that didn't come out of sql() '''
+        if self.jid and getattr(cev, 'jid', None) != self.jid:
+            return False
+        if self.minion:
+            mid = getattr(cev, 'id', NA)
+            if mid is NA or not fnmatch.fnmatchcase(unicode(mid), self.minion):
+                return False
+        if self.since is not None and not (cev.itime and cev.itime >= self.since):
+            return False
+        if self.until is not None and not (cev.itime and cev.itime < self.until):
+            return False
+        if self.rc:
+            if not hasattr(cev, 'rc_ok') or cev.rc_ok != (self.rc == 'ok'):
+                return False
+        if self.fun:
+            fun = getattr(cev, 'fun', NA)
+            if fun is NA or not fnmatch.fnmatchcase(unicode(fun), self.fun):
+                return False
+        return True
+
+    def __iter__(self):
+        classes = event_classes()
+        indexed = is_sqlite(self.fname)
+        for raw in (self._from_sqlite() if indexed else read_capture(self.fname)):
+            self.scanned += 1
+            cev = classify_event(raw, classes=classes)
+            if not indexed and not self.matches(cev):
+                continue
+            if self.tag_filter is not None and not self.tag_filter(cev.tag):
+                continue
+            self.returned += 1
+            yield cev
+
+
+TOP_FIELDS = ('minion', 'tag', 'fun') # in event_keys() order
+
+def heavy_hitters(events, capacity=1000):
+    ''' SpaceSaving sketches (see saltdump.stats) of the minions, tags and funs in events '''
+    sketches = dict( (f, SpaceSaving(capacity)) for f in TOP_FIELDS )
+    for cev in events:
+        for f,k in zip(TOP_FIELDS, event_keys(cev)):
+            if k is not None:
+                sketches[f].add(k)
+    return sketches
+
+
+@click.command()
+@click.option('--jid', type=str, help='only events for this jid')
+@click.option('-m', '--minion', type=str, help='only events from minions matching this glob')
+@click.option('-f', '--fun', type=str, help='only publishes and returns of functions matching this glob')
+@click.option('--since', type=str, help='only events at or after this time (a date or an age like 30m, 12h, 7d)')
+@click.option('--until', type=str, help='only events before this time (a date or an age like 30m, 12h, 7d)')
+@click.option('--rc', type=click.Choice(('ok', 'fail')), help='only returns that succeeded (ok) or failed (fail)')
+@click.option('-c', '--count', type=int, help='stop after this many events')
+@click.option('-o', '--output-format', default='txt', metavar='FORMAT[:DEST]',
+    help='output format ({0}) and optionally a file to write it to (default: txt)'.format(
+        ', '.join( x for x in OUTPUT_FORMATS if x not in RECORD_FORMATS + ('hec',) )))
+@click.option('-O', '--salt-outputter', type=str, default='nested',
+    help='selected outputter will follow event type where possible and fallback to this (default: nested)')
+@click.option('--top', type=click.Choice(TOP_FIELDS), multiple=True,
+    help='instead of the events, list the most common minions, tags or funs among them (repeatable)')
+@click.option('-n', '--top-n', type=int, default=10,
+    help='with --top, how many to list (default: 10)')
+@click.option('--top-capacity', type=int, default=1000,
+    help='with --top, how many keys the approximate counters track (default: 1000)')
+@click.option('--explain', is_flag=True, default=False,
+    help='print the sqlite query plan instead of running the query')
+@click.option('-q', '--quiet', is_flag=True, default=False,
+    help='do not report the scanned/returned counts on stderr')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.argument('filter', nargs=-1)
+def query(archive, filter, count, output_format, salt_outputter, top, top_n, top_capacity, explain, quiet, level,
+    **predicates):
+    ''' find events in an ARCHIVE: a sqlite database written by -o sqlite or
+        a capture file (-o json, jsonl or stru to a FILE, compressed segments
+        too).
+
+        FILTER (if given) is a glob or logical string of globs for the tags.
+
+        Against a database, the --jid, --minion, --fun, --since, --until and
+        --rc predicates are answered with its indexes; capture files are read
+        from start to finish.  Afterwards, the number of events scanned and
+        the number returned are reported on stderr.
+
+        --top minion|tag|fun lists the most common minions, tags (with jids
+        replaced by *) or funs among the events instead of the events
+        themselves.  The counting is approximate (Space-Saving, in fixed
+        memory); each count is followed by how much too high it might be.
+
+        \b
+        examples:
+          saltdump query events.db --fun 'state.*' --rc fail --since 7d
+          saltdump query events.db --jid 20190412130338123456 -o salt
+          saltdump query events.json.20190412T130338.123456.gz 'salt/auth'
+          saltdump query events.db --since 1h --top minion --top tag
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    try:
+        fmt, dest, tfilter = parse_output_spec(output_format)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='-o')
+    if fmt in RECORD_FORMATS + ('hec',) or tfilter or (dest and '://' in dest):
+        raise click.BadParameter('query writes FORMAT to stdout or a file', param_hint='-o')
+
+    try:
+        q = ArchiveQuery(archive, tag_filter=build_filter(*filter), **predicates)
+        if explain:
+            if not is_sqlite(archive):
+                raise QueryError('{0} is not a sqlite archive, there is no plan but reading all of it'.format(archive))
+            for line in q.explain():
+                print(line)
+            return
+        if top:
+            sketches = heavy_hitters(itertools.islice(q, count), top_capacity)
+            for f in top:
+                print('{0}:'.format(f))
+                for k,c,e in sketches[f].top(top_n):
+                    print(u'  {0:>10} err={1:<8} {2}'.format(c, e, k).encode('utf-8'))
+            if not quiet:
+                sys.stderr.write('scanned {0} events, returned {1}\n'.format(q.scanned, q.returned))
+            return
+        writer = OutputWriter(open(dest, 'ab') if dest else None, flush_bytes=64*1024)
+        o = Output(writer, fmt, salt_outputter=salt_outputter)
+        try:
+            for cev in q:
+                o.write( o.format(cev) )
+                writer.maybe_flush()
+                if count is not None and q.returned >= count:
+                    break
+        finally:
+            writer.close()
+    except (QueryError, sqlite3.Error, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    if not quiet:
+        sys.stderr.write('scanned {0} events, returned {1}\n'.format(q.scanned, q.returned))
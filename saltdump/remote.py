@@ -0,0 +1,383 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import os
+import sys
+import zlib
+import time
+import Queue
+import click
+import select
+import socket
+import struct
+import logging
+import urlparse
+import warnings
+import threading
+from collections import deque
+
+import msgpack
+
+from .master_minion import MasterMinion, ListenLoopMixin, SocketReadPermissionError, JobCachePermissionError
+
+log = logging.getLogger(__name__)
+
+# frame: type, seq, payload length, payload
+FRAME = struct.Struct('>BQI')
+HELLO, RESUME, BATCH, ACK = range(1, 5)
+MAX_FRAME = 256 * 1024 * 1024
+
+class RemoteError(Exception):
+    pass
+
+def parse_tcp_url(url):
+    u = urlparse.urlparse(url)
+    if u.scheme != 'tcp' or u.port is None:
+        raise RemoteError('expected tcp://host:port, not {0}'.format(url))
+    return (u.hostname or '', u.port)
+
+def send_frame(sock, ftype, seq, payload=''):
+    sock.sendall(FRAME.pack(ftype, seq, len(payload)) + payload)
+
+def _recv_exactly(sock, n):
+    chunks = list()
+    while n:
+        data = sock.recv(min(n, 1024*1024))
+        if not data:
+            raise EOFError('connection closed')
+        chunks.append(data)
+        n -= len(data)
+    return ''.join(chunks)
+
+def recv_frame(sock):
+    ftype, seq, size = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    if size > MAX_FRAME:
+        raise RemoteError('frame of {0} bytes is too big'.format(size))
+    return ftype, seq, _recv_exactly(sock, size)
+
+def pack_batch(events, level=1):
+    return zlib.compress(''.join( msgpack.packb(ev, use_bin_type=True) for ev in events ), level)
+
+def unpack_batch(payload):
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(zlib.decompress(payload))
+    return list(unpacker)
+
+class Agent(object):
+    ''' forward raw events to an Aggregator, doing as little work as possible
+
+        Each push() is a batch: its events are msgpack'd, compressed and
+        numbered, then kept until the aggregator acknowledges them.  A
+        sender thread keeps at most window batches in flight; the rest wait
+        in memory (up to max_pending_bytes, after which the oldest are
+        dropped and counted), so a slow aggregator slows down the sender,
+        never the bus reader.
+
+        When the connection breaks, the sender reconnects (backing off up
+        to max_backoff seconds) and says hello again; the aggregator answers
+        with the last batch it got from this agent, and everything after
+        that is sent again.
+    '''
+    window      = 8
+    backoff     = 0.5
+    max_backoff = 30
+
+    def __init__(self, url, name=None, window=None, max_pending_bytes=64*1024*1024, level=1, timeout=30):
+        self.addr              = parse_tcp_url(url)
+        self.url               = url
+        self.name              = name or socket.gethostname()
+        self.session           = '{0}.{1}.{2}'.format(self.name, os.getpid(), int(time.time() * 1000))
+        self.max_pending_bytes = max_pending_bytes
+        self.level             = level
+        self.timeout           = timeout
+        self.pending           = deque() # (seq, frame) not acknowledged yet
+        self.pending_bytes     = 0
+        self.seq               = 0
+        self.acked             = 0
+        self.dropped           = 0 # batches thrown away to stay under max_pending_bytes
+        self.cond              = threading.Condition()
+        self.closing           = threading.Event()
+        self.sock              = None
+        if window is not None:
+            self.window = window
+
+        self.thread = threading.Thread(target=self._send_loop, name='Agent')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def push(self, events):
+        ''' queue a batch of events; always returns True (for listen_batch_loop) '''
+        if not events:
+            return True
+        payload = pack_batch(events, self.level)
+        with self.cond:
+            self.seq += 1
+            self.pending.append( (self.seq, payload) )
+            self.pending_bytes += len(payload)
+            while self.pending_bytes > self.max_pending_bytes and len(self.pending) > 1:
+                seq, old = self.pending.popleft()
+                self.pending_bytes -= len(old)
+                self.dropped += 1
+                log.warning('%s is not keeping up, dropped batch %d', self.url, seq)
+            self.cond.notify_all()
+        return True
+
+    def _ack(self, seq):
+        with self.cond:
+            self.acked = max(self.acked, seq)
+            while self.pending and self.pending[0][0] <= seq:
+                self.pending_bytes -= len(self.pending.popleft()[1])
+            self.cond.notify_all()
+
+    def _connect(self):
+        sock = socket.create_connection(self.addr, self.timeout)
+        send_frame(sock, HELLO, 0, msgpack.packb(dict(name=self.name, session=self.session), use_bin_type=True))
+        ftype, seq, payload = recv_frame(sock)
+        if ftype != RESUME:
+            raise RemoteError('expected RESUME from {0}, got frame type {1}'.format(self.url, ftype))
+        log.info('connected to %s, resuming after batch %d', self.url, seq)
+        self._ack(seq)
+        return sock
+
+    def _run(self, sock):
+        sent = self.acked
+        while True:
+            with self.cond:
+                todo = [ x for x in self.pending if x[0] > sent ][: max(0, self.window - (sent - self.acked)) ]
+                if not todo and not self.pending and self.closing.is_set():
+                    return
+            for seq, payload in todo:
+                send_frame(sock, BATCH, seq, payload)
+                sent = seq
+            # with a full window, wait (a little) for acks; otherwise just
+            # collect the ones that are already here
+            full = sent - self.acked >= self.window
+            while select.select([sock], [], [], 0.05 if full else 0)[0]:
+                ftype, seq, payload = recv_frame(sock)
+                if ftype == ACK:
+                    self._ack(seq)
+                full = False
+            if not full:
+                with self.cond:
+                    if not self.closing.is_set() and not any( x[0] > sent for x in self.pending ):
+                        self.cond.wait(0.05)
+
+    def _send_loop(self):
+        delay = self.backoff
+        while True:
+            try:
+                self.sock = self._connect()
+                delay = self.backoff
+                self._run(self.sock)
+                self.sock.close()
+                return
+            except (socket.error, EOFError, RemoteError, zlib.error) as e:
+                log.info('connection to %s failed: %s (retrying in %0.1fs)', self.url, e, delay)
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+                if self.closing.wait(delay):
+                    return
+                delay = min(delay * 2, self.max_backoff)
+
+    def close(self, timeout=10):
+        ''' send what's pending (for up to timeout seconds) and hang up '''
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.pending and time.time() < deadline:
+                self.cond.wait(0.1)
+            if self.pending:
+                log.warning('%s: giving up on %d unacknowledged batches', self.url, len(self.pending))
+                self.pending.clear()
+        self.closing.set()
+        self.thread.join()
+
+class Aggregator(ListenLoopMixin):
+    ''' receive the batches Agents send and hand their events out through next()
+
+        Every event is tagged with '_master' (the agent's name).  A batch is
+        acknowledged once its events are in the queue; the queue holds at
+        most queue_size events, so when saltdump falls behind the agents are
+        told to wait (they stop sending after a few unacknowledged batches)
+        rather than anything being dropped.  The last batch received from
+        each agent session is remembered, so a reconnecting agent resumes
+        where it left off and batches sent twice are skipped; a session that
+        has had no connection for session_ttl seconds is forgotten (an
+        agent that comes back after that starts over from its oldest
+        pending batch).
+
+        Frames are neither authenticated nor encrypted: anyone who can
+        connect can add events.  With no HOST (tcp://:PORT) only 127.0.0.1
+        is listened on; listen on anything wider only on a network you
+        trust (or behind a tunnel).
+    '''
+
+    def __init__(self, url, queue_size=10000, session_ttl=3600):
+        host, port = parse_tcp_url(url)
+        self.addr        = (host or '127.0.0.1', port)
+        self.queue       = Queue.Queue(maxsize=queue_size)
+        self.session_ttl = session_ttl
+        self.last        = dict() # session -> last batch seq received
+        self.seen        = dict() # session -> when its last connection ended (None while connected)
+        self.conns       = list()
+        self.lock        = threading.Lock()
+        self.closed      = False
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.addr)
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+
+        self.thread = threading.Thread(target=self._accept_loop, name='Aggregator')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return # closed
+            t = threading.Thread(target=self._serve, args=(conn, addr), name='Aggregator-{0}:{1}'.format(*addr))
+            t.daemon = True
+            t.start()
+
+    def expire(self, now=None):
+        ''' forget the sessions nothing has been connected to for session_ttl seconds '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for session,when in self.seen.items():
+                if when is not None and now - when > self.session_ttl:
+                    log.info('forgetting agent session %s', session)
+                    del self.seen[session]
+                    self.last.pop(session, None)
+
+    def _serve(self, conn, addr):
+        with self.lock:
+            self.conns.append(conn)
+        name = '{0}:{1}'.format(*addr)
+        session = None
+        try:
+            ftype, seq, payload = recv_frame(conn)
+            if ftype != HELLO:
+                raise RemoteError('expected HELLO, got frame type {0}'.format(ftype))
+            hello = msgpack.unpackb(payload, raw=False)
+            name, session = hello['name'], hello['session']
+            self.expire()
+            with self.lock:
+                last = self.last.get(session, 0)
+                self.seen[session] = None
+            log.info('agent %s (%s) connected, resuming after batch %d', name, session, last)
+            send_frame(conn, RESUME, last)
+            while True:
+                ftype, seq, payload = recv_frame(conn)
+                if ftype != BATCH:
+                    raise RemoteError('expected BATCH, got frame type {0}'.format(ftype))
+                if seq > last:
+                    for ev in unpack_batch(payload):
+                        ev['_master'] = name
+                        self.queue.put(ev) # blocks (and so stops the acks) when we're behind
+                    last = seq
+                    with self.lock:
+                        self.last[session] = seq
+                send_frame(conn, ACK, seq)
+        except (socket.error, EOFError) as e:
+            log.info('agent %s went away: %s', name, e)
+        except (RemoteError, zlib.error, ValueError, KeyError, TypeError) as e:
+            log.error('agent %s sent something strange: %s', name, e)
+        finally:
+            with self.lock:
+                if conn in self.conns:
+                    self.conns.remove(conn)
+                if session in self.seen:
+                    self.seen[session] = time.time()
+            conn.close()
+
+    def disconnect_all(self):
+        ''' hang up on every agent (they'll reconnect and resume) '''
+        with self.lock:
+            for conn in self.conns:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def next(self, no_block=False):
+        if self.closed and self.queue.empty():
+            return 'FIN'
+        try:
+            return self.queue.get(block=not no_block, timeout=None if no_block else 1.0)
+        except Queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self.thread.join()
+        self.disconnect_all()
+
+
+@click.command()
+@click.option('-c', '--connect', 'url', type=str, required=True, metavar='tcp://HOST:PORT',
+    help='the aggregator to forward events to (saltdump --aggregate ...)')
+@click.option('-n', '--name', type=str, default=socket.gethostname(),
+    help='what to call this master on the aggregator (default: the hostname)')
+@click.option('--window', type=int, default=8,
+    help='batches to send before waiting for the aggregator to acknowledge them (default: 8)')
+@click.option('--max-pending-mb', type=int, default=64,
+    help='memory for batches the aggregator has not acknowledged; past this the oldest are dropped (default: 64)')
+@click.option('--batch-size', type=int, default=500,
+    help='forward at most this many events per batch (default: 500)')
+@click.option('--batch-wait', type=float, default=0.2,
+    help='stop collecting a batch after this many seconds (default: 0.2)')
+@click.option('-S', '--no-sudo-root', is_flag=True, default=False,
+    help='by default, if saltdump cannot read the salt sockets or configs, it'
+    ' will try to switch to root with sudo')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+def agent(url, name, window, max_pending_mb, batch_size, batch_wait, no_sudo_root, level):
+    ''' read the salt event bus and forward the events, as they are, to a
+        saltdump aggregator (saltdump --aggregate tcp://HOST:PORT) which does
+        the classification, job tracking and output.
+
+        Events are forwarded in compressed batches of msgpack.  At most
+        --window batches are in flight; if the aggregator is unreachable the
+        agent keeps reconnecting and resumes with the first batch the
+        aggregator didn't get.
+
+        \b
+        examples:
+          saltdump agent -c tcp://collector:4510
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    try:
+        fwd = Agent(url, name=name, window=window, max_pending_bytes=max_pending_mb * 1024 * 1024)
+    except RemoteError as e:
+        raise click.BadParameter(str(e), param_hint='--connect')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            mm = MasterMinion()
+            mm.listen_batch_loop(fwd.push, max_events=batch_size, max_wait=batch_wait)
+        except (JobCachePermissionError, SocketReadPermissionError) as e:
+            if not no_sudo_root:
+                uid = os.getuid()
+                if uid > 0:
+                    log.error('%s; uid=%d > 0, switching to root', e, uid)
+                    os.execvp('sudo', ['sudo'] + sys.argv)
+            sys.stderr.write("FATAL: {0}\n".format(e))
+            sys.exit(1)
+        finally:
+            fwd.close()
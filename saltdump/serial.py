@@ -0,0 +1,81 @@
+# coding: utf-8
+
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+class JSONSerializer(object):
+    ''' stdlib json; always available and the fallback for everything else '''
+    name = 'json'
+
+    def __init__(self):
+        self.mod = json
+
+    def _dumps(self, obj, indent=None):
+        kw = dict()
+        if indent:
+            kw['indent'] = indent
+        return json.dumps(obj, **kw)
+
+    def dumps(self, obj, indent=None):
+        try:
+            return self._dumps(obj, indent=indent)
+        except (TypeError, ValueError, OverflowError) as e:
+            if self.mod is json:
+                raise
+            # the fast encoders are pickier about odd types (and huge ints)
+            # than the stdlib is, so give stdlib a crack at it
+            log.debug('%s failed to encode (%s), falling back to stdlib json', self.name, e)
+            return JSONSerializer._dumps(self, obj, indent=indent)
+
+class SimpleJSONSerializer(JSONSerializer):
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+        self.mod = simplejson
+
+    def _dumps(self, obj, indent=None):
+        kw = dict()
+        if indent:
+            kw['indent'] = indent
+        return self.mod.dumps(obj, **kw)
+
+class UJSONSerializer(JSONSerializer):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.mod = ujson
+
+    def _dumps(self, obj, indent=None):
+        # ujson escapes / by default, which makes every tag look awful
+        return self.mod.dumps(obj, indent=indent or 0, escape_forward_slashes=False)
+
+SERIALIZERS = (UJSONSerializer, SimpleJSONSerializer, JSONSerializer)
+SERIALIZER_NAMES = ('auto',) + tuple( x.name for x in SERIALIZERS )
+
+SERIALIZER = None
+
+def set_serializer(name='auto'):
+    ''' pick the JSON encoder used by Event.json(), Job.json() and jsonstru
+
+        'auto' picks the fastest one that's installed
+    '''
+    global SERIALIZER
+    for cls in SERIALIZERS:
+        if name in ('auto', cls.name):
+            try:
+                SERIALIZER = cls()
+                break
+            except ImportError:
+                if name != 'auto':
+                    raise
+    log.debug('using %s for json serialization', SERIALIZER.name)
+    return SERIALIZER
+
+def dumps(obj, indent=None):
+    if SERIALIZER is None:
+        set_serializer()
+    return SERIALIZER.dumps(obj, indent=indent)
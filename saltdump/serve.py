@@ -0,0 +1,283 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import os
+import sys
+import stat
+import Queue
+import click
+import socket
+import logging
+import threading
+import warnings
+
+from .filter import build_filter, SubscriptionIndex
+from .event import classify_many
+from .output import format_event, OUTPUT_FORMATS, RECORD_FORMATS
+from .master_minion import MasterMinion, SocketReadPermissionError, JobCachePermissionError
+
+log = logging.getLogger(__name__)
+
+SERVE_FORMATS = tuple( x for x in OUTPUT_FORMATS if x not in RECORD_FORMATS + ('hec',) )
+
+class ServeError(Exception):
+    pass
+
+def parse_subscription(line):
+    ''' a client's "FORMAT [FILTER]" line as (format, filter) '''
+    parts = line.strip().split(None, 1)
+    if not parts or parts[0] not in SERVE_FORMATS:
+        raise ServeError('expected "FORMAT [FILTER]" (FORMAT is one of {0})'.format(', '.join(SERVE_FORMATS)))
+    try:
+        return parts[0], build_filter(*parts[1:])
+    except Exception as e:
+        raise ServeError('bad filter "{0}": {1}'.format(parts[1], e))
+
+class Client(object):
+    ''' one subscriber: its format, its filter and a bounded queue of lines on their way to it '''
+
+    def __init__(self, server, conn, queue_size):
+        self.server  = server
+        self.conn    = conn
+        self.queue   = Queue.Queue(maxsize=queue_size)
+        self.fmt     = None
+        self.filter  = None
+        self.sent    = 0 # events sent
+        self.dropped = 0 # events thrown away because the queue was full
+        self.thread  = threading.Thread(target=self._run, name='Client')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _handshake(self):
+        self.conn.settimeout(self.server.handshake_timeout)
+        line = self.conn.makefile('rb').readline(4096)
+        self.fmt, self.filter = parse_subscription(line)
+        self.conn.settimeout(self.server.send_timeout)
+
+    def put(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except Queue.Full:
+            if not self.dropped:
+                log.warning('%s is not keeping up, dropping events', self)
+            self.dropped += 1
+
+    def _run(self):
+        try:
+            try:
+                self._handshake()
+            except (ServeError, socket.error) as e:
+                log.info('%s failed to subscribe: %s', self, e)
+                self.conn.sendall('ERR {0}\n'.format(e))
+                return
+            self.server.add(self)
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    return
+                self.conn.sendall(data)
+                self.sent += 1
+        except socket.error as e:
+            log.info('%s went away: %s', self, e)
+        finally:
+            self.server.remove(self)
+            self.conn.close()
+
+    def close(self, timeout=None):
+        # the sentinel has to get in even when the queue is full
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                break
+            except Queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except Queue.Empty:
+                    pass
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.conn.shutdown(socket.SHUT_RDWR)
+            self.thread.join()
+
+    def __repr__(self):
+        return 'Client({0}, {1}, sent={2}, dropped={3})'.format(self.fmt, self.filter, self.sent, self.dropped)
+
+class FanoutServer(object):
+    ''' publish events to many subscribers on a unix socket
+
+        A client connects to path and sends one line, "FORMAT [FILTER]",
+        choosing any text output format and a filter expression (see
+        build_filter) -- it then receives the events that pass its filter,
+        each followed by a newline, until it hangs up (txt, jsonl, stru and
+        syslog are one line per event; json and salt events span several
+        lines).  Filters are evaluated here (through a SubscriptionIndex, so
+        thousands of them are cheap) and each event is formatted once per
+        format in use, however many clients want it.
+
+        Every client has a queue of up to queue_size events and its own
+        thread to send them.  A client that falls behind has events dropped
+        (and counted) rather than holding up publish() or the other clients;
+        one that takes nothing at all for send_timeout seconds is hung up on.
+    '''
+    handshake_timeout = 10
+    send_timeout      = 60
+    close_timeout     = 5
+
+    def __init__(self, path, queue_size=10000, mode=0o660, salt_outputter='nested'):
+        self.path           = path
+        self.queue_size     = queue_size
+        self.salt_outputter = salt_outputter
+        self.clients        = list()
+        self.index          = SubscriptionIndex() # client filters
+        self.lock           = threading.Lock()
+
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise ServeError('{0} exists and is not a socket'.format(path))
+            os.unlink(path) # left over from a saltdump serve that didn't clean up
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        os.chmod(path, mode)
+        self.sock.listen(64)
+
+        self.thread = threading.Thread(target=self._accept_loop, name='FanoutServer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return # closed
+            Client(self, conn, self.queue_size)
+
+    def add(self, client):
+        log.info('%s subscribed', client)
+        with self.lock:
+            self.clients = self.clients + [client]
+            self.index.add(client, client.filter)
+
+    def remove(self, client):
+        with self.lock:
+            if client in self.clients:
+                log.info('%s unsubscribed', client)
+                self.clients = [ x for x in self.clients if x is not client ]
+                self.index.remove(client)
+
+    def publish(self, cev):
+        ''' queue a classified event for every client whose filter it passes '''
+        with self.lock:
+            clients = self.index.match(cev.tag)
+        out = dict() # format -> formatted event
+        for client in clients:
+            if client.fmt not in out:
+                out[client.fmt] = (unicode(format_event(cev, client.fmt, self.salt_outputter)) + u'\n').encode('utf-8')
+            client.put(out[client.fmt])
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR) # wakes up accept()
+        except socket.error:
+            pass
+        self.sock.close()
+        self.thread.join()
+        for client in list(self.clients):
+            client.close(self.close_timeout)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def _lines(sock):
+    try:
+        for line in sock.makefile('rb'):
+            if line.startswith('ERR '):
+                raise ServeError(line[4:].strip())
+            yield line.rstrip('\n')
+    finally:
+        sock.close()
+
+def subscribe(path, fmt='jsonl', *tfilter):
+    ''' subscribe to saltdump serve on path; returns a generator of the lines it sends
+        (one per event for the one line formats, like the default jsonl) '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall('{0} {1}\n'.format(fmt, ' '.join(tfilter)))
+    return _lines(sock)
+
+
+@click.command()
+@click.option('-s', '--socket', 'path', type=click.Path(dir_okay=False), default='/var/run/saltdump.sock',
+    help='the unix socket to serve on (default: /var/run/saltdump.sock)')
+@click.option('-m', '--mode', type=str, default='0660',
+    help='permissions for the socket, in octal (default: 0660)')
+@click.option('--queue-size', type=int, default=10000,
+    help='events to hold for a client that falls behind before dropping them (default: 10000)')
+@click.option('--batch-size', type=int, default=100,
+    help='process at most this many events at once (default: 100)')
+@click.option('--batch-wait', type=float, default=0.1,
+    help='stop draining a batch after this many seconds (default: 0.1)')
+@click.option('-O', '--salt-outputter', type=str, default='nested',
+    help='selected outputter will follow event type where possible and fallback to this (default: nested)')
+@click.option('-S', '--no-sudo-root', is_flag=True, default=False,
+    help='by default, if saltdump cannot read the salt sockets or configs, it'
+    ' will try to switch to root with sudo')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+def serve(path, mode, queue_size, batch_size, batch_wait, salt_outputter, no_sudo_root, level):
+    ''' subscribe to the salt event bus once and serve the events to any
+        number of local clients over a unix socket.
+
+        A client connects and sends one line: an output format, optionally
+        followed by a filter expression (just like saltdump's FILTER).  It
+        then receives every event that passes the filter, formatted as
+        asked and followed by a newline: txt, jsonl, stru and syslog are one
+        line per event, json and salt take several.  Filters are evaluated
+        by the server.  Each client has its own queue (--queue-size events);
+        when a client falls that far behind, events for it are dropped
+        instead of slowing down everyone else.
+
+        \b
+        examples:
+          saltdump serve -s /tmp/saltdump.sock &
+          echo 'stru salt/job/* and not salt/auth' | socat - UNIX-CONNECT:/tmp/saltdump.sock
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    try:
+        mode = int(mode, 8)
+    except ValueError:
+        raise click.BadParameter('expected an octal mode like 0660', param_hint='--mode')
+
+    try:
+        mm = MasterMinion()
+    except (JobCachePermissionError, SocketReadPermissionError) as e:
+        if not no_sudo_root:
+            uid = os.getuid()
+            if uid > 0:
+                log.error('%s; uid=%d > 0, switching to root', e, uid)
+                os.execvp('sudo', ['sudo'] + sys.argv)
+        sys.stderr.write("FATAL: {0}\n".format(e))
+        sys.exit(1)
+
+    try:
+        server = FanoutServer(path, queue_size=queue_size, mode=mode, salt_outputter=salt_outputter)
+    except (ServeError, socket.error, OSError) as e:
+        raise click.ClickException('unable to serve on {0}: {1}'.format(path, e))
+
+    def publish(evs):
+        for cev in classify_many(evs):
+            server.publish(cev)
+        return True
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            mm.listen_batch_loop(publish, max_events=batch_size, max_wait=batch_wait)
+        finally:
+            server.close()
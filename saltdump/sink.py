@@ -0,0 +1,152 @@
+# coding: utf-8
+
+import time
+import Queue
+import logging
+import threading
+
+from .output import OutputWriter
+
+log = logging.getLogger(__name__)
+
+class Sink(OutputWriter):
+    ''' base class for outputs that deliver their batches over the network
+
+        Output is collected exactly like OutputWriter collects it (up to
+        flush_bytes or flush_ms, whichever comes first); each flush is a
+        batch and subclasses implement deliver(batch), returning True when
+        the far end took it.  Sink itself can't be built: a class without
+        its own deliver() is a TypeError, not a sink that drops everything.
+
+        Without a spool, batches go through a small queue to a few sender
+        threads and a batch that can't be delivered is logged and dropped.
+        With a spool (see saltdump.spool.Spool), batches are appended to the
+        spool instead -- the listener never waits on the network -- and a
+        single drainer delivers them in order, backing off and retrying until
+        the far end comes back.
+    '''
+    senders     = 1
+    backoff     = 0.5
+    max_backoff = 30
+    report_secs = 60
+
+    def __init__(self, spool=None, senders=None, flush_bytes=64*1024, flush_ms=1000,
+        backoff=None, max_backoff=None, drain_timeout=10, **kw):
+
+        if self.__class__.deliver.__func__ is Sink.deliver.__func__:
+            raise TypeError('{0} does not implement deliver()'.format(self.__class__.__name__))
+        if senders is not None:
+            self.senders = senders
+        if backoff is not None:
+            self.backoff = backoff
+        if max_backoff is not None:
+            self.max_backoff = max_backoff
+        self.spool         = spool
+        self.drain_timeout = drain_timeout
+        self.delivered     = 0 # batches the far end took
+        self.dropped       = 0 # batches given up on
+        self.local         = threading.local() # per sender thread state (e.g., connections)
+        self.closing       = threading.Event()
+        self.queue         = None
+
+        if spool is not None:
+            self.threads = [ threading.Thread(target=self._drain_loop, name=self.__class__.__name__) ]
+        else:
+            self.queue = Queue.Queue(maxsize=self.senders * 2)
+            self.threads = [ threading.Thread(target=self._send_loop, name='{0}-{1}'.format(self.__class__.__name__, i))
+                for i in range(self.senders) ]
+        for t in self.threads:
+            t.daemon = True
+            t.start()
+
+        super(Sink, self).__init__(flush_bytes=flush_bytes, flush_ms=flush_ms, **kw)
+
+    def deliver(self, data):
+        ''' send one batch (bytes) to the far end; True when it took it
+            (every subclass has its own, see HECSink and SocketSink) '''
+        raise NotImplementedError('{0}.deliver()'.format(self.__class__.__name__))
+
+    def disconnect(self):
+        ''' called by each sender thread as it exits (e.g., to close its connection) '''
+        pass
+
+    def _send(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        if self.spool is not None:
+            self.spool.append(data)
+        else:
+            self.queue.put(data)
+
+    def _deliver(self, data):
+        try:
+            return self.deliver(data)
+        except Exception as e:
+            log.exception('%s.deliver() failed: %s', self.__class__.__name__, e)
+            return False
+
+    def _send_loop(self):
+        while True:
+            data = self.queue.get()
+            try:
+                if data is None:
+                    self.disconnect()
+                    return
+                if self._deliver(data):
+                    self.delivered += 1
+                else:
+                    log.error('%s giving up on a batch of %d bytes', self.__class__.__name__, len(data))
+                    self.dropped += 1
+            finally:
+                self.queue.task_done()
+
+    def _drain_loop(self):
+        try:
+            self._drain()
+        finally:
+            self.disconnect()
+
+    def _drain(self):
+        delay = self.backoff
+        give_up = None
+        last_report = time.time()
+        while True:
+            if self.closing.is_set():
+                if give_up is None:
+                    give_up = time.time() + self.drain_timeout
+                if time.time() > give_up or not self.spool.records:
+                    return
+
+            if time.time() - last_report > self.report_secs and self.spool.records:
+                log.info('%s spool: %s', self.__class__.__name__, self.spool.stats())
+                last_report = time.time()
+
+            data = self.spool.peek(timeout=0.25)
+            if data is None:
+                continue
+            if self._deliver(data):
+                self.spool.ack()
+                self.delivered += 1
+                delay = self.backoff
+            elif self.closing.is_set():
+                return # it'll still be in the spool next time
+            else:
+                log.info('%s delivery failed, %d batches spooled, retrying in %0.1fs',
+                    self.__class__.__name__, self.spool.records, delay)
+                self.closing.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def close(self):
+        super(Sink, self).close()
+        self.closing.set()
+        if self.queue is not None:
+            for t in self.threads:
+                self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = list()
+        if self.spool is not None:
+            if self.spool.records:
+                log.warning('%s leaving %d undelivered batches in the spool', self.__class__.__name__,
+                    self.spool.records)
+            self.spool.close()
@@ -0,0 +1,225 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import gc
+import sys
+import json
+import time
+import click
+import logging
+import datetime
+import resource
+import warnings
+from collections import Counter
+
+from .master_minion import ListenLoopMixin
+from .synth import Fleet
+
+log = logging.getLogger(__name__)
+
+def rss_bytes():
+    ''' this process's current resident set size '''
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        # no /proc: the peak is the best we can do
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def object_counts():
+    ''' gc-tracked objects by type name '''
+    return Counter( type(o).__name__ for o in gc.get_objects() )
+
+def slope(points):
+    ''' least squares slope of [(x, y), ...] '''
+    n = float(len(points))
+    if n < 2:
+        return 0.0
+    mx = sum( x for x,y in points ) / n
+    my = sum( y for x,y in points ) / n
+    sxx = sum( (x - mx) ** 2 for x,y in points )
+    if not sxx:
+        return 0.0
+    return sum( (x - mx) * (y - my) for x,y in points ) / sxx
+
+class FleetSource(ListenLoopMixin):
+    ''' count events from a Fleet, then 'FIN', as a MasterMinion-ish next()
+
+        The events are stamped 1ms apart (no sleeping) and every
+        sample_every events sample() is called.
+    '''
+
+    def __init__(self, fleet, count, sample_every, sample):
+        self.fleet        = fleet
+        self.count        = count
+        self.sample_every = sample_every
+        self.sample       = sample
+        self.n            = 0
+        self.when         = datetime.datetime.now()
+        self.step         = datetime.timedelta(milliseconds=1)
+
+    def next(self, no_block=False):
+        if self.n >= self.count:
+            return 'FIN'
+        if self.n % self.sample_every == 0:
+            self.sample(self.n)
+        self.n += 1
+        self.when += self.step
+        return self.fleet.next_event(self.when)
+
+class Soak(object):
+    ''' push count synthetic events through a CmdRunner (built from the
+        saltdump options in opt) and watch its memory
+
+        Every sample_every events the RSS and the number of gc-tracked
+        objects are sampled.  Once warmup (a fraction of count) events have
+        gone by, memory should be flat: verdict() fits a line through the
+        later samples and complains when RSS grows by more than
+        max_rss_mb or the object count by more than max_objects per million
+        events.  The object counts by type at the start and end of the
+        steady state show what's piling up.
+    '''
+
+    def __init__(self, opt, count=1000000, sample_every=20000, warmup=0.2, fleet=None,
+        max_rss_mb=20.0, max_objects=50000, progress=None):
+        self.count        = count
+        self.sample_every = sample_every
+        self.warmup       = int(count * warmup)
+        self.max_rss_mb   = max_rss_mb
+        self.max_objects  = max_objects
+        self.progress     = progress
+        self.fleet        = fleet or Fleet()
+        self.samples      = list() # (events, seconds, rss bytes, objects)
+        self.types        = list() # (events, object_counts()) at the start and end of the steady state
+        self.start        = None
+
+        from .cmd import CmdRunner # not at the top: cmd imports us for main()
+        soak = self
+        class SoakRunner(CmdRunner):
+            def open_source(self):
+                return FleetSource(soak.fleet, count, sample_every, soak.sample)
+        self.runner = SoakRunner(**opt)
+
+    def sample(self, n):
+        gc.collect()
+        counts = object_counts()
+        s = (n, time.time() - self.start, rss_bytes(), sum(counts.values()))
+        self.samples.append(s)
+        if n >= self.warmup:
+            self.types[ min(len(self.types), 1): ] = [ (n, counts) ]
+        if self.progress:
+            self.progress(*s)
+
+    def run(self):
+        self.start = time.time()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.runner.listen_loop()
+        self.sample(self.runner.mm.n)
+        return self.verdict()
+
+    def steady(self):
+        return [ s for s in self.samples if s[0] >= self.warmup ]
+
+    def growth(self):
+        ''' (rss MiB, objects) per million events in the steady state '''
+        steady = self.steady()
+        rss = slope([ (n, r) for n,t,r,o in steady ]) * 1e6 / 1024 / 1024
+        objs = slope([ (n, o) for n,t,r,o in steady ]) * 1e6
+        return rss, objs
+
+    def growing_types(self, n=10):
+        ''' the types with the most added objects over the steady state '''
+        if len(self.types) < 2:
+            return []
+        (n0, c0), (n1, c1) = self.types[0], self.types[-1]
+        diff = Counter( dict( (k, c1[k] - c0.get(k, 0)) for k in c1 ) )
+        return [ (k, v) for k,v in diff.most_common(n) if v > 0 ]
+
+    def verdict(self):
+        ''' a list of complaints; empty means memory stayed flat '''
+        if len(self.steady()) < 3:
+            return [ 'too few samples after warmup to tell (lower --sample-every or raise --events)' ]
+        rss, objs = self.growth()
+        ret = list()
+        if self.max_rss_mb is not None and rss > self.max_rss_mb:
+            ret.append('RSS grew {0:.2f} MiB per million events (limit {1})'.format(rss, self.max_rss_mb))
+        if self.max_objects is not None and objs > self.max_objects:
+            ret.append('gc objects grew {0:.0f} per million events (limit {1}); most added: {2}'.format(objs,
+                self.max_objects, ', '.join( '{0}+{1}'.format(k,v) for k,v in self.growing_types(5) )))
+        return ret
+
+    def report(self):
+        rss, objs = self.growth() if len(self.steady()) >= 2 else (None, None)
+        return dict(events=self.count, warmup=self.warmup, samples=self.samples,
+            rss_mb_per_million=rss, objects_per_million=objs, growing_types=self.growing_types(20),
+            verdict=self.verdict())
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.option('-n', '--events', type=int, default=1000000, help='how many events to push through (default: 1000000)')
+@click.option('--sample-every', type=int, default=20000, help='sample memory every this many events (default: 20000)')
+@click.option('--warmup', type=float, default=0.2,
+    help='ignore this fraction of the run while caches and job tracking fill up (default: 0.2)')
+@click.option('--max-rss-mb', type=float, default=20.0,
+    help='fail if RSS grows more than this many MiB per million events after warmup (default: 20)')
+@click.option('--max-objects', type=int, default=50000,
+    help='fail if gc objects grow by more than this many per million events after warmup (default: 50000)')
+@click.option('--minions', type=int, default=1000, help='fleet size (default: 1000)')
+@click.option('--states', type=int, default=10, help='states per state.apply return (default: 10)')
+@click.option('--seed', type=int, default=0, help='random seed (default: 0)')
+@click.option('--report', type=click.Path(dir_okay=False), metavar='FILE',
+    help='write the samples and the verdict to FILE as json')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+@click.argument('saltdump_args', nargs=-1, type=click.UNPROCESSED)
+def soak(events, sample_every, warmup, max_rss_mb, max_objects, minions, states, seed, report, level, saltdump_args):
+    ''' push millions of synthetic events (see saltdump synth) through
+        saltdump and fail if its memory keeps growing.
+
+        SALTDUMP_ARGS are saltdump options (after a --), picking the mode to
+        soak; the default is -j -o stru:/dev/null.  Events come straight
+        from the generator, not from a bus, as fast as saltdump takes them.
+
+        RSS and the number of gc-tracked objects are sampled every
+        --sample-every events.  After --warmup, both should be flat: if a
+        line through the samples climbs faster than --max-rss-mb or
+        --max-objects per million events, the types that piled up are
+        listed and saltdump soak exits non-zero.
+
+        \b
+        examples:
+          saltdump soak -n 5000000
+          saltdump soak -n 2000000 -- -j --stats 60 --latency /dev/null -o stru:/dev/null -o sqlite:/tmp/soak.db
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    from .cmd import saltdump, set_serializer
+    args = list(saltdump_args) or ['-j', '-o', 'stru:/dev/null']
+    ctx = saltdump.make_context('saltdump', args)
+    opt = dict(ctx.params)
+    for k in ('version', 'level', 'no_sudo_root', 'json_encoder'):
+        opt.pop(k)
+    set_serializer(ctx.params['json_encoder'])
+
+    def progress(n, secs, rss, objs):
+        sys.stderr.write('{0:>10} events {1:>8.1f}s {2:>8.1f} MiB {3:>9} objects\n'.format(
+            n, secs, rss / 1024.0 / 1024, objs))
+
+    s = Soak(opt, count=events, sample_every=sample_every, warmup=warmup, fleet=Fleet(minions, states=states, seed=seed),
+        max_rss_mb=max_rss_mb, max_objects=max_objects, progress=progress)
+    complaints = s.run()
+
+    rss, objs = s.growth()
+    print('after warmup: {0:+.3f} MiB and {1:+.0f} objects per million events'.format(rss, objs))
+    for k,v in s.growing_types():
+        print('  {0:>8} {1}'.format('+{0}'.format(v), k))
+    if report:
+        with open(report, 'w') as fh:
+            json.dump(s.report(), fh, indent=2)
+    if complaints:
+        raise click.ClickException('; '.join(complaints))
@@ -0,0 +1,218 @@
+# coding: utf-8
+
+import os
+import time
+import zlib
+import glob
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+class SpoolError(Exception):
+    pass
+
+class Spool(object):
+    ''' a durable fifo of byte strings kept in segment files in a directory
+
+        Records are appended to the newest segment (length, crc32 and a
+        timestamp, then the data) and fsync'd on every append, which is a
+        group commit of however many events the caller put in the record.
+        Segments roll over at segment_bytes; once the spool holds more than
+        max_bytes the oldest segments are thrown away (and counted in
+        dropped).
+
+        peek() hands back the oldest record without removing it and ack()
+        removes it, so a record that couldn't be delivered stays put.  The
+        read position lives in a small cursor file, so a restarted saltdump
+        picks up where the last one left off (at least once: a record may be
+        delivered again if saltdump dies between delivering it and ack()).
+    '''
+
+    header = struct.Struct('>IId') # length, crc32, stamp
+
+    def __init__(self, path, segment_bytes=16*1024*1024, max_bytes=512*1024*1024):
+        self.path          = path
+        self.segment_bytes = segment_bytes
+        self.max_bytes     = max(max_bytes, segment_bytes)
+        self.cond          = threading.Condition()
+        self.dropped       = 0 # records thrown away to stay under max_bytes
+        self.segs          = OrderedDict() # seq -> [records, bytes] still to be read
+        self.head          = None
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        rseq, roff = self._load_cursor()
+        for fname in sorted(glob.glob(os.path.join(path, '*.seg'))):
+            seq = int(os.path.basename(fname)[:-4])
+            if seq < rseq:
+                os.unlink(fname)
+                continue
+            self.segs[seq] = self._scan(seq, roff if seq == rseq else 0)
+
+        if not self.segs:
+            self.segs[rseq] = [0, 0]
+            roff = 0
+        elif next(iter(self.segs)) != rseq:
+            rseq, roff = next(iter(self.segs)), 0
+
+        self.rseq = rseq
+        self.roff = roff
+        self.rfh  = open(self._fname(rseq), 'ab+')
+        self.rfh.seek(roff)
+
+        self.wseq = next(reversed(self.segs))
+        self.wfh  = open(self._fname(self.wseq), 'ab')
+
+        if self.records:
+            log.info('spool %s has %d records (%d bytes) left over', path, self.records, self.bytes)
+
+    def _fname(self, seq):
+        return os.path.join(self.path, '{0:016d}.seg'.format(seq))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, 'cursor'), 'r') as fh:
+                seq, off = fh.read().split()
+                return int(seq), int(off)
+        except (IOError, OSError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self):
+        cname = os.path.join(self.path, 'cursor')
+        with open(cname + '.tmp', 'w') as fh:
+            fh.write('{0} {1}\n'.format(self.rseq, self.roff))
+        os.rename(cname + '.tmp', cname)
+
+    def _read(self, fh):
+        h = fh.read(self.header.size)
+        if len(h) < self.header.size:
+            return None
+        size, crc, stamp = self.header.unpack(h)
+        data = fh.read(size)
+        if len(data) < size or zlib.crc32(data) & 0xffffffff != crc:
+            return None
+        return stamp, data
+
+    def _scan(self, seq, offset):
+        ''' count the records after offset; chop off a torn write at the end '''
+        records = 0
+        with open(self._fname(seq), 'rb+') as fh:
+            fh.seek(offset)
+            good = offset
+            while True:
+                rec = self._read(fh)
+                if rec is None:
+                    break
+                records += 1
+                good = fh.tell()
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() > good:
+                log.warning('truncating torn record at the end of %s', self._fname(seq))
+                fh.truncate(good)
+        return [records, good - offset]
+
+    # cond is an RLock underneath, so these work from inside it too
+
+    @property
+    def records(self):
+        with self.cond:
+            return sum( x[0] for x in self.segs.values() )
+
+    @property
+    def bytes(self):
+        with self.cond:
+            return sum( x[1] for x in self.segs.values() )
+
+    @property
+    def age(self):
+        ''' seconds since the oldest record was spooled (0 when empty) '''
+        with self.cond:
+            head = self._peek()
+            return time.time() - head[0] if head else 0
+
+    def stats(self):
+        with self.cond:
+            return dict(records=self.records, bytes=self.bytes, segments=len(self.segs),
+                dropped=self.dropped, age=self.age)
+
+    def append(self, data, stamp=None):
+        rec = self.header.pack(len(data), zlib.crc32(data) & 0xffffffff, stamp or time.time()) + data
+        with self.cond:
+            if self.segs[self.wseq][1] and self.segs[self.wseq][1] + len(rec) > self.segment_bytes:
+                self._roll()
+            self.wfh.write(rec)
+            self.wfh.flush()
+            os.fsync(self.wfh.fileno())
+            self.segs[self.wseq][0] += 1
+            self.segs[self.wseq][1] += len(rec)
+            self._trim()
+            self.cond.notify_all()
+
+    def _roll(self):
+        self.wfh.close()
+        self.wseq += 1
+        self.segs[self.wseq] = [0, 0]
+        self.wfh = open(self._fname(self.wseq), 'ab')
+
+    def _trim(self):
+        while self.bytes > self.max_bytes and len(self.segs) > 1:
+            seq, (records, size) = self.segs.popitem(last=False)
+            log.warning('spool %s is over %d bytes, dropping %d records', self.path, self.max_bytes, records)
+            self.dropped += records
+            if seq == self.rseq:
+                self.head = None
+                self.rfh.close()
+                self._next_segment()
+            os.unlink(self._fname(seq))
+
+    def _next_segment(self):
+        self.rseq = next(iter(self.segs))
+        self.roff = 0
+        self.rfh = open(self._fname(self.rseq), 'rb')
+        self._save_cursor()
+
+    def _peek(self):
+        if self.head is None and self.records:
+            while not self.segs[self.rseq][0]:
+                # everything in the read segment is acked and there's a
+                # newer segment with something in it
+                self.rfh.close()
+                os.unlink(self._fname(self.rseq))
+                del self.segs[self.rseq]
+                self._next_segment()
+            self.rfh.seek(self.roff)
+            self.head = self._read(self.rfh)
+            if self.head is None:
+                raise SpoolError('corrupt record in {0} at {1}'.format(self._fname(self.rseq), self.roff))
+        return self.head
+
+    def peek(self, timeout=None):
+        ''' the oldest record's data, waiting up to timeout seconds for one; None if there isn't one '''
+        with self.cond:
+            if not self.records and timeout:
+                self.cond.wait(timeout)
+            head = self._peek()
+            if head:
+                return head[1]
+
+    def ack(self):
+        ''' remove the record last returned by peek() '''
+        with self.cond:
+            if self.head is None:
+                return
+            size = self.header.size + len(self.head[1])
+            self.head = None
+            self.roff += size
+            self.segs[self.rseq][0] -= 1
+            self.segs[self.rseq][1] -= size
+            self._save_cursor()
+
+    def close(self):
+        with self.cond:
+            self.wfh.close()
+            self.rfh.close()
+            self._save_cursor()
@@ -0,0 +1,243 @@
+# coding: utf-8
+
+import re
+import time
+import heapq
+import logging
+import threading
+from collections import Counter, deque
+
+from .structured import StructuredMixin
+from .config import SaltConfigMixin
+from .misc import DateParser
+from .event import NA
+
+log = logging.getLogger(__name__)
+
+jid_re = re.compile(r'(?<!\d)\d{20}(?!\d)')
+
+def normalize_tag(tag):
+    ''' tag with any jids replaced by *, so salt/job/*/new is one tag rather than one per job '''
+    return jid_re.sub('*', tag) if isinstance(tag, basestring) else unicode(tag)
+
+def event_keys(cev):
+    ''' the minion, the tag (see normalize_tag) and the fun of an event, None where it has none '''
+    mid = getattr(cev, 'id', NA)
+    fun = getattr(cev, 'fun', NA)
+    return ( mid if mid is not NA and isinstance(mid, basestring) else None,
+        normalize_tag(cev.tag),
+        fun if fun is not NA and isinstance(fun, basestring) else None )
+
+class SpaceSaving(object):
+    ''' approximate top-k counts in fixed memory (Metwally et al.'s Space-Saving)
+
+        At most capacity keys are counted.  When a new key shows up and
+        there's no room, the key with the lowest count is evicted and the
+        new one takes over its count (+1) -- so a count can be too high,
+        but never by more than the key's error (the count it inherited),
+        and anything that occurs more than total/capacity times is sure to
+        be there.  Each key has exactly one entry in a min-heap; entries
+        are only brought up to date when they reach the top, so counting a
+        key that's already there is a dict update.
+    '''
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts   = dict() # key -> count
+        self.errors   = dict() # key -> how much of count might not be its own
+        self.heap     = list() # (count, key), possibly stale
+        self.total    = 0
+
+    def add(self, key, n=1):
+        self.total += n
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return
+        if len(counts) < self.capacity:
+            counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(self.heap, (n, key))
+            return
+        heap = self.heap
+        while heap[0][0] != counts[ heap[0][1] ]:
+            heapq.heapreplace(heap, (counts[ heap[0][1] ], heap[0][1]))
+        low, victim = heap[0]
+        del counts[victim]
+        del self.errors[victim]
+        counts[key] = low + n
+        self.errors[key] = low
+        heapq.heapreplace(heap, (low + n, key))
+
+    @property
+    def floor(self):
+        ''' the most a key that isn't counted could have been seen '''
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.itervalues())
+
+    def merge(self, other):
+        ''' a new SpaceSaving summarizing both (with the larger capacity) '''
+        ret = SpaceSaving(max(self.capacity, other.capacity))
+        a, b = self.floor, other.floor
+        merged = list()
+        for key in set(self.counts).union(other.counts):
+            merged.append( (self.counts.get(key, a) + other.counts.get(key, b),
+                self.errors.get(key, a) + other.errors.get(key, b), key) )
+        for count, error, key in heapq.nlargest(ret.capacity, merged):
+            ret.counts[key] = count
+            ret.errors[key] = error
+            ret.heap.append( (count, key) )
+        heapq.heapify(ret.heap)
+        ret.total = self.total + other.total
+        return ret
+
+    def top(self, n=10):
+        ''' the n biggest (key, count, error), biggest first '''
+        return [ (k, c, self.errors[k]) for c,k in heapq.nlargest(n, ( (c,k) for k,c in self.counts.iteritems() )) ]
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        return 'SpaceSaving({0}/{1}, total={2})'.format(len(self), self.capacity, self.total)
+
+def merge_sketches(sketches, capacity):
+    ret = SpaceSaving(capacity)
+    for sk in sketches:
+        ret = ret.merge(sk)
+    return ret
+
+class _Counts(object):
+    __slots__ = ('start', 'events', 'bytes', 'classes', 'minions', 'tags', 'funs')
+
+    def __init__(self, start, capacity):
+        self.start   = start
+        self.events  = 0
+        self.bytes   = 0
+        self.classes = Counter()
+        self.minions = SpaceSaving(capacity)
+        self.tags    = SpaceSaving(capacity)
+        self.funs    = SpaceSaving(capacity)
+
+def _top(sketch, n):
+    return [ [k, c] for k,c,e in sketch.top(n) ]
+
+def _rate(n, secs):
+    return round(n / secs, 2) if secs > 0 else 0.0
+
+class StatsReport(SaltConfigMixin, StructuredMixin):
+    ''' a saltdump/stats summary, formatted like an event (see Job) '''
+    tag = 'saltdump/stats'
+
+    def __init__(self, data):
+        self.data  = data
+        self.ptime = DateParser('now')
+        self.stamp = self.ptime.orig
+        self.dtime = self.ptime.parsed
+        self.itime = self.ptime.tstamp
+
+    @property
+    def raw(self):
+        dat = dict(self.data)
+        dat['_stamp'] = self.stamp
+        return dict(tag=self.tag, data=dat)
+
+    @property
+    def columns(self):
+        d = self.data
+        pairs = lambda x: u','.join( u'{0}={1}'.format(k,v) for k,v in x )
+        return [ self.tag,
+            u'{0}s'.format(d['interval']),
+            u'ev={0}'.format(d['events']),
+            u'rate={0}/s'.format(d['rate']),
+            u'bytes={0}/s'.format(d['byte_rate']),
+            u'{0}s-rate={1}/s'.format(d['window'], d['window_rate']),
+            pairs(sorted(d['classes'].items())),
+            u'tags:' + pairs(d['top_tags']) if d['top_tags'] else '',
+            u'minions:' + pairs(d['top_minions']) if d['top_minions'] else '',
+            u'funs:' + pairs(d['top_funs']) if d['top_funs'] else '' ]
+
+    @property
+    def short(self):
+        return u' '.join(tuple( x for x in self.columns if x ))
+
+    def outputter(self, **kw):
+        return self.short
+
+    def json(self, indent=2):
+        return self.encoded('raw', lambda: self.raw, indent=indent)
+
+    def __repr__(self):
+        return self.short
+    __str__ = __repr__
+
+class Stats(object):
+    ''' rolling event statistics for saltdump --stats
+
+        observe() counts an event (and the size of whatever it was rendered
+        as) into the current interval: a few counter increments, however
+        busy the bus is.  report() closes the interval and summarizes it --
+        the rate, bytes/s and events per Event class -- along with the rate
+        and the top tags and minions over the last window seconds (the last
+        window/interval intervals).  Tags are counted with their jids
+        normalized away (see normalize_tag).
+
+        Minions, tags and funs are counted in SpaceSaving sketches of
+        capacity keys per interval, so a 10k minion fleet (or tags full of
+        ids) can't make this grow; the window's top-k is the merge of its
+        intervals' sketches.
+    '''
+
+    def __init__(self, interval=10, window=300, top=5, capacity=200):
+        self.interval = interval
+        self.window   = window
+        self.top      = top
+        self.capacity = max(capacity, top)
+        self.history  = deque(maxlen=max(1, int(round(float(window) / interval))))
+        self.lock     = threading.Lock()
+        self.current  = _Counts(time.time(), self.capacity)
+
+    def observe(self, cev, outs=()):
+        n = 0
+        for out in outs:
+            if isinstance(out, basestring):
+                n += len(out)
+        mid, tag, fun = event_keys(cev)
+        with self.lock:
+            c = self.current
+            c.events += 1
+            c.bytes  += n
+            c.classes[ cev.__class__.__name__ ] += 1
+            c.tags.add(tag)
+            if mid is not None:
+                c.minions.add(mid)
+            if fun is not None:
+                c.funs.add(fun)
+
+    def report(self, now=None):
+        ''' close the current interval and return a StatsReport for it '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            c = self.current
+            self.current = _Counts(now, self.capacity)
+            self.history.append(c)
+            history = list(self.history)
+
+        secs = now - c.start
+        wsecs = now - history[0].start
+
+        return StatsReport(dict(
+            interval    = int(round(secs)),
+            events      = c.events,
+            rate        = _rate(c.events, secs),
+            bytes       = c.bytes,
+            byte_rate   = _rate(c.bytes, secs),
+            classes     = dict(c.classes),
+            window      = int(round(wsecs)),
+            window_rate = _rate(sum( h.events for h in history ), wsecs),
+            top_tags    = _top(merge_sketches([ h.tags for h in history ], self.capacity), self.top),
+            top_minions = _top(merge_sketches([ h.minions for h in history ], self.capacity), self.top),
+            top_funs    = _top(merge_sketches([ h.funs for h in history ], self.capacity), self.top),
+        ))
@@ -1,29 +1,68 @@
 # coding: utf-8
 
-import time
-import copy
-import json
+import os
+import datetime
 
-def _scrub(dat):
-    dat = copy.deepcopy(dat)
-
-    if 'data' not in dat:
-        dat['data'] = dict()
-    rdat = dat['data']
-
-    for k in list( x for x in dat if x.startswith('_') ):
-        del dat[k]
-
-    for k in list( x for x in rdat if x.startswith('_') ):
-        del rdat[k]
+from .serial import dumps
 
+def _scrub(dat):
+    # Only the top level and the data dict are rewritten, so those are the
+    # only things copied; every other subtree (e.g., a state return with
+    # thousands of entries) is shared with the original event.  Don't modify
+    # anything below ret['data'] in place.
+    dat = dict( (k,v) for k,v in dat.iteritems() if not k.startswith('_') )
+    rdat = dat.get('data') or dict()
+    dat['data'] = rdat = dict( (k,v) for k,v in rdat.iteritems() if not k.startswith('_') )
     return dat, rdat
 
 class StructuredMixin(object):
+    cache_encodings = True
+
+    def encoded(self, key, build, indent=None):
+        ''' serialize build() once and hand back the same string afterwards
+
+            Things whose content changes over time (e.g. Job) should set
+            cache_encodings = False.
+        '''
+        if not self.cache_encodings:
+            return dumps(build(), indent=indent)
+        try:
+            cache = self._encodings
+        except AttributeError:
+            cache = self._encodings = dict()
+        k = (key, indent)
+        if k not in cache:
+            cache[k] = dumps(build(), indent=indent)
+        return cache[k]
 
     @property
     def jsonstru(self):
-        return json.dumps(self.structured)
+        return self.encoded('stru', lambda: self.structured)
+
+    def hec(self, **fields):
+        ''' wrap structured in a Splunk http event collector envelope
+
+            fields (e.g., index, sourcetype) are added to the envelope
+            unless they're empty
+        '''
+        stru = self.structured
+        ret = dict(time=stru['time'], host=stru['host'], source='saltdump',
+            sourcetype='salt:event', event=stru)
+        ret.update( (k,v) for k,v in fields.iteritems() if v )
+        return ret
+
+    def syslog(self, facility=16, app_name='saltdump'):
+        ''' jsonstru as an RFC5424 syslog message (facility 16 is local0)
+
+            Returns with a bad retcode are logged as warnings, everything
+            else as info.
+        '''
+        severity = 6 if getattr(self, 'rc_ok', True) else 4
+        stamp = datetime.datetime.utcfromtimestamp(self.itime).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        host = getattr(self, 'master', None) or self.salt_id or '-'
+        return u'<{pri}>1 {stamp} {host} {app} {pid} {msgid} - {msg}'.format(
+            pri=facility * 8 + severity, stamp=stamp, host=host,
+            app=app_name, pid=os.getpid(), msgid=self.__class__.__name__, msg=self.jsonstru)
 
     @property
     def structured(self):
@@ -32,7 +71,10 @@ class StructuredMixin(object):
         ret, rdat = _scrub(self.raw)
 
         ret['sd_class'] = self.__class__.__name__
-        ret['host'] = self.salt_opts.get('id')
+        ret['host'] = self.salt_id
+        master = getattr(self, 'master', None)
+        if master:
+            ret['host'] = ret['master'] = master
         ret['time'] = self.itime
         ret['path'] = ret.pop('tag')
 
@@ -0,0 +1,489 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import stat
+import click
+import socket
+import random
+import hashlib
+import logging
+import datetime
+import threading
+
+import msgpack
+
+log = logging.getLogger(__name__)
+
+def minion_ids(n, domains=3):
+    ''' n made up minion ids, e.g., minion00001.dom2 '''
+    width = max(5, len(str(n)))
+    return [ 'minion{0:0{1}d}.dom{2}'.format(i + 1, width, i % domains + 1) for i in range(n) ]
+
+def make_jid(when):
+    ''' a jid for the given datetime, the way salt makes them '''
+    return when.strftime('%Y%m%d%H%M%S%f')
+
+def _stamp(when):
+    return when.isoformat()
+
+def fake_pub_key(mid):
+    ''' something that looks like a minion's public key (the same one every time for mid) '''
+    body = ''
+    seed = mid
+    while len(body) < 360:
+        seed = hashlib.sha1(seed).hexdigest()
+        body += seed.decode('hex').encode('base64').replace('\n', '')
+    lines = [ body[i:i+64] for i in range(0, 360, 64) ]
+    return '-----BEGIN PUBLIC KEY-----\n{0}\n-----END PUBLIC KEY-----'.format('\n'.join(lines))
+
+def expected_event(when, jid, minions):
+    return dict(tag=jid, data=dict(_stamp=_stamp(when), minions=list(minions)))
+
+def publish_event(when, jid, fun, minions, arg=(), tgt='*', tgt_type='glob', user='sudo_operator'):
+    return dict(tag='salt/job/{0}/new'.format(jid), data=dict(_stamp=_stamp(when), jid=jid, fun=fun,
+        arg=list(arg), tgt=tgt, tgt_type=tgt_type, user=user, minions=list(minions)))
+
+def publish_events(when, jid, fun, minions, **kw):
+    ''' the ExpectedReturns and Publish events for a job '''
+    return [ expected_event(when, jid, minions), publish_event(when, jid, fun, minions, **kw) ]
+
+def return_event(when, jid, fun, mid, ret=True, retcode=0, arg=(), out=None):
+    dat = dict(_stamp=_stamp(when), jid=jid, fun=fun, fun_args=list(arg), id=mid,
+        cmd='_return', retcode=retcode, success=retcode == 0, **{'return': ret})
+    if out:
+        dat['out'] = out
+    return dict(tag='salt/job/{0}/ret/{1}'.format(jid, mid), data=dat)
+
+def auth_event(when, mid, act='accept', result=True):
+    return dict(tag='salt/auth', data=dict(_stamp=_stamp(when), act=act, id=mid,
+        pub=fake_pub_key(mid), result=result))
+
+def state_return(n, rnd, failed=0.01, changed=0.05):
+    ''' a highstate return with n states '''
+    ret = dict()
+    for i in range(n):
+        sid = 'state_{0:05d}'.format(i)
+        name = '/etc/app/{0}/conf.d/{1}.conf'.format(i // 100, sid)
+        ok = rnd.random() >= failed
+        changes = dict(diff='--- \n+++ \n@@ -1 +1 @@\n-old\n+new\n') if ok and rnd.random() < changed else dict()
+        ret['file_|-{0}_|-{1}_|-managed'.format(sid, name)] = dict(
+            __id__=sid, __run_num__=i, __sls__='app.conf{0}'.format(i // 100), name=name,
+            result=ok, changes=changes, duration=round(rnd.uniform(0.1, 50), 3),
+            start_time='12:00:{0:09.6f}'.format(rnd.uniform(0, 59)),
+            comment='File {0} is in the correct state'.format(name) if ok else 'Unable to manage file: oops')
+    return ret
+
+def ping_fanout(minions=5000, start=None, seed=0, max_latency=2.0):
+    ''' one test.ping to every minion and every minion's return, in the order salt would send them '''
+    rnd = random.Random(seed)
+    start = start or datetime.datetime(2019, 4, 12, 13, 3, 38, 123456)
+    jid = make_jid(start)
+    ids = minion_ids(minions)
+    evs = publish_events(start, jid, 'test.ping', ids)
+    rets = sorted( (start + datetime.timedelta(seconds=rnd.uniform(0.01, max_latency)), mid) for mid in ids )
+    evs.extend( return_event(when, jid, 'test.ping', mid) for when,mid in rets )
+    return evs
+
+def auth_storm(minions=5000, start=None, seed=0, secs=10.0):
+    ''' every minion reconnecting at once: a pend (or accept) auth event each '''
+    rnd = random.Random(seed)
+    start = start or datetime.datetime(2019, 4, 12, 13, 3, 38, 123456)
+    evs = list()
+    for mid in minion_ids(minions):
+        when = start + datetime.timedelta(seconds=rnd.uniform(0, secs))
+        act = 'accept' if rnd.random() < 0.9 else 'pend'
+        evs.append( (when, auth_event(when, mid, act=act, result=act == 'accept')) )
+    return [ ev for when,ev in sorted(evs) ]
+
+def highstate(minions=10, states=10000, start=None, seed=0):
+    ''' a state.highstate on a few minions, each returning lots of states '''
+    rnd = random.Random(seed)
+    start = start or datetime.datetime(2019, 4, 12, 13, 3, 38, 123456)
+    jid = make_jid(start)
+    ids = minion_ids(minions)
+    evs = publish_events(start, jid, 'state.highstate', ids)
+    for i,mid in enumerate(ids):
+        when = start + datetime.timedelta(seconds=30 + i * rnd.uniform(0.5, 2))
+        ret = state_return(states, rnd)
+        rc = 0 if all( v['result'] for v in ret.itervalues() ) else 2
+        evs.append( return_event(when, jid, 'state.highstate', mid, ret=ret, retcode=rc, out='highstate') )
+    return evs
+
+# name -> (builder, the size arguments it gets at scale=1)
+CORPORA = dict(
+    auth_storm = (auth_storm, dict(minions=5000)),
+    ping       = (ping_fanout, dict(minions=5000)),
+    highstate  = (highstate, dict(minions=10, states=10000)),
+)
+
+def corpus(name, scale=1.0, seed=0):
+    ''' the named corpus (see CORPORA), its sizes scaled by scale '''
+    build, sizes = CORPORA[name]
+    kw = dict( (k, max(1, int(v * scale))) for k,v in sizes.iteritems() )
+    return build(seed=seed, **kw)
+
+def find_job_return_event(when, fjid, mid, jid, fun, arg=()):
+    ''' a minion's answer to saltutil.find_job: the job it's still running '''
+    ret = dict(jid=jid, fun=fun, arg=list(arg), pid=1000 + hash(mid) % 64000, tgt='*', tgt_type='glob',
+        user='sudo_operator')
+    return return_event(when, fjid, 'saltutil.find_job', mid, ret=ret, arg=[jid])
+
+def refresh_event(when, mid):
+    return dict(tag='minion/refresh/{0}'.format(mid), data={'_stamp': _stamp(when), 'Minion data cache refresh': mid})
+
+class Fleet(object):
+    ''' an endless, realistic event stream from a fleet of minions
+
+        A few jobs (concurrency of them) are in flight at once and their
+        events are interleaved: each job is the ExpectedReturns and Publish
+        events and then the returns, in a random order.  A fraction (slow)
+        of a job's minions are slow to return: after the others, the master
+        publishes a saltutil.find_job to them, they answer it, and then they
+        return.  Jobs are test.ping, cmd.run or (less often) state.apply with
+        states states per return, to every minion or a random handful.  Now
+        and then (noise) there's an auth or minion/refresh event instead.
+
+        next_event(when) hands back the next event, stamped when (a
+        datetime); new jobs get jids made from when.
+    '''
+    FUNS = (('test.ping', 0.6), ('cmd.run', 0.3), ('state.apply', 0.1))
+
+    def __init__(self, minions=1000, concurrency=10, slow=0.02, noise=0.05, states=100, seed=0):
+        self.minions     = minion_ids(minions)
+        self.concurrency = concurrency
+        self.slow        = slow
+        self.noise       = noise
+        self.states      = states
+        self.rnd         = random.Random(seed)
+        self.jobs        = list()
+        self.last_jid    = None
+        self.count       = 0
+
+    def _fun(self):
+        x = self.rnd.random()
+        for fun,p in self.FUNS:
+            if x < p:
+                return fun
+            x -= p
+        return self.FUNS[-1][0]
+
+    def _jid(self, when):
+        jid = make_jid(when)
+        if self.last_jid is not None and jid <= self.last_jid:
+            jid = str(int(self.last_jid) + 1)
+        self.last_jid = jid
+        return jid
+
+    def _job(self, when):
+        rnd = self.rnd
+        fun = self._fun()
+        if rnd.random() < 0.5:
+            targets, tgt, tgt_type = self.minions, '*', 'glob'
+        else:
+            targets = rnd.sample(self.minions, min(len(self.minions), rnd.randint(1, 20)))
+            tgt, tgt_type = list(targets), 'list'
+        arg = dict(ping=[], run=['uptime'], apply=[]).get(fun.split('.')[1], [])
+        jid = self._jid(when)
+
+        when = yield expected_event(when, jid, targets)
+        when = yield publish_event(when, jid, fun, targets, arg=arg, tgt=tgt, tgt_type=tgt_type)
+
+        order = list(targets)
+        rnd.shuffle(order)
+        nslow = int(len(order) * self.slow) if len(order) > 1 else 0
+        fast, slow = order[:len(order) - nslow], order[len(order) - nslow:]
+
+        def _return(when, mid):
+            if fun == 'state.apply':
+                ret = state_return(self.states, rnd)
+                rc = 0 if all( v['result'] for v in ret.itervalues() ) else 2
+                return return_event(when, jid, fun, mid, ret=ret, retcode=rc, arg=arg, out='highstate')
+            ret = True if fun == 'test.ping' else ' 13:03:38 up 42 days,  3:14,  0 users,  load average: 0.00'
+            return return_event(when, jid, fun, mid, ret=ret, arg=arg)
+
+        for mid in fast:
+            when = yield _return(when, mid)
+        if slow:
+            fjid = self._jid(when)
+            when = yield expected_event(when, fjid, slow)
+            when = yield publish_event(when, fjid, 'saltutil.find_job', slow, arg=[jid], tgt=slow, tgt_type='list')
+            for mid in slow:
+                when = yield find_job_return_event(when, fjid, mid, jid, fun, arg)
+            for mid in slow:
+                when = yield _return(when, mid)
+
+    def next_event(self, when):
+        self.count += 1
+        if self.rnd.random() < self.noise:
+            mid = self.rnd.choice(self.minions)
+            if self.rnd.random() < 0.5:
+                return auth_event(when, mid)
+            return refresh_event(when, mid)
+        while len(self.jobs) < self.concurrency:
+            job = self._job(when)
+            self.jobs.append( [job, next(job)] )
+        i = self.rnd.randrange(len(self.jobs))
+        job, ev = self.jobs[i]
+        try:
+            self.jobs[i][1] = job.send(when)
+        except StopIteration:
+            del self.jobs[i]
+        return ev
+
+class RateProfile(object):
+    ''' events per second over time, from a spec of comma separated phases:
+
+        \b
+          steady:RATE:SECS           RATE events/s for SECS seconds
+          ramp:FROM:TO:SECS          from FROM to TO events/s over SECS seconds
+          burst:BASE:PEAK:EVERY:LEN:SECS
+                                     BASE events/s, but PEAK for LEN seconds
+                                     every EVERY seconds, for SECS seconds
+    '''
+    ARGS = dict(steady=2, ramp=3, burst=5)
+
+    def __init__(self, spec):
+        self.phases = list()
+        self.duration = 0.0
+        for phase in spec.split(','):
+            parts = phase.strip().split(':')
+            if parts[0] not in self.ARGS or len(parts) != self.ARGS[parts[0]] + 1:
+                raise ValueError('"{0}" is not one of steady:RATE:SECS, ramp:FROM:TO:SECS'
+                    ' or burst:BASE:PEAK:EVERY:LEN:SECS'.format(phase))
+            try:
+                args = [ float(x) for x in parts[1:] ]
+            except ValueError:
+                raise ValueError('"{0}" has something that is not a number in it'.format(phase))
+            self.phases.append( (self.duration, parts[0], args) )
+            self.duration += args[-1]
+
+    def rate(self, t):
+        for start, kind, args in reversed(self.phases):
+            if t >= start:
+                t -= start
+                break
+        if kind == 'steady':
+            return args[0]
+        if kind == 'ramp':
+            return args[0] + (args[1] - args[0]) * min(1.0, t / args[2])
+        base, peak, every, length = args[:4]
+        return peak if t % every < length else base
+
+    def schedule(self):
+        ''' the times (seconds from the start) that events are due '''
+        t = 0.0
+        while t < self.duration:
+            r = self.rate(t)
+            if r <= 0:
+                t += 0.01
+                continue
+            t += 1.0 / r
+            if t < self.duration:
+                yield t
+
+class FakeMasterBus(object):
+    ''' a stand-in for a salt master's event bus: master_event_pub.ipc in sock_dir
+
+        Anything that reads the master's events (e.g., saltdump --sock-dir)
+        can subscribe to it and gets every publish()ed event framed the way
+        salt frames them.  publish() blocks while a subscriber isn't keeping
+        up, the way a real master's bus would.
+    '''
+
+    def __init__(self, sock_dir, mode=0o666):
+        if not os.path.isdir(sock_dir):
+            os.makedirs(sock_dir)
+        self.path    = os.path.join(sock_dir, 'master_event_pub.ipc')
+        self.clients = list()
+        self.lock    = threading.Lock()
+        if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, mode)
+        self.sock.listen(64)
+        self.thread = threading.Thread(target=self._accept_loop, name='FakeMasterBus')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            log.info('subscriber connected')
+            with self.lock:
+                self.clients = self.clients + [conn]
+
+    def wait_for_subscribers(self, n=1, timeout=None):
+        end = None if timeout is None else time.time() + timeout
+        while len(self.clients) < n:
+            if end is not None and time.time() > end:
+                return False
+            time.sleep(0.05)
+        return True
+
+    @staticmethod
+    def frame(ev):
+        body = '{0}\n\n{1}'.format(ev['tag'], msgpack.dumps(ev['data']))
+        return msgpack.dumps(dict(head=dict(), body=body))
+
+    def publish(self, ev):
+        data = self.frame(ev)
+        for conn in self.clients:
+            try:
+                conn.sendall(data)
+            except socket.error as e:
+                log.info('subscriber went away: %s', e)
+                with self.lock:
+                    self.clients = [ x for x in self.clients if x is not conn ]
+                conn.close()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self.thread.join()
+        for conn in self.clients:
+            conn.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def generate(fleet, profile, emit, realtime=True, count=None, progress=None):
+    ''' emit() fleet's events on profile's schedule; returns how many were emitted
+
+        realtime paces the events with the wall clock (stamping them with
+        it); otherwise they're emitted as fast as emit() takes them, stamped
+        as if they'd been paced.
+    '''
+    start = time.time()
+    dstart = datetime.datetime.now()
+    n = 0
+    last = start
+    for t in profile.schedule():
+        if count is not None and n >= count:
+            break
+        if realtime:
+            delay = start + t - time.time()
+            if delay > 0.001:
+                time.sleep(delay)
+            when = datetime.datetime.now()
+        else:
+            when = dstart + datetime.timedelta(seconds=t)
+        emit( fleet.next_event(when) )
+        n += 1
+        if progress and time.time() - last >= 5:
+            last = time.time()
+            progress(n, t, last - start)
+    return n
+
+def _replay_text(ev):
+    return json.dumps(ev, indent=2) + '\n\n'
+
+def _jsonl_text(ev):
+    return json.dumps(ev) + '\n'
+
+
+@click.command()
+@click.option('-n', '--minions', type=int, default=1000, help='fleet size (default: 1000)')
+@click.option('-p', '--profile', 'spec', type=str, default='steady:100:60',
+    help='the rate over time, e.g., ramp:100:5000:60,burst:500:20000:10:1:120 (default: steady:100:60)')
+@click.option('-o', '--output', type=str, default='-', metavar='ipc:SOCK_DIR|replay:FILE|jsonl:FILE|-',
+    help='where the events go: a stand-in master bus, a replay file (saltdump -r style), a jsonl'
+    ' capture or stdout (jsonl, the default)')
+@click.option('--concurrency', type=int, default=10, help='jobs in flight at once (default: 10)')
+@click.option('--slow', type=float, default=0.02,
+    help='fraction of each job\'s minions that are slow and get a saltutil.find_job (default: 0.02)')
+@click.option('--noise', type=float, default=0.05,
+    help='fraction of events that are auth and minion/refresh events (default: 0.05)')
+@click.option('--states', type=int, default=100, help='states in each state.apply return (default: 100)')
+@click.option('--fast', is_flag=True, default=False,
+    help='write files as fast as possible instead of pacing them (the stamps still follow the profile)')
+@click.option('-c', '--count', type=int, help='stop after this many events')
+@click.option('--seed', type=int, default=0, help='random seed (default: 0)')
+@click.option('--wait', type=float, default=0,
+    help='with ipc:, wait this many seconds for a subscriber before starting (default: 0)')
+@click.option('-l', '--level', type=str, default='error', help='logging level, default: error')
+def synth(minions, spec, output, concurrency, slow, noise, states, fast, count, seed, wait, level):
+    ''' generate a realistic salt event stream at a controlled rate, for
+        load testing saltdump (or anything else that reads the bus).
+
+        Jobs (test.ping, cmd.run, state.apply) go to the whole fleet or a
+        few minions: expected returns, the publish, returns, and for the
+        slow minions a saltutil.find_job chain before they return.  Auth and
+        minion/refresh events are mixed in.
+
+        \b
+        rate profiles (--profile), comma separated phases:
+          steady:RATE:SECS
+          ramp:FROM:TO:SECS
+          burst:BASE:PEAK:EVERY:LEN:SECS
+
+        With -o ipc:SOCK_DIR, a stand-in master_event_pub.ipc is served in
+        SOCK_DIR (listen to it with saltdump --sock-dir SOCK_DIR).  At the
+        end, the rate asked for and the rate achieved are reported on
+        stderr; a subscriber that can't keep up slows the bus down.
+
+        \b
+        examples:
+          saltdump synth -o ipc:/tmp/fakebus --wait 30 -p ramp:100:20000:120 &
+          saltdump --sock-dir /tmp/fakebus -o stru:/dev/null --stats 10
+          saltdump synth -n 5000 -p steady:2000:300 --fast -o replay:/tmp/storm.log
+    '''
+    level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    logging.root.handlers = []
+    logging.basicConfig(level=level)
+
+    try:
+        profile = RateProfile(spec)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--profile')
+    kind, _, dest = output.partition(':')
+    if output != '-' and (kind not in ('ipc', 'replay', 'jsonl') or not dest):
+        raise click.BadParameter('expected ipc:SOCK_DIR, replay:FILE, jsonl:FILE or -', param_hint='--output')
+
+    fleet = Fleet(minions, concurrency=concurrency, slow=slow, noise=noise, states=states, seed=seed)
+    bus = fh = None
+    if kind == 'ipc':
+        try:
+            bus = FakeMasterBus(dest)
+        except (socket.error, OSError) as e:
+            raise click.ClickException('unable to serve on {0}: {1}'.format(dest, e))
+        if wait and not bus.wait_for_subscribers(timeout=wait):
+            log.warning('nobody subscribed within %ss, starting anyway', wait)
+        emit = bus.publish
+    else:
+        fh = open(dest, 'wb') if output != '-' else sys.stdout
+        text = _replay_text if kind == 'replay' else _jsonl_text
+        emit = lambda ev: fh.write( text(ev) )
+
+    def progress(n, t, elapsed):
+        sys.stderr.write('{0} events, {1:.0f}/s (asked for {2:.0f}/s)\n'.format(n, n / elapsed, profile.rate(t)))
+
+    start = time.time()
+    try:
+        n = generate(fleet, profile, emit, realtime=bus is not None or not fast, count=count,
+            progress=progress if bus is not None else None)
+    except KeyboardInterrupt:
+        n = fleet.count
+    except IOError:
+        return # e.g., saltdump synth | head
+    finally:
+        if bus is not None:
+            bus.close()
+        if fh is not None and fh is not sys.stdout:
+            fh.close()
+    elapsed = time.time() - start
+    sys.stderr.write('{0} events in {1:.1f}s, {2:.0f}/s\n'.format(n, elapsed, n / elapsed if elapsed else 0))
@@ -0,0 +1,181 @@
+# coding: utf-8
+
+import re
+import time
+import zlib
+import random
+import fnmatch
+import logging
+import threading
+
+from .stats import StatsReport
+
+log = logging.getLogger(__name__)
+
+rate_re   = re.compile(r'^(?P<rate>\d+(?:\.\d+)?)/(?P<per>[smh])(?::(?P<burst>\d+))?$')
+sample_re = re.compile(r'^(?P<pct>\d+(?:\.\d+)?)%(?P<by>@minion)?$')
+PER = dict(s=1, m=60, h=3600)
+
+class TokenBucket(object):
+    ''' rate tokens a second, holding at most burst of them (a full bucket to start) '''
+
+    def __init__(self, rate, burst=None):
+        self.rate   = float(rate)
+        self.burst  = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.last   = None
+
+    def take(self, now):
+        if self.last is not None and now > self.last:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def event_minion(ev):
+    ''' the minion a raw event is from or about: data's id, else the last part of the tag '''
+    dat = ev.get('data')
+    mid = dat.get('id') if isinstance(dat, dict) else None
+    if isinstance(mid, basestring):
+        return mid
+    return unicode(ev.get('tag') or '').rpartition('/')[2]
+
+def minion_fraction(mid):
+    ''' where mid lands in [0, 1): the same on every run and every host '''
+    if isinstance(mid, unicode):
+        mid = mid.encode('utf-8')
+    return (zlib.crc32(mid) & 0xffffffff) / 4294967296.0
+
+class Rule(object):
+    ''' PATTERN=RULE[,RULE] (see parse_throttle_spec), with what it let through and held back '''
+
+    def __init__(self, spec, pattern, sample=None, by_minion=False, rate=None, burst=None, rnd=None):
+        self.spec      = spec
+        self.pattern   = pattern
+        self.match     = re.compile(fnmatch.translate(pattern)).match
+        self.sample    = sample
+        self.by_minion = by_minion
+        self.bucket    = TokenBucket(rate, burst) if rate else None
+        self.rnd       = rnd or random.Random()
+        self.passed    = 0
+        self.sampled   = 0 # held back by the sample
+        self.limited   = 0 # held back by the bucket
+
+    def admit(self, ev, now):
+        if self.sample is not None:
+            x = minion_fraction(event_minion(ev)) if self.by_minion else self.rnd.random()
+            if x >= self.sample:
+                self.sampled += 1
+                return False
+        if self.bucket is not None and not self.bucket.take(now):
+            self.limited += 1
+            return False
+        self.passed += 1
+        return True
+
+    def reset(self):
+        ret = self.passed, self.sampled, self.limited
+        self.passed = self.sampled = self.limited = 0
+        return ret
+
+def parse_throttle_spec(spec, rnd=None):
+    ''' PATTERN=RULE[,RULE] as a Rule
+
+        PATTERN is a tag glob (like FILTER's).  Each RULE is one of
+
+          RATE/s, RATE/m or RATE/h, optionally :BURST -- a token bucket
+          PCT%        -- keep a random PCT percent of the events
+          PCT%@minion -- keep the events of PCT percent of the minions
+                         (picked by a hash of the minion id, so it's the
+                         same minions every time)
+
+        A sample comes before the bucket, so 10%@minion,50/s is at most 50/s
+        from a tenth of the minions.
+    '''
+    pattern, eq, rules = spec.rpartition('=')
+    if not eq or not pattern or not rules:
+        raise ValueError('expected PATTERN=RULE[,RULE], not "{0}"'.format(spec))
+    kw = dict()
+    for rule in rules.split(','):
+        rule = rule.strip()
+        m = rate_re.match(rule)
+        if m and 'rate' not in kw:
+            kw['rate'] = float(m.group('rate')) / PER[ m.group('per') ]
+            if m.group('burst'):
+                kw['burst'] = int(m.group('burst'))
+            if not kw['rate']:
+                raise ValueError('"{0}": a rate must be more than 0'.format(spec))
+            continue
+        m = sample_re.match(rule)
+        if m and 'sample' not in kw:
+            kw['sample'] = float(m.group('pct')) / 100
+            kw['by_minion'] = bool(m.group('by'))
+            if not 0 < kw['sample'] <= 1:
+                raise ValueError('"{0}": a sample must be more than 0% and at most 100%'.format(spec))
+            continue
+        raise ValueError('"{0}": "{1}" is not RATE/s|m|h[:BURST], PCT% or PCT%@minion (at most one of each)'.format(
+            spec, rule))
+    return Rule(spec, pattern, rnd=rnd, **kw)
+
+class ThrottleReport(StatsReport):
+    ''' a saltdump/throttle summary of what was held back, formatted like an event '''
+    tag = 'saltdump/throttle'
+
+    @property
+    def columns(self):
+        d = self.data
+        return [ self.tag,
+            u'{0}s'.format(d['interval']),
+            u'passed={0}'.format(d['passed']),
+            u'suppressed={0}'.format(d['suppressed']),
+            u','.join( u'{0}={1}+{2}'.format(r['pattern'], r['sampled'], r['limited'])
+                for r in d['rules'] if r['sampled'] or r['limited'] ) ]
+
+class Throttle(object):
+    ''' per tag pattern rate limits and sampling for saltdump --throttle
+
+        admit() looks at a raw event (before it's classified, so what's
+        held back costs next to nothing) and says whether to keep it.  The
+        first rule whose pattern matches the tag decides; events no rule
+        matches always pass.  report() returns a ThrottleReport of how many
+        events each rule let through and held back (sampled+limited) since
+        the last report, or None if nothing was held back.
+    '''
+
+    def __init__(self, specs, seed=None):
+        rnd = random.Random(seed)
+        self.rules = [ parse_throttle_spec(spec, rnd=rnd) for spec in specs ]
+        self.lock  = threading.Lock()
+        self.start = time.time()
+        self.other = 0 # events no rule matched
+
+    def admit(self, ev, now=None):
+        tag = ev.get('tag')
+        if not isinstance(tag, basestring):
+            tag = u''
+        with self.lock:
+            for rule in self.rules:
+                if rule.match(tag):
+                    return rule.admit(ev, time.time() if now is None else now)
+            self.other += 1
+            return True
+
+    def report(self, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            counts = [ (rule, rule.reset()) for rule in self.rules ]
+            other, self.other = self.other, 0
+            start, self.start = self.start, now
+        suppressed = sum( s + l for rule,(p,s,l) in counts )
+        if not suppressed:
+            return None
+        return ThrottleReport(dict(
+            interval   = int(round(now - start)),
+            passed     = other + sum( p for rule,(p,s,l) in counts ),
+            suppressed = suppressed,
+            rules      = [ dict(pattern=rule.pattern, rule=rule.spec, passed=p, sampled=s, limited=l)
+                for rule,(p,s,l) in counts ],
+        ))
@@ -46,7 +46,7 @@ setup(name='saltdump',
 
     entry_points = {
         'console_scripts': [
-            'saltdump = saltdump.cmd:saltdump',
+            'saltdump = saltdump.cmd:main',
         ],
     },
 )
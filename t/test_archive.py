@@ -0,0 +1,98 @@
+import time
+import sqlite3
+
+from saltdump.event import classify_many, Publish, Return, Job
+from saltdump.output import Output
+from saltdump.archive import SQLiteSink, archive_record
+
+def test_archive(tmpdir, pinglog_json):
+    fname = str(tmpdir.join('events.db'))
+    sink = SQLiteSink(fname, batch_rows=3)
+    o = Output(sink, 'sqlite')
+    evs = list(classify_many(pinglog_json))
+    for cev in evs:
+        o.write( o.render(cev) )
+        sink.maybe_flush()
+    sink.close()
+
+    db = sqlite3.connect(fname)
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert db.execute('SELECT COUNT(*) FROM events').fetchone()[0] == len(evs)
+
+    rets = [ x for x in evs if isinstance(x, Return) ]
+    assert rets
+    assert db.execute('SELECT COUNT(*) FROM returns').fetchone()[0] == len(rets)
+    for r in rets:
+        row = db.execute('''SELECT r.fun, r.rc_ok, e.tag FROM returns r JOIN events e ON e.id = r.event_id
+            WHERE r.jid=? AND r.minion_id=?''', (r.jid, r.id)).fetchone()
+        assert row == (r.fun, int(r.rc_ok), r.tag)
+
+    jids = set( x.jid for x in evs if isinstance(x, Publish) )
+    assert set( x[0] for x in db.execute('SELECT jid FROM jobs') ) == jids
+
+    # reopening carries on numbering where the last one left off
+    sink = SQLiteSink(fname, flush_ms=None)
+    sink.write( archive_record(evs[0]) )
+    sink.close()
+    assert db.execute('SELECT MAX(id), COUNT(*) FROM events').fetchone() == (len(evs)+1, len(evs)+1)
+
+def test_archive_writers(tmpdir, pinglog_json):
+    fname = str(tmpdir.join('events.db'))
+    evs = list(classify_many(pinglog_json))
+    a, b = SQLiteSink(fname, flush_ms=None), SQLiteSink(fname, flush_ms=None)
+    for i,cev in enumerate(evs):
+        (a, b)[i % 2].write( archive_record(cev) )
+        (a, b)[i % 2].flush()
+    # not events: no rows
+    b.write( archive_record(Job('20170409085858677708')) )
+    a.close()
+    b.close()
+    db = sqlite3.connect(fname)
+    assert db.execute('SELECT MAX(id), COUNT(*) FROM events').fetchone() == (len(evs), len(evs))
+    assert [ x[0] for x in db.execute('SELECT tag FROM events ORDER BY id') ] == [ x.tag for x in evs ]
+
+def test_archive_bad_rows(tmpdir, pinglog_json):
+    fname = str(tmpdir.join('events.db'))
+    evs = list(classify_many(pinglog_json))
+    sink = SQLiteSink(fname, flush_ms=None)
+    recs = [ archive_record(cev) for cev in evs ]
+    recs[3] = dict(recs[3], event=recs[3]['event'][:-1]) # a column short
+    for rec in recs:
+        sink.write(rec)
+    sink.flush()
+    assert sink.pending == [] and sink.rejected == 1
+    sink.flush()
+    assert sink.rejected == 1
+    sink.close()
+    db = sqlite3.connect(fname)
+    assert db.execute('SELECT COUNT(*) FROM events').fetchone()[0] == len(evs) - 1
+
+def test_archive_flush_ms(tmpdir, pinglog_json):
+    fname = str(tmpdir.join('events.db'))
+    sink = SQLiteSink(fname, batch_rows=1000, flush_ms=50)
+    sink.done.set() # no background flushing; maybe_flush() alone
+    sink.write( archive_record(classify_many(pinglog_json)[0]) )
+    sink.maybe_flush()
+    assert len(sink.pending) == 1
+    time.sleep(0.1)
+    sink.maybe_flush()
+    assert sink.pending == []
+    sink.close()
+
+def test_archive_busy(tmpdir, pinglog_json):
+    fname = str(tmpdir.join('events.db'))
+    evs = list(classify_many(pinglog_json))
+    sink = SQLiteSink(fname, batch_rows=1, flush_ms=None, timeout=0.1, retry_secs=60)
+    other = sqlite3.connect(fname, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE') # another writer, taking its time
+    for cev in evs:
+        sink.write( archive_record(cev) )
+    sink.flush()
+    assert len(sink.pending) == len(evs) and sink.rejected == 0
+    other.execute('COMMIT')
+    sink.maybe_flush() # held back for retry_secs
+    assert len(sink.pending) == len(evs)
+    sink.flush()
+    assert sink.pending == [] and sink.rejected == 0
+    sink.close()
+    assert other.execute('SELECT COUNT(*) FROM events').fetchone()[0] == len(evs)
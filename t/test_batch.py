@@ -0,0 +1,23 @@
+
+from saltdump.master_minion import MasterMinion
+from saltdump.event import classify_event, classify_many
+
+def test_next_batch(pinglog_json):
+    mm = MasterMinion(replay_file='t/_ping.log', replay_only=True)
+    mm.replay_job_cache = mm.mmjn = False # just the replay file, please
+
+    batches = []
+    while True:
+        evs = mm.next_batch(max_events=5)
+        if evs == 'FIN':
+            break
+        if evs:
+            batches.append(evs)
+
+    assert max( len(x) for x in batches ) == 5
+    assert [ ev for evs in batches for ev in evs ] == pinglog_json
+
+def test_classify_many(pinglog_json):
+    many = classify_many(pinglog_json)
+    assert [ (x.__class__, x.tag) for x in many ] \
+        == [ (x.__class__, x.tag) for x in ( classify_event(ev) for ev in pinglog_json ) ]
@@ -0,0 +1,31 @@
+import json
+
+from click.testing import CliRunner
+
+from saltdump.bench import bench, run_benchmarks, compare
+
+def test_run_benchmarks():
+    res = run_benchmarks(['ping'], ['classify', 'stru', 'build_filter'], scale=0.01, repeat=1)
+    assert sorted(res) == ['-/build_filter', 'ping/classify', 'ping/stru']
+    assert res['ping/classify']['events'] == 52
+    assert res['ping/classify']['rate'] > 0
+    assert res['ping/classify']['objects_per_event'] > 0
+
+    slower = dict( (k, dict(v, rate=v['rate'] * 2)) for k,v in res.items() )
+    assert not any( bad for k,r,b,ratio,bad in compare(res, res) )
+    assert all( bad for k,r,b,ratio,bad in compare(res, slower) )
+
+def test_bench_cmd(tmpdir):
+    fname = str(tmpdir.join('base.json'))
+    args = ['-c', 'auth_storm', '-s', 'txt', '--scale', '0.01', '-r', '1']
+    res = CliRunner().invoke(bench, args + ['--save', fname])
+    assert res.exit_code == 0
+    assert res.output.startswith('auth_storm/txt ')
+    saved = json.load(open(fname))
+    assert saved['scale'] == 0.01 and 'auth_storm/txt' in saved['results']
+
+    saved['results']['auth_storm/txt']['rate'] *= 100
+    json.dump(saved, open(fname, 'w'))
+    res = CliRunner().invoke(bench, args + ['-b', fname])
+    assert res.exit_code == 1
+    assert 'REGRESSED' in res.output
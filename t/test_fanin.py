@@ -0,0 +1,91 @@
+import time
+
+from saltdump.event import classify_event, classify_many
+from saltdump.fanin import FanIn, open_source
+from saltdump.serve import FanoutServer
+
+class ListSource(object):
+    def __init__(self, events, delay=0):
+        self.events = list(events)
+        self.delay = delay
+
+    def next(self, no_block=False):
+        if not self.events:
+            return 'FIN'
+        time.sleep(self.delay)
+        return self.events.pop(0)
+
+def _ev(i):
+    return { 'tag': 'test/{0}'.format(i), 'data': { '_stamp': '2019-04-12T13:03:{0:02d}.000000'.format(i) } }
+
+def _drain(fi):
+    got = list()
+    while True:
+        ev = fi.next()
+        if ev == 'FIN':
+            return got
+        if ev is not None:
+            got.append(ev)
+
+def test_fanin_reorders():
+    # m2 runs a little behind m1, so its events arrive after later ones from m1
+    m1 = ListSource([ _ev(i) for i in range(0, 20, 2) ])
+    m2 = ListSource([ _ev(i) for i in range(1, 20, 2) ], delay=0.01)
+    got = _drain(FanIn([('m1', m1), ('m2', m2)], reorder_ms=500))
+    assert [ x['tag'] for x in got ] == [ 'test/{0}'.format(i) for i in range(20) ]
+    assert [ x['_master'] for x in got ] == [ 'm1', 'm2' ] * 10
+
+    cev = classify_event(got[1])
+    assert cev.master == 'm2'
+    assert cev.short.startswith('m2 test/1 ')
+    assert cev.structured['master'] == cev.structured['host'] == 'm2'
+
+EXIT = { 'tag': 'salt/event/exit', 'data': { '_stamp': '2019-04-12T13:04:00.000000' } }
+
+def _wait_for_client(server, deadline):
+    while not server.clients and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_fanin_feed(tmpdir, pinglog_json):
+    server = FanoutServer(str(tmpdir.join('sd.sock')))
+    try:
+        fi = FanIn([ ('syndic', open_source('unix:' + server.path)) ], reorder_ms=50)
+        deadline = time.time() + 5
+        _wait_for_client(server, deadline)
+        for cev in classify_many(pinglog_json + [EXIT]):
+            server.publish(cev)
+        got = list()
+        while len(got) < len(pinglog_json) and time.time() < deadline:
+            ev = fi.next()
+            if ev is not None:
+                got.append(ev)
+        assert fi.next() == 'FIN' # the feed's salt/event/exit
+    finally:
+        server.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json ]
+    assert set( x['_master'] for x in got ) == set(['syndic'])
+
+def test_fanin_feed_reconnects(tmpdir, pinglog_json):
+    path = str(tmpdir.join('sd.sock'))
+    half = len(pinglog_json) // 2
+    source = open_source('unix:' + path)
+    source.backoff = 0.05
+    fi = FanIn([ ('syndic', source) ], reorder_ms=50)
+    got = list()
+    deadline = time.time() + 10
+    for events in (pinglog_json[:half], pinglog_json[half:]):
+        server = FanoutServer(path) # the second one is a restart
+        try:
+            _wait_for_client(server, deadline)
+            for cev in classify_many(events):
+                server.publish(cev)
+            want = len(got) + len(events)
+            while len(got) < want and time.time() < deadline:
+                ev = fi.next()
+                if ev is not None:
+                    got.append(ev)
+        finally:
+            server.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json ]
+    fi.close()
+    assert _drain(fi) == []
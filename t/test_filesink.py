@@ -0,0 +1,70 @@
+
+import os
+import gzip
+import glob
+import time
+
+from saltdump.filesink import RotatingFileWriter
+
+def test_rotate_by_size(tmpdir):
+    fname = str(tmpdir.join('events.json'))
+    w = RotatingFileWriter(fname, max_bytes=100, keep=3)
+    lines = [ '{{"event": {0:04d}}}\n'.format(i) for i in range(50) ]
+    for line in lines:
+        w.write(line)
+        w.maybe_flush()
+    w.close()
+
+    segs = w.segments()
+    assert w.rotated > 3
+    assert len(segs) == 3
+    for seg in segs + [fname]:
+        assert os.path.getsize(seg) <= 100
+    got = ''.join( open(x).read() for x in segs + [fname] )
+    assert lines[-1] in got
+    assert ''.join(lines).endswith(got)
+
+def test_rotate_and_compress(tmpdir):
+    fname = str(tmpdir.join('events.json'))
+    w = RotatingFileWriter(fname, max_bytes=100, compress='gz')
+    lines = [ '{{"event": {0:04d}}}\n'.format(i) for i in range(50) ]
+    for line in lines:
+        w.write(line)
+        w.maybe_flush()
+    w.close()
+
+    segs = w.segments()
+    assert all( x.endswith('.gz') for x in segs )
+    assert not glob.glob(fname + '.*.tmp')
+    got = ''.join( gzip.open(x).read() for x in segs ) + open(fname).read()
+    assert got == ''.join(lines)
+
+def test_expire_only_segments(tmpdir):
+    fname = str(tmpdir.join('events.json'))
+    others = [ fname + x for x in ('.bak', '.old', '.20190412T130338.123456.orig', '.tmp') ]
+    for x in others:
+        open(x, 'w').write('keep me\n')
+    w = RotatingFileWriter(fname, max_bytes=100, keep=2)
+    w.pending.add(fname + '.20000101T000000.000000') # as if it were queued for compression
+    open(fname + '.20000101T000000.000000', 'w').write('queued\n')
+    for i in range(50):
+        w.write('{{"event": {0:04d}}}\n'.format(i))
+        w.maybe_flush()
+    w.close()
+
+    assert all( os.path.exists(x) for x in others )
+    assert os.path.exists(fname + '.20000101T000000.000000')
+    assert len(w.segments()) == 3
+
+def test_rotate_when_quiet(tmpdir):
+    fname = str(tmpdir.join('events.json'))
+    w = RotatingFileWriter(fname, max_secs=0.3)
+    w.write('{"event": 1}\n')
+    for i in range(30):
+        if w.rotated:
+            break
+        time.sleep(0.1)
+    w.close()
+    assert w.rotated == 1
+    assert open(w.segments()[0]).read() == '{"event": 1}\n'
+    assert open(fname).read() == ''
@@ -23,3 +23,28 @@ def test_filters():
     assert f4('thing/blah')
     assert f4('thingblah')
     assert not f4('blahthing')
+
+def test_subscription_index(pinglog_json):
+    from saltdump.filter import SubscriptionIndex
+
+    filters = [ 'salt/job/*', 'salt/job/*/ret/*', 'salt/job/*/new', 'salt/*', '*', 'salt/auth',
+        'salt/job/*/ret/host[12].*', 'salt/*/ret/host7.dom1', 'salt/job/2017*', 'sa?t/job/*',
+        '2017*', 'salt/job/*/ret/*.dom3 or salt/auth', 'salt/job/* and not salt/job/*/new',
+        'not salt/auth', 'minion/refresh/*', 'salt/job/*/ret', '*/host5.dom1', 'salt/job//ret' ]
+    tags = [ ev['tag'] for ev in pinglog_json ] + [ 'salt/auth', 'salt', 'salt/', 'salt/job//ret',
+        'minion/refresh/host1', 'salt/job/1/ret/a/b', '' ]
+
+    index = SubscriptionIndex()
+    built = dict( (i, build_filter(f)) for i,f in enumerate(filters) )
+    for i,f in built.items():
+        index.add(i, f)
+    index.add('all', None)
+    assert len(index) == len(filters) + 1
+
+    for tag in tags:
+        assert index.match(tag) == set( i for i,f in built.items() if f(tag) ) | set(['all']), tag
+
+    for i in range(0, len(filters), 2):
+        index.remove(i)
+    for tag in tags:
+        assert index.match(tag) == set( i for i,f in built.items() if i % 2 and f(tag) ) | set(['all']), tag
@@ -0,0 +1,74 @@
+
+import json
+import zlib
+import threading
+import BaseHTTPServer
+
+import pytest
+
+from saltdump.event import classify_event
+from saltdump.output import format_event
+from saltdump.hec import HECSink
+
+class Collector(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def do_POST(self):
+        body = self.rfile.read( int(self.headers['Content-Length']) )
+        srv = self.server
+        srv.requests.append( (self.path, dict(self.headers), body) )
+        status = srv.statuses.pop(0) if srv.statuses else 200
+        text = '{"text":"Success","code":0}'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, *a):
+        pass
+
+@pytest.fixture
+def collector():
+    srv = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Collector)
+    srv.requests = list()
+    srv.statuses = list()
+    t = threading.Thread(target=srv.serve_forever)
+    t.daemon = True
+    t.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def test_hec_sink(collector, pinglog_json):
+    collector.statuses = [503] # the first post has to be retried
+    url = 'http://127.0.0.1:{0}'.format(collector.server_port)
+    sink = HECSink(url, 'feedbeef', flush_bytes=2048, flush_ms=None, senders=1, backoff=0.01)
+
+    for ev in pinglog_json:
+        sink.write( format_event(classify_event(ev), 'hec', index='tmp') + '\n' )
+        sink.maybe_flush()
+    sink.close()
+
+    assert sink.delivered >= 2
+    assert sink.dropped == 0
+    assert len(collector.requests) == sink.delivered + 1
+
+    posted = list()
+    for path,headers,body in collector.requests[1:]:
+        assert path == '/services/collector/event'
+        assert headers['authorization'] == 'Splunk feedbeef'
+        assert headers['content-encoding'] == 'gzip'
+        posted.extend( json.loads(x) for x in zlib.decompress(body, 31).splitlines() )
+
+    assert [ x['event']['path'] for x in posted ] == [ x['tag'] for x in pinglog_json ]
+    assert all( x['index'] == 'tmp' and x['sourcetype'] == 'salt:event' for x in posted )
+
+def test_hec_sink_drops_bad_requests(collector):
+    collector.statuses = [400]
+    url = 'http://127.0.0.1:{0}/services/collector/event'.format(collector.server_port)
+    sink = HECSink(url, 'feedbeef', senders=1, compress=False, backoff=0.01)
+    sink.write('{"event": "nope"}\n')
+    sink.close()
+
+    assert len(collector.requests) == 1
+    assert sink.dropped == 1
@@ -0,0 +1,44 @@
+import random
+
+from saltdump.event import JidCollector, classify_many, Return
+from saltdump.histogram import LogHistogram
+
+def test_log_histogram():
+    h = LogHistogram()
+    rnd = random.Random(42)
+    vals = sorted( rnd.expovariate(1 / 0.5) for _ in range(10000) )
+    for v in vals:
+        h.record(v)
+    assert h.count == len(vals)
+    for p in (50, 90, 99):
+        exact = vals[ int(len(vals) * p / 100.0) - 1 ]
+        assert abs(h.percentile(p) - exact) <= exact / 32 + 1e-6
+    assert h.percentile(100) == h.max / 1e6 == round(vals[-1], 6)
+    for idx in h.buckets:
+        low, high = h.bounds(idx)
+        assert h.index(low) == h.index(high) == idx
+
+    s = h.summary(buckets=True)
+    assert sum( b[2] for b in s['buckets'] ) == s['count']
+    h2 = LogHistogram()
+    h2.record(100)
+    h.merge(h2)
+    assert h.count == len(vals) + 1 and h.max == 100 * 1000000
+
+def test_latency(pinglog_json):
+    jc = JidCollector(latency=True)
+    evs = list(classify_many(pinglog_json))
+    for cev in evs:
+        jc.examine_event(cev)
+
+    rets = [ x for x in evs if isinstance(x, Return) and jc.jids[x.jid].published ]
+    assert rets
+    rep = jc.latency.report()
+    lat = rep['publish_to_return']
+    assert lat['all']['count'] == len(rets)
+    assert set(lat['by_minion']) == set( x.id for x in rets )
+    assert set(lat['by_fun']) == set(['test.ping'])
+    assert 0 <= lat['all']['min'] <= lat['all']['p50'] <= lat['all']['max']
+    assert rep['return_spread']['count'] >= 1
+    slow = jc.latency.slowest(2)
+    assert len(slow) == 2 and slow[0][1] >= slow[1][1]
@@ -0,0 +1,54 @@
+import time
+import urllib2
+
+from saltdump.metrics import Metrics, MetricsExporter
+
+def test_metrics(tmpdir):
+    m = Metrics()
+    sleepy = m.timed('sleepy', time.sleep)
+    sleepy(0.01)
+    sleepy(0.02)
+    m.add('other', 0.5)
+    depth = [3]
+    m.gauge('saltdump_queue_depth', lambda: depth[0], queue='test')
+
+    s = m.stages['sleepy']
+    assert s[0] == 2
+    assert 0.03 <= s[1] < 0.5
+    assert 0.02 <= s[2] < s[1]
+
+    fname = str(tmpdir.join('saltdump.prom'))
+    ex = MetricsExporter(m, textfile=fname, listen='127.0.0.1:0', interval=60)
+    try:
+        text = urllib2.urlopen('http://127.0.0.1:{0}/metrics'.format(ex.port)).read()
+    finally:
+        ex.close()
+    lines = text.splitlines()
+    assert '# TYPE saltdump_stage_calls_total counter' in lines
+    assert 'saltdump_stage_calls_total{stage="sleepy"} 2' in lines
+    assert 'saltdump_stage_max_seconds{stage="other"} 0.5' in lines
+    assert 'saltdump_queue_depth{queue="test"} 3' in lines
+    assert open(fname).read().startswith('# HELP saltdump_stage_calls_total')
+
+def test_queue_gauges(tmpdir):
+    from saltdump.cmd import saltdump, CmdRunner
+    class Nothing(object):
+        def next(self, no_block=False):
+            return 'FIN'
+    class Runner(CmdRunner):
+        def open_source(self):
+            return Nothing()
+    args = [ '--metrics-file', str(tmpdir.join('saltdump.prom')), '--rotate-mb', '1', '--rotate-compress', 'gz',
+        '-o', 'txt:' + str(tmpdir.join('out')), '-o', 'jsonl:udp://127.0.0.1:9',
+        '--spool-dir', str(tmpdir.join('spool')), '-o', 'hec:https://127.0.0.1:9/services/collector' ]
+    opt = dict(saltdump.make_context('saltdump', args).params)
+    for k in ('version', 'level', 'no_sudo_root', 'json_encoder'):
+        opt.pop(k)
+    r = Runner(**opt)
+    try:
+        depths = sorted( (l['queue'], l.get('dest')) for n,l,f in r.metrics.gauges if n == 'saltdump_queue_depth' )
+    finally:
+        r.exporter.close()
+        for w in r.writers.values():
+            w.close()
+    assert depths == [ ('spool', 'https://127.0.0.1:9/services/collector'), ('spool', 'jsonl:udp://127.0.0.1:9') ]
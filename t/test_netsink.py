@@ -0,0 +1,182 @@
+
+import re
+import json
+import socket
+import threading
+
+import pytest
+
+from saltdump.event import classify_event
+from saltdump.output import format_event
+from saltdump.netsink import SocketSink
+
+class Listener(threading.Thread):
+    def __init__(self):
+        super(Listener, self).__init__()
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.url = 'tcp://127.0.0.1:{0}'.format(self.sock.getsockname()[1])
+        self.got = list()
+        self.hangups = threading.Semaphore(0)
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                self.got.append(data)
+            conn.close()
+            self.hangups.release()
+
+    @property
+    def data(self):
+        # wait for the sink to hang up, so we know we got everything
+        self.hangups.acquire()
+        return ''.join(self.got)
+
+@pytest.fixture
+def tcp_listener():
+    srv = Listener()
+    srv.start()
+    yield srv
+    srv.sock.close()
+
+def test_tcp_sink(tcp_listener, pinglog_json):
+    sink = SocketSink(tcp_listener.url, flush_bytes=1024, flush_ms=None)
+    for ev in pinglog_json:
+        sink.write( format_event(classify_event(ev), 'stru') + '\n' )
+        sink.maybe_flush()
+    sink.close()
+
+    assert sink.delivered > 1 and not sink.dropped
+    lines = tcp_listener.data.splitlines()
+    assert [ json.loads(x)['path'] for x in lines ] == [ x['tag'] for x in pinglog_json ]
+
+def test_tcp_syslog_octet_counting(tcp_listener, pinglog_json):
+    sink = SocketSink(tcp_listener.url, octet_counting=True, flush_ms=None)
+    for ev in pinglog_json:
+        sink.write( format_event(classify_event(ev), 'syslog', facility=1) + '\n' )
+    sink.close()
+
+    data = tcp_listener.data
+    msgs = list()
+    while data:
+        size, data = data.split(' ', 1)
+        msgs.append( data[:int(size)] )
+        data = data[int(size):]
+    assert len(msgs) == len(pinglog_json)
+    for msg in msgs:
+        assert re.match(r'<14>1 \d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d+Z \S+ saltdump \d+ \w+ - {', msg)
+
+def test_udp_sink(pinglog_json):
+    srv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    srv.bind(('127.0.0.1', 0))
+    srv.settimeout(5)
+    url = 'udp://127.0.0.1:{0}'.format(srv.getsockname()[1])
+
+    sink = SocketSink(url, max_datagram=1000, flush_ms=None)
+    for ev in pinglog_json:
+        sink.write( format_event(classify_event(ev), 'jsonl') + '\n' )
+    sink.close()
+
+    lines = list()
+    while len(lines) < len(pinglog_json):
+        dgram = srv.recv(65536)
+        assert len(dgram) <= 1000
+        lines.extend( dgram.splitlines() )
+    srv.close()
+    assert len(lines) == len(pinglog_json)
+
+def test_udp_sink_drops_per_datagram():
+    srv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    srv.bind(('127.0.0.1', 0))
+    srv.settimeout(5)
+    url = 'udp://127.0.0.1:{0}'.format(srv.getsockname()[1])
+
+    sink = SocketSink(url, one_per_datagram=True, max_datagram=100, flush_ms=None)
+    lines = [ 'line {0}'.format(i) for i in range(5) ]
+    lines.insert(2, 'x' * 200)
+    for x in lines:
+        sink.write(x + '\n')
+    sink.close()
+    assert sink.lost_datagrams == 1
+    assert sink.delivered == 1 and sink.dropped == 0
+
+    got = [ srv.recv(65536) for x in range(5) ]
+    srv.settimeout(0.2)
+    with pytest.raises(socket.timeout):
+        srv.recv(65536) # nothing sent twice
+    assert got == [ x for x in lines if len(x) < 100 ]
+
+    # too big for the kernel (EMSGSIZE) rather than for max_datagram
+    sink = SocketSink(url, one_per_datagram=True, max_datagram=200000, flush_ms=None)
+    sink.write( 'x' * 70000 + '\n' )
+    sink.write('ok\n')
+    sink.close()
+    assert sink.lost_datagrams == 1 and sink.delivered == 1
+    srv.close()
+
+def test_multi_line_records(tcp_listener, pinglog_json):
+    # -o json spans several lines per event; each event has to arrive whole
+    evs = [ format_event(classify_event(ev), 'json') for ev in pinglog_json ]
+    assert all( '\n' in x for x in evs )
+
+    sink = SocketSink(tcp_listener.url, octet_counting=True, flush_bytes=1024, flush_ms=None)
+    for x in evs:
+        sink.write(x + '\n')
+        sink.maybe_flush()
+    sink.close()
+    data = tcp_listener.data
+    msgs = list()
+    while data:
+        size, data = data.split(' ', 1)
+        msgs.append( data[:int(size)] )
+        data = data[int(size):]
+    assert msgs == evs
+
+    srv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    srv.bind(('127.0.0.1', 0))
+    srv.settimeout(5)
+    sink = SocketSink('udp://127.0.0.1:{0}'.format(srv.getsockname()[1]), max_datagram=4000, flush_ms=None)
+    for x in evs:
+        sink.write(x + '\n')
+    sink.close()
+    got = list()
+    dec = json.JSONDecoder()
+    while len(got) < len(evs):
+        dgram = srv.recv(65536).decode('utf-8').rstrip('\n')
+        pos = 0
+        while pos < len(dgram): # only whole events, each ending with a newline
+            obj, pos = dec.raw_decode(dgram, pos)
+            got.append(obj)
+            pos += 1
+    srv.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json ]
+
+def test_socket_writers_per_format(tmpdir):
+    from saltdump.cmd import saltdump, CmdRunner
+    class Runner(CmdRunner):
+        def open_source(self):
+            return None
+    args = [ '-o', 'json:udp://127.0.0.1:9', '-o', 'syslog:udp://127.0.0.1:9', '-o', 'json:udp://127.0.0.1:9:salt/auth',
+        '-o', 'txt:' + str(tmpdir.join('out')), '-o', 'jsonl:' + str(tmpdir.join('out')) ]
+    opt = dict(saltdump.make_context('saltdump', args).params)
+    for k in ('version', 'level', 'no_sudo_root', 'json_encoder'):
+        opt.pop(k)
+    r = Runner(**opt)
+    try:
+        assert sorted( k for k in r.writers if k.startswith(('json:', 'syslog:')) ) == [
+            'json:udp://127.0.0.1:9', 'syslog:udp://127.0.0.1:9' ]
+        assert len(r.writers) == 3
+        assert r.outputs[0].writer is r.outputs[2].writer
+        assert not r.outputs[0].writer.one_per_datagram and r.outputs[1].writer.one_per_datagram
+    finally:
+        for w in r.writers.values():
+            w.close()
@@ -0,0 +1,46 @@
+# coding: utf-8
+
+import time
+
+import pytest
+
+from saltdump.output import OutputWriter, parse_output_spec
+
+def test_writer_flush_bytes(tmpdir):
+    fname = str(tmpdir.join('out.txt'))
+    with open(fname, 'wb') as fh:
+        w = OutputWriter(fh, flush_bytes=10, bufsize=16)
+        w.write(u'12345\n')
+        w.maybe_flush()
+        assert open(fname).read() == ''
+        w.write(u'«678»\n')
+        w.maybe_flush()
+        assert open(fname).read() == '12345\n«678»\n'
+        w.write('x' * 40)
+        assert open(fname).read() == '12345\n«678»\n' + 'x' * 40
+        w.write('tail')
+        w.close()
+    assert open(fname).read().endswith('xtail')
+
+def test_writer_flush_ms(tmpdir):
+    fname = str(tmpdir.join('out.txt'))
+    with open(fname, 'wb') as fh:
+        w = OutputWriter(fh, flush_bytes=1024, flush_ms=50)
+        w.write('quiet bus\n')
+        w.maybe_flush()
+        assert open(fname).read() == ''
+        time.sleep(0.3)
+        assert open(fname).read() == 'quiet bus\n'
+        w.close()
+
+def test_parse_output_spec():
+    assert parse_output_spec('txt') == ('txt', None, None)
+    assert parse_output_spec('jsonl:-') == ('jsonl', None, None)
+    assert parse_output_spec('stru::salt/auth') == ('stru', None, 'salt/auth')
+    assert parse_output_spec('stru:/var/log/salt/events.json:salt/job/*') \
+        == ('stru', '/var/log/salt/events.json', 'salt/job/*')
+    assert parse_output_spec('syslog:tcp://loghost:514') == ('syslog', 'tcp://loghost:514', None)
+    assert parse_output_spec('hec:https://splunk:8088/services/collector/event:salt/* and not salt/auth') \
+        == ('hec', 'https://splunk:8088/services/collector/event', 'salt/* and not salt/auth')
+    with pytest.raises(ValueError):
+        parse_output_spec('nope:/tmp/file')
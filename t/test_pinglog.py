@@ -19,3 +19,14 @@ def test_classify(pinglog_json):
         assert isinstance( ev, Event )
         assert stru.get('path') == ev.tag
         assert sdat.get('jid')  == ev.jid
+
+def test_structured_copy_on_write(pinglog_json):
+    evj = dict(pinglog_json[-1])
+    evj['data'] = dict(evj['data'], _private=1, fun_args=[{'deep': [1, 2]}])
+    ev = classify_event(evj)
+    stru = ev.structured
+
+    assert '_private' not in stru['data']
+    assert '_private' in ev.raw['data']
+    assert 'sd_class' not in ev.raw
+    assert stru['data']['fun_args'] is ev.raw['data']['fun_args']
@@ -0,0 +1,36 @@
+
+from saltdump.util import classify_event
+from saltdump.output import format_event, Output
+from saltdump.filter import build_filter
+from saltdump.pool import RenderPool
+
+def test_pool_order(pinglog_json):
+    serial = [ format_event(classify_event(ev), 'stru') for ev in pinglog_json ]
+
+    rp = RenderPool(workers=3, outputs=[ Output(None, 'stru') ])
+    try:
+        pooled = rp.render(pinglog_json)
+    finally:
+        rp.close()
+
+    assert [ outs[0] for cev,outs in pooled ] == serial
+    assert all( cev is None for cev,outs in pooled )
+
+def test_pool_filter(pinglog_json):
+    outputs = [
+        Output(None, 'txt', build_filter('salt/job/*/ret/*')),
+        Output(None, 'jsonl', build_filter('not salt/job/*/ret/*')),
+    ]
+    rp = RenderPool(workers=2, outputs=outputs, keep_events=True)
+    try:
+        pooled = rp.render(pinglog_json)
+    finally:
+        rp.close()
+
+    assert len(pooled) == len(pinglog_json)
+    for (cev,(txt,jsonl)),ev in zip(pooled, pinglog_json):
+        assert cev.tag == ev['tag']
+        if '/ret/' in cev.tag:
+            assert txt == cev.short and jsonl is None
+        else:
+            assert txt is None and jsonl == cev.json(indent=0)
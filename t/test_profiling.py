@@ -0,0 +1,65 @@
+import time
+import pstats
+import signal
+from collections import Counter
+
+from saltdump.cmd import saltdump, CmdRunner
+from saltdump.profiling import Profiler, Sampler
+
+def _busy(secs):
+    end = time.time() + secs
+    while time.time() < end:
+        sum( x * x for x in range(1000) )
+
+def test_profiler(tmpdir):
+    fname = str(tmpdir.join('saltdump.prof'))
+    p = Profiler(fname, interval=0)
+    p.enable()
+    busy = p.wrap(_busy)
+    busy(0.05)
+    busy(0.05) # dumps the first call
+    assert any( f[2] == '_busy' for f in pstats.Stats(fname).stats )
+    p.close()
+    assert pstats.Stats(fname).stats
+
+def test_sampler(tmpdir):
+    s = Sampler(outdir=str(tmpdir), secs=10, interval=0.001)
+    s.toggle()
+    _busy(0.2)
+    s.toggle() # early
+    s.close()
+    assert not s.running
+    assert len(s.written) == 1
+    lines = open(s.written[0]).read().splitlines()
+    assert lines
+    stack, n = lines[0].rsplit(' ', 1)
+    assert int(n) > 0
+    assert any( '_busy (test_profiling.py' in x for x in lines )
+
+def test_sampler_names(tmpdir):
+    s = Sampler(outdir=str(tmpdir))
+    s.write(Counter(a=1))
+    s.write(Counter(b=1))
+    assert len(set(s.written)) == 2
+    assert len(tmpdir.listdir()) == 2
+
+class _Runner(CmdRunner):
+    def open_source(self):
+        return None
+
+def _runner(tmpdir, *args):
+    opt = dict(saltdump.make_context('saltdump', ['-o', 'txt:' + str(tmpdir.join('out'))] + list(args)).params)
+    for k in ('version', 'level', 'no_sudo_root', 'json_encoder'):
+        opt.pop(k)
+    return _Runner(**opt)
+
+def test_sigusr2_only_when_asked(tmpdir):
+    old = signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+    try:
+        assert _runner(tmpdir).sampler is None
+        assert signal.getsignal(signal.SIGUSR2) == signal.SIG_DFL
+        r = _runner(tmpdir, '--sample-dir', str(tmpdir))
+        assert r.sampler.outdir == str(tmpdir)
+        assert signal.getsignal(signal.SIGUSR2) != signal.SIG_DFL
+    finally:
+        signal.signal(signal.SIGUSR2, old)
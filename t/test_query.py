@@ -0,0 +1,90 @@
+from click.testing import CliRunner
+
+from saltdump.event import classify_many
+from saltdump.archive import SQLiteSink, archive_record
+from saltdump.query import ArchiveQuery, query
+
+JID = '20170409085858677708'
+
+def _archives(tmpdir, pinglog_json):
+    evs = list(classify_many(pinglog_json))
+    dbname = str(tmpdir.join('events.db'))
+    sink = SQLiteSink(dbname, flush_ms=None)
+    for cev in evs:
+        sink.write( archive_record(cev) )
+    sink.close()
+    jname = str(tmpdir.join('events.json'))
+    with open(jname, 'w') as fh:
+        for cev in evs:
+            fh.write( cev.json(indent=0) + '\n' )
+    return evs, dbname, jname
+
+def test_query(tmpdir, pinglog_json):
+    evs, dbname, jname = _archives(tmpdir, pinglog_json)
+    for kw,want in (
+        (dict(jid=JID), 9),
+        (dict(minion='host[12].*'), 2),
+        (dict(fun='test.*'), 8),
+        (dict(fun='test.ping', rc='ok'), 7),
+        (dict(rc='fail'), 0),
+        (dict(until='2017-04-09 12:58:59'), 6),
+        ):
+        indexed = ArchiveQuery(dbname, **kw)
+        scanned = ArchiveQuery(jname, **kw)
+        got = [ x.tag for x in indexed ]
+        assert got == [ x.tag for x in scanned ]
+        assert indexed.returned == scanned.returned == len(got) == want
+        assert indexed.scanned == want # only the matching rows came out of sqlite
+        assert scanned.scanned == len(evs)
+
+    assert any( 'returns_rc' in x for x in ArchiveQuery(dbname, fun='test.ping', rc='fail').explain() )
+
+def test_query_cmd(tmpdir, pinglog_json):
+    evs, dbname, jname = _archives(tmpdir, pinglog_json)
+    oname = str(tmpdir.join('out.json'))
+    res = CliRunner().invoke(query, [dbname, '--minion', 'host7.*', '-o', 'jsonl:' + oname])
+    assert res.exit_code == 0
+    assert res.output == 'scanned 1 events, returned 1\n'
+    assert open(oname).read() == evs[2].json(indent=0) + '\n'
+
+def test_query_top(tmpdir, pinglog_json):
+    evs, dbname, jname = _archives(tmpdir, pinglog_json)
+    res = CliRunner().invoke(query, [jname, '-q', '--top', 'tag', '--top', 'fun', '-n', '2'])
+    assert res.exit_code == 0
+    lines = res.output.splitlines()
+    assert lines[0] == 'tag:' and lines[3] == 'fun:'
+    assert lines[4].split() == ['8', 'err=0', 'test.ping']
+
+def test_query_formats(tmpdir, pinglog_json):
+    evs, dbname, jname = _archives(tmpdir, pinglog_json)
+    for fmt,write in (
+        ('json', lambda cev: cev.json() + '\n'),            # pretty, several lines each
+        ('glued', lambda cev: cev.json(indent=0)),          # no separators at all
+        ('stru', lambda cev: cev.jsonstru + '\n'),
+        ):
+        fname = str(tmpdir.join('events.' + fmt))
+        with open(fname, 'w') as fh:
+            for cev in evs:
+                fh.write( write(cev) )
+        q = ArchiveQuery(fname, fun='test.ping', rc='ok')
+        got = list(q)
+        assert q.scanned == len(evs)
+        assert [ x.tag for x in got ] == [ x.tag for x in evs if getattr(x, 'rc_ok', None) ]
+        assert len(got) == 7
+        assert [ x.itime for x in got ] == [ x.itime for x in evs if getattr(x, 'rc_ok', None) ]
+
+def test_query_bad_capture(tmpdir):
+    fname = str(tmpdir.join('bad.json'))
+    out = ['-o', 'txt:' + str(tmpdir.join('out.txt'))]
+    with open(fname, 'w') as fh:
+        fh.write('{"tag": "salt/auth", "data": {}}\n{"tag": "salt/au')
+    res = CliRunner().invoke(query, [fname] + out)
+    assert res.exit_code == 1
+    assert 'unable to read record 2 of' in res.output
+    assert 'Traceback' not in res.output
+
+    with open(fname, 'w') as fh:
+        fh.write('{"nope": 1}\n')
+    res = CliRunner().invoke(query, [fname] + out)
+    assert res.exit_code == 1
+    assert 'record 1 of {0} is not a salt event'.format(fname) in res.output
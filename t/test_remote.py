@@ -0,0 +1,90 @@
+import time
+
+from saltdump.remote import Agent, Aggregator
+
+def _collect(agg, n, timeout=10):
+    got = list()
+    deadline = time.time() + timeout
+    while len(got) < n and time.time() < deadline:
+        ev = agg.next()
+        if ev is not None:
+            got.append(ev)
+    return got
+
+def test_agent_to_aggregator(pinglog_json):
+    agg = Aggregator('tcp://127.0.0.1:0')
+    try:
+        fwd = Agent('tcp://127.0.0.1:{0}'.format(agg.port), name='master1', window=2)
+        for i in range(0, len(pinglog_json), 2):
+            fwd.push(pinglog_json[i:i+2])
+        got = _collect(agg, len(pinglog_json))
+        fwd.close()
+    finally:
+        agg.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json ]
+    assert [ x['data'] for x in got ] == [ x['data'] for x in pinglog_json ]
+    assert set( x['_master'] for x in got ) == set(['master1'])
+    assert fwd.acked == fwd.seq and not fwd.pending
+
+def test_resume(pinglog_json):
+    agg = Aggregator('tcp://127.0.0.1:0')
+    try:
+        fwd = Agent('tcp://127.0.0.1:{0}'.format(agg.port), name='master1')
+        fwd.backoff = 0.05
+        half = len(pinglog_json) // 2
+        fwd.push(pinglog_json[:half])
+        got = _collect(agg, half)
+        agg.disconnect_all()
+        fwd.push(pinglog_json[half:])
+        got += _collect(agg, len(pinglog_json) - half)
+        fwd.close()
+        assert agg.next(no_block=True) is None # nothing was delivered twice
+    finally:
+        agg.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json ]
+
+def test_aggregator_skips_resent_batches(pinglog_json):
+    import socket
+    import msgpack
+    from saltdump.remote import send_frame, recv_frame, pack_batch, HELLO, RESUME, BATCH, ACK
+
+    agg = Aggregator('tcp://127.0.0.1:0')
+    hello = msgpack.packb(dict(name='m', session='m.1'), use_bin_type=True)
+    try:
+        for resume, batches in ( (0, [1]), (1, [1, 2]) ):
+            sock = socket.create_connection(('127.0.0.1', agg.port))
+            send_frame(sock, HELLO, 0, hello)
+            assert recv_frame(sock)[:2] == (RESUME, resume)
+            for seq in batches:
+                send_frame(sock, BATCH, seq, pack_batch(pinglog_json[seq-1:seq]))
+                assert recv_frame(sock)[:2] == (ACK, seq)
+            sock.close()
+        got = _collect(agg, 2)
+        assert agg.next(no_block=True) is None
+    finally:
+        agg.close()
+    assert [ x['tag'] for x in got ] == [ x['tag'] for x in pinglog_json[:2] ]
+
+def test_aggregator_forgets_idle_sessions(pinglog_json):
+    agg = Aggregator('tcp://:0', session_ttl=60)
+    try:
+        assert agg.addr[0] == '127.0.0.1'
+        fwd = Agent('tcp://127.0.0.1:{0}'.format(agg.port), name='master1')
+        fwd.push(pinglog_json[:2])
+        _collect(agg, 2)
+        deadline = time.time() + 5
+        while fwd.acked < 1 and time.time() < deadline: # acked once it's in last
+            time.sleep(0.01)
+        assert agg.last == { fwd.session: 1 }
+        agg.expire(time.time() + 3600)
+        assert agg.last == { fwd.session: 1 } # still connected
+        fwd.close()
+        deadline = time.time() + 5
+        while agg.seen.get(fwd.session) is None and time.time() < deadline:
+            time.sleep(0.01)
+        agg.expire(time.time() + 30)
+        assert agg.last == { fwd.session: 1 }
+        agg.expire(time.time() + 3600)
+        assert agg.last == {} and agg.seen == {}
+    finally:
+        agg.close()
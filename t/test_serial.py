@@ -0,0 +1,45 @@
+
+import json
+
+import pytest
+
+from saltdump import serial
+from saltdump.event import classify_event
+from saltdump.util import read_event_file
+
+@pytest.mark.parametrize('name', serial.SERIALIZER_NAMES)
+def test_serializers(name, pinglog_json):
+    try:
+        s = serial.set_serializer(name)
+    except ImportError:
+        pytest.skip('{0} is not installed'.format(name))
+    try:
+        for ev in pinglog_json:
+            assert json.loads( s.dumps(ev) ) == ev
+            assert json.loads( s.dumps(ev, indent=2) ) == ev
+            assert '\\/' not in s.dumps(ev)
+    finally:
+        serial.set_serializer()
+
+def test_cached_encodings(pinglog_json):
+    ev = classify_event(pinglog_json[-1])
+    assert ev.jsonstru is ev.jsonstru
+    assert ev.json(indent=0) is ev.json(indent=0)
+    assert json.loads(ev.jsonstru) == ev.structured
+
+def test_replayed_json():
+    # the way events really arrive: dicts, with whatever the source added
+    for ev in read_event_file('t/_ping.log'):
+        assert ev['_from_replay'] == 't/_ping.log'
+        assert json.loads( classify_event(ev).json(indent=0) ) == ev
+
+def test_structured_no_deepcopy(monkeypatch, pinglog_json):
+    import copy
+    classify_event(pinglog_json[0]).structured # looks up the host id
+    def deepcopy(*a, **kw):
+        raise AssertionError('structured deep copied something')
+    monkeypatch.setattr(copy, 'deepcopy', deepcopy)
+    for ev in pinglog_json:
+        cev = classify_event(ev)
+        cev.structured
+        cev.syslog()
@@ -0,0 +1,48 @@
+import time
+import socket
+
+import pytest
+
+from saltdump.event import classify_many
+from saltdump.serve import FanoutServer, ServeError, subscribe
+
+def _wait_for(server, n):
+    deadline = time.time() + 5
+    while len(server.clients) < n and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(server.clients) == n
+
+def test_serve(tmpdir, pinglog_json):
+    evs = list(classify_many(pinglog_json))
+    server = FanoutServer(str(tmpdir.join('sd.sock')))
+    try:
+        everything = subscribe(server.path, 'jsonl')
+        host1 = subscribe(server.path, 'txt', 'salt/job/*/ret/host1.*')
+        with pytest.raises(ServeError):
+            next(subscribe(server.path, 'nope'))
+        _wait_for(server, 2)
+        for cev in evs:
+            server.publish(cev)
+        assert [ next(everything) for cev in evs ] == [ cev.json(indent=0) for cev in evs ]
+        assert next(host1) == evs[5].short
+    finally:
+        server.close()
+    assert list(everything) == []
+    assert list(host1) == []
+
+def test_slow_client(tmpdir, pinglog_json):
+    evs = list(classify_many(pinglog_json))
+    server = FanoutServer(str(tmpdir.join('sd.sock')), queue_size=10)
+    server.close_timeout = 0.1
+    try:
+        slow = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        slow.connect(server.path)
+        slow.sendall('json\n') # and then never read anything
+        _wait_for(server, 1)
+        start = time.time()
+        for i in range(2000):
+            server.publish(evs[i % len(evs)])
+        assert time.time() - start < 5
+        assert server.clients[0].dropped > 0
+    finally:
+        server.close()
@@ -0,0 +1,37 @@
+import logging
+
+from saltdump.cmd import saltdump
+from saltdump.soak import Soak, slope, rss_bytes
+from saltdump.synth import Fleet
+
+def _soak(count=4000):
+    logging.root.handlers = [] # as saltdump does, else salt's startup handler keeps the first 10000 records
+    opt = dict(saltdump.make_context('saltdump', ['-j', '-o', 'txt:/dev/null']).params)
+    for k in ('version', 'level', 'no_sudo_root', 'json_encoder'):
+        opt.pop(k)
+    s = Soak(opt, count=count, sample_every=count // 10, warmup=0.5, fleet=Fleet(10, concurrency=2, states=5),
+        max_rss_mb=None, max_objects=200000)
+    s.runner.jc.set_max_jobs(5)
+    return s
+
+def test_slope():
+    assert slope([ (x, 3 * x + 1) for x in range(10) ]) == 3.0
+    assert slope([ (x, 7) for x in range(10) ]) == 0.0
+    assert slope([ (1, 1) ]) == 0.0
+    assert rss_bytes() > 0
+
+def test_soak_flat():
+    s = _soak()
+    assert s.run() == []
+    assert len(s.samples) == 11
+    assert s.samples[-1][0] == 4000
+
+def test_soak_leak():
+    s = _soak()
+    kept = list()
+    s.runner.jc.on_change(lambda jitem, actions: kept.append(list(actions)))
+    complaints = s.run()
+    assert len(complaints) == 1
+    assert complaints[0].startswith('gc objects grew')
+    assert 'list+' in complaints[0]
+    assert s.growth()[1] > s.max_objects
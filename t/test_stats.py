@@ -0,0 +1,62 @@
+import json
+import random
+from collections import Counter
+
+from saltdump.event import classify_many
+from saltdump.output import Output, format_event
+from saltdump.stats import Stats, SpaceSaving, normalize_tag
+
+def test_normalize_tag():
+    assert normalize_tag('salt/job/20190412130338123456/ret/m1') == 'salt/job/*/ret/m1'
+    assert normalize_tag('20190412130338123456') == '*'
+    assert normalize_tag('salt/auth') == 'salt/auth'
+
+def test_stats(pinglog_json):
+    st = Stats(interval=10, window=30, top=3)
+    evs = list(classify_many(pinglog_json))
+    o = Output(None, 'jsonl')
+    start = st.current.start
+    for cev in evs:
+        st.observe(cev, [ o.render(cev) ])
+
+    rep = st.report(now=start + 10)
+    d = rep.raw['data']
+    assert rep.tag == 'saltdump/stats'
+    assert d['events'] == len(evs)
+    assert d['rate'] == round(len(evs) / 10.0, 2)
+    assert d['bytes'] == sum( len(cev.json(indent=0)) for cev in evs )
+    assert sum(d['classes'].values()) == len(evs)
+    assert len(d['top_tags']) == 3
+    assert all( '2019' not in t for t,n in d['top_tags'] )
+    assert d['top_minions']
+
+    # an empty interval still has the window's numbers
+    rep = st.report(now=start + 20)
+    d = rep.raw['data']
+    assert d['events'] == 0
+    assert d['window'] == 20
+    assert d['window_rate'] == round(len(evs) / 20.0, 2)
+    assert d['top_tags']
+
+    assert format_event(rep, 'txt').startswith('saltdump/stats 10s ev=0 ')
+    assert json.loads(format_event(rep, 'stru'))['path'] == 'saltdump/stats'
+
+def test_space_saving():
+    rnd = random.Random(7)
+    exact = Counter()
+    ss = SpaceSaving(50)
+    halves = SpaceSaving(50), SpaceSaving(50)
+    for i in range(20000):
+        # a few heavy keys in a long tail of rare ones
+        k = 'heavy{0}'.format(i % 5) if rnd.random() < 0.5 else 'm{0}'.format(rnd.randint(0, 5000))
+        exact[k] += 1
+        ss.add(k)
+        halves[i % 2].add(k)
+    assert len(ss) == 50 and len(ss.heap) == 50
+    assert ss.total == 20000
+
+    for sk in (ss, halves[0].merge(halves[1])):
+        top = sk.top(5)
+        assert set( k for k,c,e in top ) == set( 'heavy{0}'.format(i) for i in range(5) )
+        for k,c,e in top:
+            assert c - e <= exact[k] <= c
@@ -0,0 +1,77 @@
+import time
+import datetime
+
+import pytest
+
+from saltdump.event import classify_event, classify_many, JidCollector
+from saltdump.event import Auth, ExpectedReturns, Publish, Return, StateReturn
+from saltdump.master_minion import MasterMinion
+from saltdump.synth import corpus, minion_ids, Fleet, RateProfile, FakeMasterBus
+
+def test_corpora():
+    ping = list(classify_many(corpus('ping', scale=0.01)))
+    assert len(ping) == 52
+    assert [ type(x) for x in ping[:2] ] == [ExpectedReturns, Publish]
+    assert all( type(x) is Return and x.rc_ok for x in ping[2:] )
+    assert set( x.id for x in ping[2:] ) == set(minion_ids(50)) == set(ping[1].minions)
+    assert [ x.itime for x in ping ] == sorted( x.itime for x in ping )
+
+    auth = list(classify_many(corpus('auth_storm', scale=0.01)))
+    assert len(auth) == 50 and all( type(x) is Auth for x in auth )
+    assert 'PUBLIC KEY' not in auth[0].jsonstru
+
+    hs = list(classify_many(corpus('highstate', scale=0.01)))
+    assert len(hs) == 3
+    assert type(hs[2]) is StateReturn
+    assert hs[2].result_counts[1] == 100
+
+def test_fleet():
+    fleet = Fleet(minions=30, concurrency=4, slow=0.1, noise=0.05, states=5, seed=1)
+    jc = JidCollector(max_jobs=1000)
+    when = datetime.datetime(2019, 4, 12, 13, 3, 38)
+    cevs = list()
+    for i in range(3000):
+        cevs.append( classify_event(fleet.next_event(when)) )
+        jc.examine_event(cevs[-1])
+        when += datetime.timedelta(milliseconds=1)
+
+    kinds = set( type(x).__name__ for x in cevs )
+    assert set(['Auth', 'DataCacheRefresh', 'ExpectedReturns', 'Publish', 'Return', 'StateReturn',
+        'FindJobPub', 'FindJobRet']) <= kinds
+
+    # every finished job's find_job chain got tied back to it
+    jobs = [ j for j in jc.jids.values() if j.find_jobs and not j.waiting ]
+    assert jobs
+    for j in jobs:
+        assert all( x.fjid == j.jid for evs in j.find_jobs.values() for x in evs if hasattr(x, 'fjid') )
+
+def test_rate_profile():
+    p = RateProfile('steady:100:2,ramp:100:300:2,burst:10:1000:1:0.5:2')
+    assert p.duration == 6
+    assert p.rate(1) == 100
+    assert p.rate(3) == 200
+    assert p.rate(4.2) == 1000 and p.rate(4.7) == 10
+    n = len(list(p.schedule()))
+    assert abs(n - (200 + 400 + 1010)) < 10
+    with pytest.raises(ValueError):
+        RateProfile('steady:100')
+
+def test_fake_bus(tmpdir):
+    fleet = Fleet(minions=5, seed=2)
+    evs = [ fleet.next_event(datetime.datetime.now()) for i in range(20) ]
+    bus = FakeMasterBus(str(tmpdir))
+    try:
+        mm = MasterMinion(sock_dir=str(tmpdir))
+        assert bus.wait_for_subscribers(timeout=10)
+        for ev in evs:
+            bus.publish(ev)
+        got = list()
+        deadline = time.time() + 10
+        while len(got) < len(evs) and time.time() < deadline:
+            ev = mm.next()
+            if ev is not None:
+                got.append(ev)
+    finally:
+        bus.close()
+    assert len(got) == len(evs), 'timed out with {0} of {1} events'.format(len(got), len(evs))
+    assert got == evs
@@ -0,0 +1,64 @@
+import json
+import datetime
+
+import pytest
+
+from saltdump.output import format_event
+from saltdump.synth import auth_event, refresh_event, minion_ids
+from saltdump.throttle import Throttle, TokenBucket, parse_throttle_spec
+
+def test_parse_throttle_spec():
+    r = parse_throttle_spec('salt/auth=10%@minion,120/m:5')
+    assert r.pattern == 'salt/auth'
+    assert r.sample == 0.1 and r.by_minion
+    assert r.bucket.rate == 2.0 and r.bucket.burst == 5
+    r = parse_throttle_spec('minion/refresh/*=25%')
+    assert r.match('minion/refresh/m1') and not r.match('salt/auth')
+    assert r.sample == 0.25 and not r.by_minion and r.bucket is None
+    for bad in ('salt/auth', '=5/s', 'salt/auth=', 'salt/auth=5/d', 'salt/auth=0%', 'salt/auth=5/s,6/s'):
+        with pytest.raises(ValueError):
+            parse_throttle_spec(bad)
+
+def test_token_bucket():
+    b = TokenBucket(10, 20)
+    assert sum( b.take(100.0) for i in range(50) ) == 20
+    assert not b.take(100.05)
+    assert b.take(100.15)
+    assert sum( b.take(110.0) for i in range(50) ) == 20
+
+def test_throttle():
+    when = datetime.datetime(2019, 4, 12, 13, 3, 38)
+    mids = minion_ids(1000)
+    th = Throttle(['salt/auth=5/s:10', 'minion/refresh/*=20%@minion', 'salt/*=50%'], seed=1)
+    start = th.start
+
+    auths = [ th.admit(auth_event(when, mid), now=start) for mid in mids ]
+    assert sum(auths) == 10
+
+    refresh = [ mid for mid in mids if th.admit(refresh_event(when, mid)) ]
+    assert 150 < len(refresh) < 250
+    # the same minions, every time
+    assert refresh == [ mid for mid in mids if th.admit(refresh_event(when, mid)) ]
+
+    others = sum( th.admit(dict(tag='salt/key', data=dict(id=mid))) for mid in mids )
+    assert 400 < others < 600
+    assert th.admit(dict(tag='minion/start', data=dict()))
+    assert th.admit(dict(tag='not/throttled', data=dict()))
+
+    rep = th.report(now=start + 10)
+    d = rep.raw['data']
+    assert rep.tag == 'saltdump/throttle'
+    assert d['interval'] == 10
+    assert d['passed'] == 10 + 2 * len(refresh) + others + 2
+    assert d['suppressed'] == 4002 - d['passed']
+    assert [ (r['pattern'], r['limited']) for r in d['rules'] ] == [
+        ('salt/auth', 990), ('minion/refresh/*', 0), ('salt/*', 0) ]
+
+    txt = format_event(rep, 'txt')
+    assert txt.startswith('saltdump/throttle 10s passed={0} suppressed='.format(d['passed']))
+    assert ' salt/auth=0+990,minion/refresh/*=' in txt
+    assert json.loads(format_event(rep, 'stru'))['path'] == 'saltdump/throttle'
+
+    # nothing held back, nothing to say
+    assert th.admit(auth_event(when, mids[0]), now=start + 20)
+    assert th.report(now=start + 20) is None